@@ -0,0 +1,9 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+ROOT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)"
+COMPOSE_DIR="$ROOT_DIR/infra/compose"
+
+# The rollup tests need a scratch PostgreSQL database: TEST_DATABASE_URL=... scripts/test_worker.sh
+docker compose -f "$COMPOSE_DIR/docker-compose.yml" --env-file "$COMPOSE_DIR/.env" exec -T \
+  -e TEST_DATABASE_URL="${TEST_DATABASE_URL:-}" worker pytest -q
@@ -0,0 +1,32 @@
+"""unique streak per user and habit for set-based streak upserts
+
+Revision ID: 20261016_0002
+Revises: 20260227_0001
+Create Date: 2026-10-16
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "20261016_0002"
+down_revision = "20260227_0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Keep the most recent row when concurrent check-ins created duplicates.
+    op.execute(
+        """
+        DELETE FROM streaks s
+        USING streaks newer
+        WHERE s.user_id = newer.user_id
+          AND s.habit_id = newer.habit_id
+          AND s.id < newer.id
+        """
+    )
+    op.create_index("idx_streaks_user_habit", "streaks", ["user_id", "habit_id"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("idx_streaks_user_habit", table_name="streaks")
@@ -0,0 +1,70 @@
+"""compact completed-day runs on streaks for the incremental streak engine
+
+Revision ID: 20261016_0003
+Revises: 20261016_0002
+Create Date: 2026-10-16
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "20261016_0003"
+down_revision = "20261016_0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("streaks", sa.Column("completed_runs", postgresql.JSONB(), nullable=True))
+
+    # One-off rebuild from history (gaps and islands); afterwards the engine keeps
+    # runs current incrementally. Day ordinals match Python's date.toordinal().
+    op.execute(
+        """
+        WITH days AS (
+            SELECT DISTINCT user_id, habit_id, check_in_date - DATE '0001-01-01' + 1 AS day
+            FROM check_ins
+        ),
+        islands AS (
+            SELECT user_id, habit_id, day,
+                   day - ROW_NUMBER() OVER (PARTITION BY user_id, habit_id ORDER BY day) AS island
+            FROM days
+        ),
+        runs AS (
+            SELECT user_id, habit_id, MIN(day) AS first_day, MAX(day) AS last_day
+            FROM islands
+            GROUP BY user_id, habit_id, island
+        ),
+        rebuilt AS (
+            SELECT runs.user_id, runs.habit_id, habits.program_id,
+                   jsonb_agg(jsonb_build_array(first_day, last_day) ORDER BY first_day)
+                       AS completed_runs,
+                   MAX(last_day - first_day + 1) AS longest_streak,
+                   (ARRAY_AGG(last_day - first_day + 1 ORDER BY first_day DESC))[1]
+                       AS current_streak,
+                   DATE '0001-01-01' + MAX(last_day) - 1 AS last_check_in_date
+            FROM runs
+            JOIN habits ON habits.id = runs.habit_id
+            GROUP BY runs.user_id, runs.habit_id, habits.program_id
+        )
+        INSERT INTO streaks (
+            user_id, habit_id, program_id, current_streak, longest_streak, last_check_in_date,
+            completed_runs, created_at, updated_at
+        )
+        SELECT user_id, habit_id, program_id, current_streak, longest_streak,
+               last_check_in_date, completed_runs, NOW(), NOW()
+        FROM rebuilt
+        ON CONFLICT (user_id, habit_id) DO UPDATE SET
+            current_streak = EXCLUDED.current_streak,
+            longest_streak = EXCLUDED.longest_streak,
+            last_check_in_date = EXCLUDED.last_check_in_date,
+            completed_runs = EXCLUDED.completed_runs,
+            updated_at = EXCLUDED.updated_at
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("streaks", "completed_runs")
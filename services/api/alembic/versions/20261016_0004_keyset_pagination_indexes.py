@@ -0,0 +1,36 @@
+"""composite indexes backing keyset pagination of list endpoints
+
+Revision ID: 20261016_0004
+Revises: 20261016_0003
+Create Date: 2026-10-16
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "20261016_0004"
+down_revision = "20261016_0003"
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ("idx_checkins_date_id", "check_ins", ["check_in_date", "id"]),
+    ("idx_checkins_user_date_id", "check_ins", ["user_id", "check_in_date", "id"]),
+    ("idx_checkins_habit_date_id", "check_ins", ["habit_id", "check_in_date", "id"]),
+    ("idx_points_ledger_user_created_id", "points_ledger", ["user_id", "created_at", "id"]),
+    ("idx_enrollments_created_id", "enrollments", ["created_at", "id"]),
+    ("idx_enrollments_user_created_id", "enrollments", ["user_id", "created_at", "id"]),
+    ("idx_habits_created_id", "habits", ["created_at", "id"]),
+    ("idx_habits_program_created_id", "habits", ["program_id", "created_at", "id"]),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,44 @@
+"""reward grants backing idempotent bonus rules
+
+Revision ID: 20261016_0005
+Revises: 20261016_0004
+Create Date: 2026-10-16
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20261016_0005"
+down_revision = "20261016_0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "reward_grants",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("rule_key", sa.String(length=100), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("scope_id", sa.Integer(), nullable=False),
+        sa.Column("period", sa.Integer(), nullable=False),
+        sa.Column("program_id", sa.Integer(), nullable=True),
+        sa.Column("points", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["program_id"], ["programs.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_reward_grants_id", "reward_grants", ["id"])
+    op.create_index(
+        "idx_reward_grants_rule_user_scope_period",
+        "reward_grants",
+        ["rule_key", "user_id", "scope_id", "period"],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("idx_reward_grants_rule_user_scope_period", table_name="reward_grants")
+    op.drop_index("ix_reward_grants_id", table_name="reward_grants")
+    op.drop_table("reward_grants")
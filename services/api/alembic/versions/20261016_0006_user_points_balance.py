@@ -0,0 +1,39 @@
+"""materialized points balances per user and program
+
+Revision ID: 20261016_0006
+Revises: 20261016_0005
+Create Date: 2026-10-16
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20261016_0006"
+down_revision = "20261016_0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "user_points_balance",
+        sa.Column("user_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("program_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("total_points", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("transaction_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("user_id", "program_id"),
+    )
+    op.execute(
+        """
+        INSERT INTO user_points_balance (user_id, program_id, total_points, transaction_count, updated_at)
+        SELECT user_id, COALESCE(program_id, 0), SUM(points), COUNT(*), CURRENT_TIMESTAMP
+        FROM points_ledger
+        GROUP BY user_id, COALESCE(program_id, 0)
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("user_points_balance")
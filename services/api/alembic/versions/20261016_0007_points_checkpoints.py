@@ -0,0 +1,32 @@
+"""monthly points checkpoints for as-of balance queries
+
+Revision ID: 20261016_0007
+Revises: 20261016_0006
+Create Date: 2026-10-16
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20261016_0007"
+down_revision = "20261016_0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "points_checkpoints",
+        sa.Column("user_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("program_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("checkpoint_at", sa.DateTime(), nullable=False),
+        sa.Column("total_points", sa.Integer(), nullable=False),
+        sa.Column("transaction_count", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("user_id", "program_id", "checkpoint_at"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("points_checkpoints")
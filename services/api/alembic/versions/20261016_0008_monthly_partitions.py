@@ -0,0 +1,119 @@
+"""partition points_ledger and check_ins by month
+
+Rewrites both tables as range-partitioned parents (points_ledger on created_at,
+check_ins on check_in_date) with one partition per month that has rows, the
+next FUTURE_MONTHS months and a default partition. The primary keys become
+(id, <partition column>) because Postgres requires unique constraints to
+include the partition key; ids still come from the original sequences. Later
+partitions are created by the worker (`maintain_partitions`).
+
+The rows are copied under an exclusive lock, so run this in a maintenance window.
+
+Revision ID: 20261016_0008
+Revises: 20261016_0007
+Create Date: 2026-10-16
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20261016_0008"
+down_revision = "20261016_0007"
+branch_labels = None
+depends_on = None
+
+FUTURE_MONTHS = 3
+PARTITIONED_TABLES = {"points_ledger": "created_at", "check_ins": "check_in_date"}
+
+
+def _next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _table_ddl(table: str):
+    """Secondary index definitions, foreign keys and id sequence of `table`."""
+    bind = op.get_bind()
+    indexes = bind.execute(
+        sa.text(
+            "SELECT indexdef FROM pg_indexes "
+            "WHERE schemaname = current_schema() AND tablename = :table AND indexname <> :pkey"
+        ),
+        {"table": table, "pkey": f"{table}_pkey"},
+    ).scalars().all()
+    foreign_keys = bind.execute(
+        sa.text(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = CAST(:table AS regclass) AND contype = 'f'"
+        ),
+        {"table": table},
+    ).all()
+    sequence = bind.execute(
+        sa.text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": table}
+    ).scalar()
+    return indexes, foreign_keys, sequence
+
+
+def _rebuild(table: str, primary_key: str, partition_by: str = None):
+    """Replace `table` with an empty copy of its columns, keeping the old one aside.
+
+    Returns the old table's name and the index definitions `_finish` recreates.
+    """
+    indexes, foreign_keys, sequence = _table_ddl(table)
+    old = f"{table}_old"
+    op.execute(f"ALTER TABLE {table} RENAME TO {old}")
+    op.execute(f"ALTER INDEX {table}_pkey RENAME TO {old}_pkey")
+    op.execute(
+        f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS)"
+        + (f" PARTITION BY RANGE ({partition_by})" if partition_by else "")
+    )
+    op.execute(f"ALTER TABLE {table} ADD PRIMARY KEY ({primary_key})")
+    for name, definition in foreign_keys:
+        op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+    op.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id")
+    return old, indexes
+
+
+def _finish(table: str, old: str, indexes) -> None:
+    op.execute(f"INSERT INTO {table} SELECT * FROM {old}")
+    op.execute(f"DROP TABLE {old}")
+    # Indexes of a partitioned parent are defined ON ONLY the parent
+    for definition in indexes:
+        op.execute(definition.replace(" ON ONLY ", " ON "))
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    # Partition keys cannot be NULL; created_at was only ever filled in by the app
+    op.execute("UPDATE points_ledger SET created_at = now() WHERE created_at IS NULL")
+    op.alter_column("points_ledger", "created_at", nullable=False)
+
+    this_month = date.today().replace(day=1)
+    for table, column in PARTITIONED_TABLES.items():
+        first = bind.execute(sa.text(f"SELECT min({column}) FROM {table}")).scalar()
+        month = date(first.year, first.month, 1) if first else this_month
+        old, indexes = _rebuild(table, f"id, {column}", partition_by=column)
+
+        last = this_month
+        for _ in range(FUTURE_MONTHS):
+            last = _next_month(last)
+        while month <= last:
+            following = _next_month(month)
+            op.execute(
+                f"CREATE TABLE {table}_y{month:%Y}m{month:%m} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{following.isoformat()}')"
+            )
+            month = following
+        op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+        _finish(table, old, indexes)
+
+
+def downgrade() -> None:
+    # Detached partitions are not merged back; reattach them first to keep their rows
+    for table in PARTITIONED_TABLES:
+        old, indexes = _rebuild(table, "id")
+        _finish(table, old, indexes)
+    op.alter_column("points_ledger", "created_at", nullable=True)
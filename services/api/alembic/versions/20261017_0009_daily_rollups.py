@@ -0,0 +1,45 @@
+"""daily analytics rollups per day, program and habit
+
+Filled by the worker (`python -m app.main rollups --backfill` for existing data).
+
+Revision ID: 20261017_0009
+Revises: 20261016_0008
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20261017_0009"
+down_revision = "20261016_0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "daily_rollups",
+        sa.Column("program_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("habit_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("check_ins", sa.Integer(), nullable=False),
+        sa.Column("active_users", sa.Integer(), nullable=False),
+        sa.Column("points_awarded", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("program_id", "habit_id", "day"),
+    )
+    op.create_index(op.f("ix_daily_rollups_day"), "daily_rollups", ["day"], unique=False)
+    op.create_table(
+        "rollup_watermarks",
+        sa.Column("source", sa.String(length=64), nullable=False),
+        sa.Column("last_id", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("source"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("rollup_watermarks")
+    op.drop_index(op.f("ix_daily_rollups_day"), table_name="daily_rollups")
+    op.drop_table("daily_rollups")
@@ -0,0 +1,32 @@
+"""months of points_ledger and check_ins detached by partition retention
+
+The worker records each partition it detaches, so balance reconciliation and
+state rebuilds know which months are only left in checkpoints and streak runs.
+
+Revision ID: 20261017_0010
+Revises: 20261017_0009
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20261017_0010"
+down_revision = "20261017_0009"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "archived_partitions",
+        sa.Column("table_name", sa.String(length=64), nullable=False),
+        sa.Column("month", sa.Date(), nullable=False),
+        sa.Column("detached_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("table_name", "month"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("archived_partitions")
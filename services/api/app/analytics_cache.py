@@ -0,0 +1,132 @@
+"""In-process cache of admin analytics responses.
+
+Analytics are system-wide aggregates that several admins often load at once,
+and a minute-old answer is fine for them. Responses are kept per API process,
+keyed by path and query string:
+- younger than ANALYTICS_CACHE_TTL_SECONDS, an entry is served as is (HIT);
+- for up to ANALYTICS_CACHE_STALE_SECONDS more, it is still served (STALE),
+  while one background task recomputes it;
+- otherwise the request computes it (MISS), and concurrent requests for the
+  same key wait for that one computation instead of running their own.
+
+A failed refresh keeps the stale entry. A failed computation is raised to
+every request waiting on it and is not cached. The cache is only touched from
+the event loop, so it needs no lock. Counters are in `analytics_cache.stats`
+and the X-Cache response header says how each request was served.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+ANALYTICS_CACHE_TTL_SECONDS = float(os.getenv("ANALYTICS_CACHE_TTL_SECONDS", "60"))
+ANALYTICS_CACHE_STALE_SECONDS = float(os.getenv("ANALYTICS_CACHE_STALE_SECONDS", "300"))
+ANALYTICS_CACHE_SIZE = int(os.getenv("ANALYTICS_CACHE_SIZE", "256"))
+CACHE_HEADER = "X-Cache"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    stale_hits: int = 0
+    misses: int = 0
+    coalesced: int = 0  # requests that waited on another request's computation
+    refreshes: int = 0
+    errors: int = 0
+
+
+class AnalyticsCache:
+    """LRU of computed responses with stale-while-revalidate and single flight."""
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl_seconds: float,
+        stale_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.clock = clock
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def get(self, key: str, load: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        """Return `key`'s value and how it was served: "HIT", "STALE" or "MISS"."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            stored_at, value = entry
+            age = self.clock() - stored_at
+            if age < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return value, "HIT"
+            if age < self.ttl_seconds + self.stale_seconds:
+                self.stats.stale_hits += 1
+                if self._running(key) is None:
+                    self.stats.refreshes += 1
+                    self._start(key, load)
+                return value, "STALE"
+
+        task = self._running(key)
+        if task is None:
+            self.stats.misses += 1
+            task = self._start(key, load)
+        else:
+            self.stats.coalesced += 1
+        # A client that disconnects must not cancel the others' computation
+        return await asyncio.shield(task), "MISS"
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.stats = CacheStats()
+
+    def snapshot(self) -> Dict[str, Any]:
+        served = self.stats.hits + self.stats.stale_hits + self.stats.misses + self.stats.coalesced
+        return {
+            **asdict(self.stats),
+            "entries": len(self._entries),
+            "hit_ratio": round((self.stats.hits + self.stats.stale_hits) / served, 4)
+            if served
+            else None,
+        }
+
+    def _running(self, key: str) -> Optional[asyncio.Task]:
+        task = self._inflight.get(key)
+        # A task left behind by a loop that was shut down cannot be awaited here
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            return None
+        return task
+
+    def _start(self, key: str, load: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = asyncio.ensure_future(self._load(key, load))
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._finished(key, done))
+        return task
+
+    async def _load(self, key: str, load: Callable[[], Awaitable[Any]]) -> Any:
+        value = await load()
+        self._entries[key] = (self.clock(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return value
+
+    def _finished(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.stats.errors += 1
+            logger.warning(f"Computing analytics {key} failed", exc_info=task.exception())
+
+
+analytics_cache = AnalyticsCache(
+    ANALYTICS_CACHE_SIZE, ANALYTICS_CACHE_TTL_SECONDS, ANALYTICS_CACHE_STALE_SECONDS
+)
@@ -0,0 +1,378 @@
+"""Domain helpers for check-in ingestion, points and streak bookkeeping."""
+from __future__ import annotations
+
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.database import dialect_insert
+from app.habit_cache import get_habit_metas
+from app.leaderboards import record_points
+from app.models import CheckIn, Streak
+from app.points_ledger import append_ledger_entries
+from app.rewards_engine import CheckInEvent, apply_check_in_rewards
+from app.schemas import CheckInCreate
+from app.streak_engine import DayAdded, HabitStreak, run_containing
+from app.user_cache import invalidate_users
+
+
+CheckInKey = Tuple[int, int, date]
+
+
+_SINGLE_STATEMENT_CHECK_IN = text(
+    """
+    WITH habit AS (
+        SELECT id, program_id, points_per_completion, name
+        FROM habits
+        WHERE id = :habit_id
+    ),
+    new_check_in AS (
+        INSERT INTO check_ins (
+            user_id, habit_id, check_in_date, metric_key, value_numeric, value_text, notes,
+            created_at
+        )
+        SELECT :user_id, habit.id, :check_in_date, :metric_key, :value_numeric, :value_text,
+               :notes, :now
+        FROM habit
+        ON CONFLICT (user_id, habit_id, check_in_date) DO NOTHING
+        RETURNING id, user_id, habit_id, check_in_date, metric_key, value_numeric, value_text,
+                  notes, created_at
+    ),
+    ledger AS (
+        INSERT INTO points_ledger (
+            user_id, program_id, points, event_type, event_reference_id, description, created_at
+        )
+        SELECT new_check_in.user_id, habit.program_id, habit.points_per_completion, 'check_in',
+               new_check_in.id, 'Check-in: ' || habit.name, :now
+        FROM new_check_in CROSS JOIN habit
+    ),
+    balance AS (
+        INSERT INTO user_points_balance AS b (
+            user_id, program_id, total_points, transaction_count, updated_at
+        )
+        SELECT new_check_in.user_id, habit.program_id, habit.points_per_completion, 1, :now
+        FROM new_check_in CROSS JOIN habit
+        ON CONFLICT (user_id, program_id) DO UPDATE SET
+            total_points = b.total_points + EXCLUDED.total_points,
+            transaction_count = b.transaction_count + 1,
+            updated_at = EXCLUDED.updated_at
+    ),
+    streak AS (
+        INSERT INTO streaks AS s (
+            user_id, habit_id, program_id, current_streak, longest_streak, last_check_in_date,
+            completed_runs, created_at, updated_at
+        )
+        SELECT new_check_in.user_id, new_check_in.habit_id, habit.program_id, 1, 1,
+               new_check_in.check_in_date,
+               jsonb_build_array(jsonb_build_array(CAST(:day AS integer), CAST(:day AS integer))),
+               :now, :now
+        FROM new_check_in CROSS JOIN habit
+        ON CONFLICT (user_id, habit_id) DO UPDATE SET
+            current_streak = CASE
+                WHEN EXCLUDED.last_check_in_date = s.last_check_in_date + 1
+                    THEN s.current_streak + 1
+                ELSE 1
+            END,
+            longest_streak = GREATEST(
+                s.longest_streak,
+                CASE
+                    WHEN EXCLUDED.last_check_in_date = s.last_check_in_date + 1
+                        THEN s.current_streak + 1
+                    ELSE 1
+                END
+            ),
+            last_check_in_date = EXCLUDED.last_check_in_date,
+            completed_runs = CASE
+                WHEN EXCLUDED.last_check_in_date = s.last_check_in_date + 1
+                    THEN jsonb_set(
+                        s.completed_runs,
+                        ARRAY[(jsonb_array_length(s.completed_runs) - 1)::text, '1'],
+                        to_jsonb(CAST(:day AS integer))
+                    )
+                ELSE s.completed_runs || EXCLUDED.completed_runs
+            END,
+            updated_at = EXCLUDED.updated_at
+        -- Only days after the latest one are appended here; back-fills fall through
+        -- to the streak engine in `write_check_in_single_statement`.
+        WHERE s.completed_runs IS NOT NULL
+          AND s.last_check_in_date < EXCLUDED.last_check_in_date
+        RETURNING s.completed_runs -> -1 AS run,
+                  s.completed_runs = jsonb_build_array(
+                      jsonb_build_array(CAST(:day AS integer), CAST(:day AS integer))
+                  ) AS first_day
+    )
+    SELECT EXISTS (SELECT 1 FROM habit) AS habit_exists,
+           (SELECT program_id FROM habit) AS habit_program_id,
+           (SELECT points_per_completion FROM habit) AS habit_points,
+           (SELECT run FROM streak) AS streak_run,
+           (SELECT first_day FROM streak) AS streak_first_day,
+           new_check_in.*
+    FROM (SELECT 1) AS single_row
+    LEFT JOIN new_check_in ON TRUE
+    """
+)
+# Columns of the statement's result that are not part of the check-in row
+_STATEMENT_COLUMNS = (
+    "habit_exists",
+    "habit_program_id",
+    "habit_points",
+    "streak_run",
+    "streak_first_day",
+)
+
+
+def supports_single_statement_writes(db: Session) -> bool:
+    """Writable CTEs with ON CONFLICT are only available on PostgreSQL."""
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def write_check_in_single_statement(
+    db: Session, check_in: CheckInCreate
+) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    """Insert a check-in, its ledger entry, balance and streak upserts in one round trip.
+
+    Back-filled days (older than the streak's latest day) cost one more round trip
+    through `record_streak_day`. Bonus rules then run on the resulting streak run;
+    they only issue statements on a habit's first day, or when the run is long
+    enough for a streak bonus or completes a week.
+    Returns (habit_exists, check_in_row); check_in_row
+    is None when the habit is missing or the check-in already exists. The caller
+    owns the transaction.
+    """
+    params = {
+        **check_in.model_dump(),
+        "day": check_in.check_in_date.toordinal(),
+        "now": datetime.utcnow(),
+    }
+    row = db.execute(_SINGLE_STATEMENT_CHECK_IN, params).mappings().one()
+    if row["id"] is None:
+        return row["habit_exists"], None
+
+    invalidate_users(db, [check_in.user_id])
+    record_points(
+        db,
+        [
+            {
+                "user_id": check_in.user_id,
+                "program_id": row["habit_program_id"],
+                "points": row["habit_points"],
+                "created_at": params["now"],
+            }
+        ],
+    )
+    run, first_day = row["streak_run"], row["streak_first_day"]
+    if run is None:
+        # The upsert hit an existing streak row, so program_id is never needed here.
+        added = record_streak_day(
+            db, check_in.user_id, check_in.habit_id, None, check_in.check_in_date
+        )
+        run, first_day = (added.run_start, added.run_end), added.first
+    apply_check_in_rewards(
+        db,
+        [
+            CheckInEvent(
+                check_in.user_id,
+                check_in.habit_id,
+                row["habit_program_id"],
+                params["day"],
+                tuple(run),
+                first_day,
+            )
+        ],
+    )
+    return True, {key: value for key, value in row.items() if key not in _STATEMENT_COLUMNS}
+
+
+def record_streak_day(
+    db: Session, user_id: int, habit_id: int, program_id: Optional[int], check_in_date: date
+) -> DayAdded:
+    """Add one completed day to a habit streak through the ORM, creating it if needed."""
+    streak = (
+        db.query(Streak)
+        .filter(Streak.user_id == user_id, Streak.habit_id == habit_id)
+        .with_for_update()
+        .first()
+    )
+    if streak is None:
+        streak = Streak(user_id=user_id, habit_id=habit_id, program_id=program_id)
+        db.add(streak)
+        state = HabitStreak()
+    else:
+        state = HabitStreak.from_row(streak)
+
+    added = state.add(check_in_date)
+    for key, value in state.as_row().items():
+        setattr(streak, key, value)
+    invalidate_users(db, [user_id])
+    return added
+
+
+def ingest_check_in_batch(
+    db: Session, items: List[CheckInCreate]
+) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+    """Write a batch of check-ins with set-based statements.
+
+    Issues at most one habit lookup (habits come from the cache), one multi-row
+    CheckIn insert (duplicates are skipped with ON CONFLICT DO NOTHING), one
+    multi-row PointsLedger insert plus its balance upsert, one Streak placeholder
+    insert, one locking read and one upsert, and one pass of the bonus rules.
+    Returns a (status, check_in_row) pair per input item, in input order. The
+    caller owns the transaction.
+    """
+    habits = get_habit_metas(db, (item.habit_id for item in items))
+
+    now = datetime.utcnow()
+    statuses: List[str] = []
+    keys: List[Optional[CheckInKey]] = []
+    rows: List[Dict[str, Any]] = []
+    seen = set()
+    for item in items:
+        key = (item.user_id, item.habit_id, item.check_in_date)
+        keys.append(key)
+        if item.habit_id not in habits:
+            statuses.append("habit_not_found")
+        elif key in seen:
+            statuses.append("duplicate")
+        else:
+            seen.add(key)
+            statuses.append("created")
+            rows.append({**item.model_dump(), "created_at": now})
+
+    inserted: Dict[CheckInKey, Dict[str, Any]] = {}
+    if rows:
+        stmt = (
+            dialect_insert(db, CheckIn)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=["user_id", "habit_id", "check_in_date"])
+            .returning(*CheckIn.__table__.c)
+        )
+        for row in db.execute(stmt).mappings():
+            inserted[(row["user_id"], row["habit_id"], row["check_in_date"])] = dict(row)
+
+    if inserted:
+        invalidate_users(db, (user_id for user_id, _, _ in inserted))
+        _append_check_in_points(db, inserted.values(), habits, now)
+        runs, first_days = _upsert_streaks(db, inserted.keys(), habits, now)
+        apply_check_in_rewards(
+            db,
+            [
+                CheckInEvent(
+                    user_id,
+                    habit_id,
+                    habits[habit_id].program_id,
+                    check_in_date.toordinal(),
+                    tuple(run_containing(runs[(user_id, habit_id)], check_in_date.toordinal())),
+                    (user_id, habit_id) in first_days,
+                )
+                for user_id, habit_id, check_in_date in inserted
+            ],
+        )
+
+    results: List[Tuple[str, Optional[Dict[str, Any]]]] = []
+    for status, key in zip(statuses, keys):
+        if status == "created" and key not in inserted:
+            status = "duplicate"
+        results.append((status, inserted.get(key) if status == "created" else None))
+    return results
+
+
+def _append_check_in_points(db: Session, check_ins, habits, now: datetime) -> None:
+    append_ledger_entries(
+        db,
+        [
+            {
+                "user_id": row["user_id"],
+                "program_id": habits[row["habit_id"]].program_id,
+                "points": habits[row["habit_id"]].points_per_completion,
+                "event_type": "check_in",
+                "event_reference_id": row["id"],
+                "description": f"Check-in: {habits[row['habit_id']].name}",
+                "created_at": now,
+            }
+            for row in check_ins
+        ],
+    )
+
+
+def _upsert_streaks(db: Session, keys, habits, now: datetime):
+    """Add the days to their streaks.
+
+    Returns the resulting runs per (user, habit) and the pairs that had no day before.
+    """
+    dates_by_pair: Dict[Tuple[int, int], List[date]] = {}
+    for user_id, habit_id, check_in_date in keys:
+        dates_by_pair.setdefault((user_id, habit_id), []).append(check_in_date)
+
+    # FOR UPDATE only locks rows that exist, so two batches starting the same
+    # new streak would both build it from scratch and the later upsert would
+    # drop the other's days. Empty placeholder rows, inserted in a stable order,
+    # make the second batch wait here and then read the first one's runs.
+    placeholders = dialect_insert(db, Streak).values(
+        [
+            {
+                "user_id": user_id,
+                "habit_id": habit_id,
+                "program_id": habits[habit_id].program_id,
+                "current_streak": 0,
+                "longest_streak": 0,
+                "completed_runs": [],
+                "created_at": now,
+                "updated_at": now,
+            }
+            for user_id, habit_id in sorted(dates_by_pair)
+        ]
+    )
+    db.execute(placeholders.on_conflict_do_nothing(index_elements=["user_id", "habit_id"]))
+
+    user_ids = {user_id for user_id, _ in dates_by_pair}
+    habit_ids = {habit_id for _, habit_id in dates_by_pair}
+    existing = {
+        (streak.user_id, streak.habit_id): streak
+        for streak in db.query(
+            Streak.user_id,
+            Streak.habit_id,
+            Streak.current_streak,
+            Streak.longest_streak,
+            Streak.last_check_in_date,
+            Streak.completed_runs,
+        )
+        .filter(Streak.user_id.in_(user_ids), Streak.habit_id.in_(habit_ids))
+        .with_for_update()
+    }
+
+    streak_rows = []
+    runs = {}
+    first_days = set()
+    for (user_id, habit_id), dates in dates_by_pair.items():
+        state = HabitStreak.from_row(existing[(user_id, habit_id)])
+        if not state.runs:
+            first_days.add((user_id, habit_id))
+        for check_in_date in dates:
+            state.add(check_in_date)
+        runs[(user_id, habit_id)] = state.runs
+        streak_rows.append(
+            {
+                "user_id": user_id,
+                "habit_id": habit_id,
+                "program_id": habits[habit_id].program_id,
+                **state.as_row(),
+                "created_at": now,
+                "updated_at": now,
+            }
+        )
+
+    stmt = dialect_insert(db, Streak).values(streak_rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "habit_id"],
+        set_={
+            "current_streak": stmt.excluded.current_streak,
+            "longest_streak": stmt.excluded.longest_streak,
+            "last_check_in_date": stmt.excluded.last_check_in_date,
+            "completed_runs": stmt.excluded.completed_runs,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+    db.execute(stmt)
+    return runs, first_days
@@ -0,0 +1,62 @@
+"""Write-behind check-in acceptance through Redis Streams.
+
+With CHECK_IN_WRITE_BEHIND enabled, POST /api/v1/check-ins validates the
+request, appends it to a Redis Stream and answers 202 without waiting on
+Postgres. The check-in consumer in services/worker then materializes events in
+batches through POST /api/v1/check-ins/batch.
+
+Events are sharded by user id and every shard has exactly one consumer, so a
+user's check-ins are applied in the order they were accepted. Until then they
+are listed by `pending_check_ins` so clients can read their own writes. Stream
+and key names are shared with services/worker/app/main.py.
+"""
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List
+from uuid import uuid4
+
+from app.redis_client import get_redis
+from app.schemas import CheckInCreate
+
+CHECK_IN_WRITE_BEHIND = os.getenv("CHECK_IN_WRITE_BEHIND", "false").lower() == "true"
+CHECK_IN_STREAM_SHARDS = int(os.getenv("CHECK_IN_STREAM_SHARDS", "8"))
+PENDING_TTL_SECONDS = 7 * 24 * 3600
+
+
+def stream_key(shard: int) -> str:
+    return f"check_ins:stream:{shard}"
+
+
+def pending_key(user_id: int) -> str:
+    return f"check_ins:pending:{user_id}"
+
+
+def write_behind_enabled() -> bool:
+    return CHECK_IN_WRITE_BEHIND and get_redis() is not None
+
+
+def enqueue_check_in(check_in: CheckInCreate) -> Dict[str, Any]:
+    """Append a validated check-in to its user's shard; raises RedisError on failure."""
+    event = {
+        "event_id": uuid4().hex,
+        "enqueued_at": datetime.utcnow().isoformat(),
+        "check_in": check_in.model_dump(mode="json"),
+    }
+    payload = json.dumps(event)
+
+    pipe = get_redis().pipeline(transaction=True)
+    pipe.xadd(stream_key(check_in.user_id % CHECK_IN_STREAM_SHARDS), {"event": payload})
+    pipe.hset(pending_key(check_in.user_id), event["event_id"], payload)
+    pipe.expire(pending_key(check_in.user_id), PENDING_TTL_SECONDS)
+    pipe.execute()
+    return event
+
+
+def pending_check_ins(user_id: int) -> List[Dict[str, Any]]:
+    """Accepted check-ins for a user that the worker has not materialized yet."""
+    client = get_redis()
+    if client is None:
+        return []
+    events = [json.loads(payload) for payload in client.hvals(pending_key(user_id))]
+    return sorted(events, key=lambda event: event["enqueued_at"])
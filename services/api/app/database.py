@@ -1,14 +1,62 @@
-"""Database configuration and session management."""
+"""Database configuration and session management.
+
+DATABASE_READ_URL optionally points at a read replica. Routes that can show
+slightly old data (analytics, lists, exports, timelines) take `get_read_db` /
+`get_async_read_db`. Those give a replica session while the replica is
+reachable and at most DATABASE_READ_MAX_LAG_SECONDS behind, checked every
+DATABASE_READ_CHECK_SECONDS. Otherwise they give the primary session. A
+request sends `X-Read-Primary: true` to read from the primary anyway, e.g.
+right after its own write. The X-DB-Source header of non-streamed responses
+names the one used.
+"""
+import asyncio
+import logging
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import threading
+import time
+import weakref
+from typing import Any, Awaitable, Callable, List, Optional
+
+from fastapi import Depends, Request, Response
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql+psycopg://mevuser:mevpass@db:5432/mevdb")
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+DATABASE_READ_MAX_LAG_SECONDS = float(os.getenv("DATABASE_READ_MAX_LAG_SECONDS", "10"))
+DATABASE_READ_CHECK_SECONDS = float(os.getenv("DATABASE_READ_CHECK_SECONDS", "5"))
+CONCURRENT_READS = int(os.getenv("CONCURRENT_READS", "4"))
+READ_PRIMARY_HEADER = "X-Read-Primary"
+DB_SOURCE_HEADER = "X-DB-Source"
+ECHO_SQL = os.getenv("APP_ENV") == "local"
 
-engine = create_engine(DATABASE_URL, echo=True if os.getenv("APP_ENV") == "local" else False)
+logger = logging.getLogger(__name__)
+
+engine = create_engine(DATABASE_URL, echo=ECHO_SQL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# psycopg 3 serves both engines; the async one backs `async def` routes so they do
+# not occupy a threadpool worker while waiting on Postgres.
+async_engine = create_async_engine(DATABASE_URL, echo=ECHO_SQL)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+ReadSessionLocal: Optional[sessionmaker] = None
+AsyncReadSessionLocal: Optional[async_sessionmaker] = None
+if DATABASE_READ_URL:
+    ReadSessionLocal = sessionmaker(
+        autocommit=False,
+        autoflush=False,
+        bind=create_engine(DATABASE_READ_URL, echo=ECHO_SQL, pool_pre_ping=True),
+    )
+    AsyncReadSessionLocal = async_sessionmaker(
+        create_async_engine(DATABASE_READ_URL, echo=ECHO_SQL, pool_pre_ping=True),
+        autoflush=False,
+        expire_on_commit=False,
+    )
+
 
 def get_db():
     """Dependency for FastAPI routes."""
@@ -17,3 +65,190 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """Dependency for `async def` FastAPI routes."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# A standby that is streaming from the primary and has replayed everything it
+# received is caught up, even if the primary has been idle since the last
+# replayed commit. Without a streaming WAL receiver, nothing new arrives, so the
+# lag is the age of the last replayed commit; with none replayed, it is unknown.
+# The receiver's status needs pg_read_all_stats; without it, a running receiver
+# counts as streaming.
+REPLICA_LAG_SQL = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+             AND EXISTS (
+                 SELECT 1 FROM pg_stat_wal_receiver
+                 WHERE COALESCE(status, 'streaming') = 'streaming'
+             )
+        THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+    """
+)
+
+
+def _replica_lag(session: Session) -> float:
+    if session.get_bind().dialect.name != "postgresql":
+        session.execute(text("SELECT 1"))
+        return 0.0
+    lag = session.execute(REPLICA_LAG_SQL).scalar()
+    return float("inf") if lag is None else float(lag)
+
+
+class ReplicaMonitor:
+    """Whether the replica was reachable and caught up at its last check."""
+
+    def __init__(self, max_lag_seconds: float, check_seconds: float):
+        self.max_lag_seconds = max_lag_seconds
+        self.check_seconds = check_seconds
+        self.usable = False
+        self.checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def claim_check(self) -> bool:
+        """True for the one caller that should measure the lag now."""
+        with self._lock:
+            now = time.monotonic()
+            if self.checked_at is not None and now - self.checked_at < self.check_seconds:
+                return False
+            self.checked_at = now
+            return True
+
+    def record(self, lag: Optional[float]) -> None:
+        usable = lag is not None and lag <= self.max_lag_seconds
+        if usable != self.usable:
+            if usable:
+                logger.info("Read replica caught up; reading from it again")
+            else:
+                logger.warning(f"Read replica unavailable or {lag} s behind; reading from primary")
+        self.usable = usable
+
+
+replica_monitor = ReplicaMonitor(DATABASE_READ_MAX_LAG_SECONDS, DATABASE_READ_CHECK_SECONDS)
+
+
+def wants_primary(request: Request) -> bool:
+    """Whether the request asked to read from the primary (READ_PRIMARY_HEADER)."""
+    return request.headers.get(READ_PRIMARY_HEADER, "").lower() in ("1", "true")
+
+
+def _check_replica() -> None:
+    try:
+        with ReadSessionLocal() as db:
+            lag = _replica_lag(db)
+    except Exception:
+        logger.warning("Read replica check failed", exc_info=True)
+        lag = None
+    replica_monitor.record(lag)
+
+
+async def _check_replica_async() -> None:
+    try:
+        async with AsyncReadSessionLocal() as db:
+            lag = await db.run_sync(_replica_lag)
+    except Exception:
+        logger.warning("Read replica check failed", exc_info=True)
+        lag = None
+    replica_monitor.record(lag)
+
+
+def get_read_db(request: Request, response: Response, primary: Session = Depends(get_db)):
+    """Dependency for read-only routes: the replica when usable, else the primary session."""
+    use_replica = ReadSessionLocal is not None and not wants_primary(request)
+    if use_replica and replica_monitor.claim_check():
+        _check_replica()
+    if not (use_replica and replica_monitor.usable):
+        response.headers[DB_SOURCE_HEADER] = "primary"
+        yield primary
+        return
+    response.headers[DB_SOURCE_HEADER] = "replica"
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db(
+    request: Request, response: Response, primary: AsyncSession = Depends(get_async_db)
+):
+    """Async `get_read_db`."""
+    use_replica = AsyncReadSessionLocal is not None and not wants_primary(request)
+    if use_replica and replica_monitor.claim_check():
+        await _check_replica_async()
+    if not (use_replica and replica_monitor.usable):
+        response.headers[DB_SOURCE_HEADER] = "primary"
+        yield primary
+        return
+    response.headers[DB_SOURCE_HEADER] = "replica"
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+
+# One semaphore per event loop: asyncio primitives cannot be shared between loops
+_read_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _concurrent_read_slots() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    slots = _read_slots.get(loop)
+    if slots is None:
+        slots = _read_slots[loop] = asyncio.Semaphore(CONCURRENT_READS)
+    return slots
+
+
+async def run_concurrently(
+    db: AsyncSession, *reads: Callable[[AsyncSession], Awaitable[Any]]
+) -> List[Any]:
+    """Run independent reads concurrently, each on its own pooled connection.
+
+    An AsyncSession runs one statement at a time, so every read gets a sibling
+    session bound to the same engine as `db`. At most CONCURRENT_READS of
+    those sessions are open at once in the process, whatever the number of
+    requests fanning out, so they cannot use up the connection pool.
+    """
+    slots = _concurrent_read_slots()
+
+    async def run(read):
+        async with slots:
+            async with AsyncSession(bind=db.bind, expire_on_commit=False) as session:
+                return await read(session)
+
+    return await asyncio.gather(*(run(read) for read in reads))
+
+
+def call_after_commit(db: Session, callback: Callable[[], None]) -> None:
+    """Run `callback` once the session's current transaction commits.
+
+    Used for side effects outside Postgres (caches, Redis) that must not be
+    visible before the data they describe; a rollback discards them.
+    """
+    db.info.setdefault("after_commit", []).append(callback)
+
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit_callbacks(session):
+    for callback in session.info.pop("after_commit", []):
+        callback()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_commit_callbacks(session):
+    session.info.pop("after_commit", None)
+
+
+def dialect_insert(db: Session, model):
+    """Build an INSERT for `model` that supports ON CONFLICT on the session's dialect."""
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
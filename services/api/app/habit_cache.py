@@ -0,0 +1,152 @@
+"""In-process cache of the habit fields the check-in hot path needs.
+
+Check-ins only read a habit's program, points and name, and habits change
+rarely, so those fields are kept in a size-bounded LRU per API process. Any
+habit write calls `invalidate_habits`. Once the transaction commits, that bumps
+the cache version, which empties the cache and discards loads that started
+under the old version. It also publishes on a Redis channel so the other API
+replicas bump their own version. A TTL bounds staleness if an invalidation is
+ever missed.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy.orm import Session
+
+from app.database import call_after_commit
+from app.models import Habit
+from app.redis_client import get_redis, new_subscriber_redis
+
+HABIT_CACHE_SIZE = int(os.getenv("HABIT_CACHE_SIZE", "4096"))
+HABIT_CACHE_TTL_SECONDS = float(os.getenv("HABIT_CACHE_TTL_SECONDS", "300"))
+INVALIDATION_CHANNEL = "habit_cache:invalidate"
+
+logger = logging.getLogger(__name__)
+
+
+class HabitMeta(NamedTuple):
+    id: int
+    program_id: int
+    points_per_completion: int
+    name: str
+
+
+class HabitCache:
+    """Thread-safe LRU of HabitMeta guarded by a version counter."""
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.version = 0
+        self._entries: "OrderedDict[int, tuple[float, HabitMeta]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, habit_id: int) -> Optional[HabitMeta]:
+        with self._lock:
+            entry = self._entries.get(habit_id)
+            if entry is None:
+                return None
+            loaded_at, meta = entry
+            if time.monotonic() - loaded_at > self.ttl_seconds:
+                del self._entries[habit_id]
+                return None
+            self._entries.move_to_end(habit_id)
+            return meta
+
+    def put(self, meta: HabitMeta, version: int) -> None:
+        """Store `meta` unless the cache was invalidated since it was loaded."""
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[meta.id] = (time.monotonic(), meta)
+            self._entries.move_to_end(meta.id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def bump(self) -> None:
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+
+habit_cache = HabitCache(HABIT_CACHE_SIZE, HABIT_CACHE_TTL_SECONDS)
+_listener_started = False
+_listener_lock = threading.Lock()
+
+
+def get_habit_metas(db: Session, habit_ids: Iterable[int]) -> Dict[int, HabitMeta]:
+    """Cached metadata for the given habits; missing habits are left out."""
+    _ensure_listener()
+    found: Dict[int, HabitMeta] = {}
+    misses = []
+    for habit_id in set(habit_ids):
+        meta = habit_cache.get(habit_id)
+        if meta is None:
+            misses.append(habit_id)
+        else:
+            found[habit_id] = meta
+
+    if misses:
+        version = habit_cache.version
+        rows = db.query(
+            Habit.id, Habit.program_id, Habit.points_per_completion, Habit.name
+        ).filter(Habit.id.in_(misses))
+        for row in rows:
+            meta = HabitMeta(*row)
+            habit_cache.put(meta, version)
+            found[meta.id] = meta
+    return found
+
+
+def get_habit_meta(db: Session, habit_id: int) -> Optional[HabitMeta]:
+    return get_habit_metas(db, [habit_id]).get(habit_id)
+
+
+def invalidate_habits(db: Session) -> None:
+    """Drop cached habits on every replica once `db` commits its habit writes."""
+    call_after_commit(db, _invalidate_everywhere)
+
+
+def _invalidate_everywhere() -> None:
+    habit_cache.bump()
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.publish(INVALIDATION_CHANNEL, "1")
+    except RedisError:
+        logger.warning("Could not publish habit cache invalidation", exc_info=True)
+
+
+def _ensure_listener() -> None:
+    global _listener_started
+    if _listener_started:
+        return
+    with _listener_lock:
+        if _listener_started:
+            return
+        client = new_subscriber_redis()
+        if client is not None:
+            threading.Thread(
+                target=_listen, args=(client,), name="habit-cache-invalidation", daemon=True
+            ).start()
+        _listener_started = True
+
+
+def _listen(client) -> None:
+    while True:
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Invalidations published while we were not subscribed are lost
+            habit_cache.bump()
+            for _ in pubsub.listen():
+                habit_cache.bump()
+        except RedisError:
+            logger.warning("Habit cache subscription lost, reconnecting", exc_info=True)
+            time.sleep(1)
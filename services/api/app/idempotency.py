@@ -0,0 +1,140 @@
+"""Idempotency-Key support for retried write requests, backed by Redis.
+
+The first request with a given key runs normally and its response is stored for
+IDEMPOTENCY_TTL_SECONDS. Retries with the same key, path and caller get the
+stored response back without reaching the route (or Postgres). Reusing a key
+with a different body is rejected, and a retry that races the original request
+gets 409 until the original finishes. A request that fails with a 5xx or an
+exception releases its key, so the client can retry it.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+
+from fastapi import status
+from fastapi.responses import JSONResponse
+from redis.exceptions import RedisError
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.redis_client import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_LOCK_SECONDS = 60
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+
+IDEMPOTENT_ROUTES = [
+    re.compile(r"^/api/v1/check-ins/?$"),
+    re.compile(r"^/api/v1/check-ins/batch/?$"),
+    re.compile(r"^/api/v1/badges/award/?$"),
+    re.compile(r"^/api/v1/enrollments/?$"),
+    re.compile(r"^/api/v1/protocol-runs/\d+/artifacts/[^/]+/?$"),
+]
+
+
+def _is_idempotent_route(path: str) -> bool:
+    return any(pattern.match(path) for pattern in IDEMPOTENT_ROUTES)
+
+
+def _cache_key(request: Request, idempotency_key: str) -> str:
+    # Scope keys to the caller and route so clients cannot replay each other's responses.
+    scope = "\n".join(
+        [request.url.path, request.headers.get("authorization", ""), idempotency_key]
+    )
+    return "idempotency:" + hashlib.sha256(scope.encode()).hexdigest()
+
+
+class IdempotencyMiddleware(BaseHTTPMiddleware):
+    """Replay stored responses for POSTs that carry an Idempotency-Key header."""
+
+    async def dispatch(self, request: Request, call_next) -> Response:
+        idempotency_key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+        client = get_async_redis()
+        if (
+            request.method != "POST"
+            or not idempotency_key
+            or client is None
+            or not _is_idempotent_route(request.url.path)
+        ):
+            return await call_next(request)
+
+        cache_key = _cache_key(request, idempotency_key)
+        fingerprint = hashlib.sha256(await request.body()).hexdigest()
+        try:
+            acquired = await client.set(
+                cache_key,
+                json.dumps({"state": "in_progress", "fingerprint": fingerprint}),
+                nx=True,
+                ex=IDEMPOTENCY_LOCK_SECONDS,
+            )
+            stored = None if acquired else await client.get(cache_key)
+        except RedisError:
+            logger.warning("Idempotency store unavailable; processing request without it")
+            return await call_next(request)
+
+        if not acquired:
+            return self._replay(stored, fingerprint)
+
+        try:
+            response = await call_next(request)
+        except Exception:
+            # Release the key so a retry runs instead of getting 409 until the lock expires
+            try:
+                await client.delete(cache_key)
+            except RedisError:
+                logger.warning("Could not release idempotency key for %s", request.url.path)
+            raise
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        try:
+            if response.status_code >= 500:
+                await client.delete(cache_key)
+            else:
+                record = {
+                    "state": "completed",
+                    "fingerprint": fingerprint,
+                    "status_code": response.status_code,
+                    "media_type": response.media_type or response.headers.get("content-type"),
+                    "body": body.decode("utf-8"),
+                }
+                await client.set(cache_key, json.dumps(record), ex=IDEMPOTENCY_TTL_SECONDS)
+        except (RedisError, UnicodeDecodeError):
+            logger.warning("Could not store idempotent response for %s", request.url.path)
+
+        return Response(
+            content=body,
+            status_code=response.status_code,
+            headers=dict(response.headers),
+            media_type=response.media_type,
+        )
+
+    @staticmethod
+    def _replay(stored, fingerprint: str) -> Response:
+        if stored is None:
+            # The key expired between SET NX and GET; ask the client to retry.
+            return JSONResponse(
+                status_code=status.HTTP_409_CONFLICT,
+                content={"detail": "Request with this Idempotency-Key is being processed"},
+            )
+
+        record = json.loads(stored)
+        if record["fingerprint"] != fingerprint:
+            return JSONResponse(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                content={"detail": "Idempotency-Key was already used with a different request"},
+            )
+        if record["state"] != "completed":
+            return JSONResponse(
+                status_code=status.HTTP_409_CONFLICT,
+                content={"detail": "Request with this Idempotency-Key is being processed"},
+            )
+        return Response(
+            content=record["body"],
+            status_code=record["status_code"],
+            media_type=record["media_type"],
+            headers={"Idempotent-Replayed": "true"},
+        )
@@ -0,0 +1,189 @@
+"""Points leaderboards kept in Redis sorted sets.
+
+Every ledger append adds its points to the user's score on the global board,
+on its program's board and on the weekly (ISO week of the entry) variant of
+each, with ZINCRBY once the transaction commits. Entries without a program only
+count globally. Reads are single sorted-set commands, so ranking never touches
+the ledger.
+
+Redis is the only store for these scores. If an increment is lost (Redis down,
+process killed between commit and increment), `rebuild_leaderboards` rebuilds
+the all-time boards from `user_points_balance` and the current week's boards
+from the ledger. It stages each board under a temporary key in pipelined
+batches and renames it over the live one. Increments committed while a rebuild
+runs can be overwritten, so run it when traffic is quiet:
+`python -m app.leaderboards [--batch-size N]`.
+"""
+import argparse
+import logging
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import redis
+from redis.exceptions import RedisError
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, call_after_commit
+from app.models import PointsLedger, UserPointsBalance
+from app.redis_client import get_redis
+
+LEADERBOARD_PREFIX = "leaderboard"
+WEEKLY_TTL_SECONDS = 5 * 7 * 24 * 3600
+REBUILD_BATCH_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def week_label(day: date) -> str:
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def leaderboard_key(program_id: Optional[int] = None, week: Optional[str] = None) -> str:
+    if program_id:
+        key = f"{LEADERBOARD_PREFIX}:program:{program_id}"
+    else:
+        key = f"{LEADERBOARD_PREFIX}:global"
+    return f"{key}:week:{week}" if week else key
+
+
+def _board_keys(program_id: Optional[int], week: str) -> List[str]:
+    keys = [leaderboard_key(None), leaderboard_key(None, week)]
+    if program_id:
+        keys += [leaderboard_key(program_id), leaderboard_key(program_id, week)]
+    return keys
+
+
+def record_points(db: Session, entries: Iterable[Dict[str, Any]]) -> None:
+    """Add ledger entries to the leaderboards once `db` commits them."""
+    increments: Dict[Tuple[str, str], int] = defaultdict(int)
+    for entry in entries:
+        week = week_label(entry["created_at"])
+        for key in _board_keys(entry["program_id"], week):
+            increments[(key, str(entry["user_id"]))] += entry["points"]
+    if increments:
+        call_after_commit(db, lambda: _apply_increments(increments))
+
+
+def _apply_increments(increments: Dict[Tuple[str, str], int]) -> None:
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        weekly = set()
+        for (key, member), points in increments.items():
+            pipe.zincrby(key, points, member)
+            if ":week:" in key:
+                weekly.add(key)
+        for key in weekly:
+            pipe.expire(key, WEEKLY_TTL_SECONDS)
+        pipe.execute()
+    except RedisError:
+        logger.warning("Could not update leaderboards; rebuild them to catch up", exc_info=True)
+
+
+def _entries(rows, first_rank: int) -> List[Dict[str, int]]:
+    return [
+        {"rank": first_rank + offset, "user_id": int(member), "points": int(score)}
+        for offset, (member, score) in enumerate(rows)
+    ]
+
+
+def top(client: redis.Redis, key: str, offset: int, limit: int) -> List[Dict[str, int]]:
+    rows = client.zrevrange(key, offset, offset + limit - 1, withscores=True)
+    return _entries(rows, offset + 1)
+
+
+def user_rank(client: redis.Redis, key: str, user_id: int) -> Optional[Dict[str, int]]:
+    pipe = client.pipeline(transaction=False)
+    pipe.zrevrank(key, str(user_id))
+    pipe.zscore(key, str(user_id))
+    rank, score = pipe.execute()
+    if rank is None:
+        return None
+    return {"rank": rank + 1, "user_id": user_id, "points": int(score)}
+
+
+def around(
+    client: redis.Redis, key: str, user_id: int, radius: int
+) -> Optional[List[Dict[str, int]]]:
+    """The user's entry with up to `radius` neighbours on each side."""
+    rank = client.zrevrank(key, str(user_id))
+    if rank is None:
+        return None
+    start = max(rank - radius, 0)
+    return top(client, key, start, rank + radius - start + 1)
+
+
+def rebuild_leaderboards(
+    db: Session, client: redis.Redis, batch_size: int = REBUILD_BATCH_SIZE
+) -> int:
+    """Repopulate the all-time and current-week boards; returns how many boards were written."""
+    token = uuid.uuid4().hex
+    staged: Dict[str, str] = {}
+    pipe = client.pipeline(transaction=False)
+
+    def add(key: str, user_id: int, points: int) -> None:
+        staging_key = staged.setdefault(key, f"{key}:rebuild:{token}")
+        pipe.zincrby(staging_key, points, str(user_id))
+        if len(pipe) >= batch_size:
+            pipe.execute()
+
+    balances = select(
+        UserPointsBalance.user_id, UserPointsBalance.program_id, UserPointsBalance.total_points
+    ).execution_options(yield_per=batch_size)
+    for user_id, program_id, points in db.execute(balances):
+        add(leaderboard_key(None), user_id, points)
+        if program_id:
+            add(leaderboard_key(program_id), user_id, points)
+
+    today = datetime.utcnow().date()
+    week = week_label(today)
+    monday = datetime.combine(today - timedelta(days=today.weekday()), time.min)
+    this_week = (
+        select(PointsLedger.user_id, PointsLedger.program_id, func.sum(PointsLedger.points))
+        .where(PointsLedger.created_at >= monday)
+        .group_by(PointsLedger.user_id, PointsLedger.program_id)
+        .execution_options(yield_per=batch_size)
+    )
+    for user_id, program_id, points in db.execute(this_week):
+        add(leaderboard_key(None, week), user_id, points)
+        if program_id:
+            add(leaderboard_key(program_id, week), user_id, points)
+    pipe.execute()
+
+    # Boards that no longer have members are dropped; older weeks expire by themselves
+    live = {
+        key
+        for key in client.scan_iter(match=f"{LEADERBOARD_PREFIX}:*", count=batch_size)
+        if ":rebuild:" not in key and (":week:" not in key or key.endswith(f":week:{week}"))
+    }
+    swap = client.pipeline(transaction=True)
+    for key in live - staged.keys():
+        swap.delete(key)
+    for key, staging_key in staged.items():
+        swap.rename(staging_key, key)
+        if ":week:" in key:
+            swap.expire(key, WEEKLY_TTL_SECONDS)
+    swap.execute()
+    return len(staged)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Rebuild the Redis leaderboards from Postgres.")
+    parser.add_argument("--batch-size", type=int, default=REBUILD_BATCH_SIZE)
+    args = parser.parse_args()
+    client = get_redis()
+    if client is None:
+        parser.error("REDIS_URL is not set")
+    db = SessionLocal()
+    try:
+        boards = rebuild_leaderboards(db, client, args.batch_size)
+    finally:
+        db.close()
+    logger.info(f"Rebuilt {boards} leaderboards")
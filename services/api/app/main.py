@@ -2,6 +2,10 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from app.analytics_cache import CACHE_HEADER
+from app.database import DB_SOURCE_HEADER
+from app.idempotency import IdempotencyMiddleware
+from app.query_stats import QUERY_COUNT_HEADER, QUERY_TIME_HEADER, QueryStatsMiddleware
 from app.routers import (
     programs,
     habits,
@@ -14,8 +18,11 @@ from app.routers import (
     admin_badges,
     admin_programs,
     admin_analytics,
+    admin_maintenance,
     protocol_templates,
     protocol_runs,
+    exports,
+    leaderboards,
 )
 
 app = FastAPI(
@@ -24,6 +31,13 @@ app = FastAPI(
     version="0.1.0",
 )
 
+# Statement count and DB time per request as response headers (not in production)
+app.add_middleware(QueryStatsMiddleware)
+
+# Replay stored responses for retried writes (Idempotency-Key header).
+# Added before CORS so replayed responses still get CORS headers.
+app.add_middleware(IdempotencyMiddleware)
+
 # CORS middleware for web frontend
 app.add_middleware(
     CORSMiddleware,
@@ -31,6 +45,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "X-Next-Cursor",
+        "ETag",
+        QUERY_COUNT_HEADER,
+        QUERY_TIME_HEADER,
+        CACHE_HEADER,
+        DB_SOURCE_HEADER,
+    ],
 )
 
 # Include routers
@@ -39,6 +61,7 @@ app.include_router(admin_rewards.router)
 app.include_router(admin_badges.router)
 app.include_router(admin_programs.router)
 app.include_router(admin_analytics.router)
+app.include_router(admin_maintenance.router)
 app.include_router(programs.router)
 app.include_router(habits.router)
 app.include_router(check_ins.router)
@@ -47,6 +70,8 @@ app.include_router(badges.router)
 app.include_router(enrollments.router)
 app.include_router(protocol_templates.router)
 app.include_router(protocol_runs.router)
+app.include_router(exports.router)
+app.include_router(leaderboards.router)
 
 
 @app.get("/health")
@@ -0,0 +1,158 @@
+"""Queue and runner for state rebuild jobs, outside the API processes.
+
+POST /api/v1/admin/maintenance/rebuild-state and the worker's `rebuild-state`
+command only enqueue a job: its parameters go to the `state_rebuild:{id}` hash
+and its id to the `state_rebuild:queue` list. The runner,
+`python -m app.maintenance_jobs`, pops one job at a time and runs it with
+`state_rebuild.rebuild_state`, process pool included, recording progress in the
+hash. Key names are shared with services/worker/app/main.py.
+
+While a job runs, the runner refreshes its `heartbeat` (epoch seconds) every
+REBUILD_HEARTBEAT_SECONDS. `load_job` marks a running job whose heartbeat is
+older than REBUILD_HEARTBEAT_TIMEOUT_SECONDS as failed, so a job whose runner
+died does not stay "running" until its hash expires.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+import redis
+from redis.exceptions import RedisError
+from sqlalchemy.orm import sessionmaker
+
+from app.database import SessionLocal
+from app.redis_client import new_subscriber_redis
+from app.state_rebuild import RebuildReport, rebuild_state
+
+QUEUE_KEY = "state_rebuild:queue"
+JOB_TTL_SECONDS = 24 * 3600
+REBUILD_HEARTBEAT_SECONDS = float(os.getenv("REBUILD_HEARTBEAT_SECONDS", "10"))
+REBUILD_HEARTBEAT_TIMEOUT_SECONDS = float(os.getenv("REBUILD_HEARTBEAT_TIMEOUT_SECONDS", "120"))
+
+logger = logging.getLogger(__name__)
+
+
+def job_key(job_id: str) -> str:
+    return f"state_rebuild:{job_id}"
+
+
+def save_job(client: redis.Redis, job_id: str, **fields) -> None:
+    """Update a job's hash; progress is best effort, so Redis errors are only logged."""
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.hset(job_key(job_id), mapping={name: str(value) for name, value in fields.items()})
+        pipe.expire(job_key(job_id), JOB_TTL_SECONDS)
+        pipe.execute()
+    except RedisError:
+        logger.warning(f"Could not record progress of state rebuild {job_id}", exc_info=True)
+
+
+def enqueue_job(client: redis.Redis, dry_run: bool, workers: int, chunk_size: int) -> str:
+    """Record a queued job and push it for the runner; raises RedisError on failure."""
+    job_id = uuid.uuid4().hex
+    pipe = client.pipeline(transaction=True)
+    pipe.hset(
+        job_key(job_id),
+        mapping={
+            "status": "queued",
+            "dry_run": str(dry_run),
+            "workers": str(workers),
+            "chunk_size": str(chunk_size),
+            "users_total": "0",
+            "users_done": "0",
+        },
+    )
+    pipe.expire(job_key(job_id), JOB_TTL_SECONDS)
+    pipe.rpush(QUEUE_KEY, job_id)
+    pipe.execute()
+    return job_id
+
+
+def load_job(client: redis.Redis, job_id: str) -> Dict[str, str]:
+    """A job's hash, empty when unknown, with a stale running job marked failed."""
+    job = client.hgetall(job_key(job_id))
+    if job.get("status") == "running":
+        heartbeat = float(job.get("heartbeat", 0))
+        if time.time() - heartbeat > REBUILD_HEARTBEAT_TIMEOUT_SECONDS:
+            error = f"runner stopped responding (last heartbeat {heartbeat:.0f})"
+            save_job(client, job_id, status="failed", error=error)
+            job.update(status="failed", error=error)
+    return job
+
+
+def _report_fields(report: RebuildReport) -> dict:
+    return {
+        "users_total": report.users_total,
+        "users_done": report.users_done,
+        "streaks_changed": report.streaks_changed,
+        "balances_changed": report.balances_changed,
+        "summary": report.summary(),
+    }
+
+
+def _beat(client: redis.Redis, job_id: str, stop: threading.Event) -> None:
+    while not stop.wait(REBUILD_HEARTBEAT_SECONDS):
+        save_job(client, job_id, heartbeat=time.time())
+
+
+def run_job(
+    client: redis.Redis, job_id: str, session_factory: sessionmaker = SessionLocal
+) -> Optional[RebuildReport]:
+    """Run a queued job to completion, recording progress, the outcome and heartbeats."""
+    job = client.hgetall(job_key(job_id))
+    if job.get("status") != "queued":
+        logger.warning(f"Skipping state rebuild {job_id}: status {job.get('status')}")
+        return None
+    save_job(client, job_id, status="running", heartbeat=time.time())
+    stop = threading.Event()
+    beat = threading.Thread(target=_beat, args=(client, job_id, stop), daemon=True)
+    beat.start()
+    try:
+        report = rebuild_state(
+            session_factory,
+            workers=int(job["workers"]),
+            chunk_size=int(job["chunk_size"]),
+            dry_run=job["dry_run"] == "True",
+            progress=lambda report: save_job(client, job_id, **_report_fields(report)),
+        )
+    except Exception as exc:
+        logger.exception(f"State rebuild {job_id} failed")
+        save_job(client, job_id, status="failed", error=repr(exc))
+        return None
+    finally:
+        stop.set()
+        beat.join()
+    save_job(
+        client, job_id, status="finished", diffs=json.dumps(report.diffs), **_report_fields(report)
+    )
+    logger.info(f"State rebuild {job_id}: {report.summary()}")
+    return report
+
+
+def run_next(
+    client: redis.Redis, timeout: float = 5, session_factory: sessionmaker = SessionLocal
+) -> bool:
+    """Run the next queued job, waiting up to `timeout` seconds for one."""
+    popped = client.blpop([QUEUE_KEY], timeout=timeout)
+    if popped is None:
+        return False
+    run_job(client, popped[1], session_factory)
+    return True
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    client = new_subscriber_redis()
+    if client is None:
+        raise SystemExit("REDIS_URL is not set")
+    logger.info("Waiting for state rebuild jobs")
+    while True:
+        try:
+            run_next(client)
+        except RedisError:
+            logger.warning("Redis unavailable; retrying", exc_info=True)
+            time.sleep(REBUILD_HEARTBEAT_SECONDS)
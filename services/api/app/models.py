@@ -77,6 +77,9 @@ class Habit(Base):
 
     __table_args__ = (
         Index("idx_habits_program_source", "program_id", "source_type", "source_ref_id"),
+        # Keyset pagination on (created_at, id)
+        Index("idx_habits_created_id", "created_at", "id"),
+        Index("idx_habits_program_created_id", "program_id", "created_at", "id"),
     )
 
 
@@ -96,12 +99,20 @@ class Enrollment(Base):
     # Relationships
     program = relationship("Program", back_populates="enrollments")
 
-    # Indexes for fast lookups
-    __table_args__ = (Index("idx_user_program", "user_id", "program_id", unique=True),)
+    # Indexes for fast lookups and keyset pagination on (created_at, id)
+    __table_args__ = (
+        Index("idx_user_program", "user_id", "program_id", unique=True),
+        Index("idx_enrollments_created_id", "created_at", "id"),
+        Index("idx_enrollments_user_created_id", "user_id", "created_at", "id"),
+    )
 
 
 class CheckIn(Base):
-    """Daily habit completion record."""
+    """Daily habit completion record.
+
+    On PostgreSQL the table is partitioned by month of check_in_date (migration
+    20261016_0008), with primary key (id, check_in_date) there.
+    """
 
     __tablename__ = "check_ins"
 
@@ -122,11 +133,19 @@ class CheckIn(Base):
     __table_args__ = (
         Index("idx_user_habit_date", "user_id", "habit_id", "check_in_date", unique=True),
         Index("idx_checkins_user_metric_date", "user_id", "metric_key", "check_in_date"),
+        # Keyset pagination on (check_in_date, id)
+        Index("idx_checkins_date_id", "check_in_date", "id"),
+        Index("idx_checkins_user_date_id", "user_id", "check_in_date", "id"),
+        Index("idx_checkins_habit_date_id", "habit_id", "check_in_date", "id"),
     )
 
 
 class PointsLedger(Base):
-    """Event-sourced point transactions (never mutate a total column)."""
+    """Event-sourced point transactions (never mutate a total column).
+
+    On PostgreSQL the table is partitioned by month of created_at (migration
+    20261016_0008), with primary key (id, created_at) there.
+    """
 
     __tablename__ = "points_ledger"
 
@@ -139,10 +158,77 @@ class PointsLedger(Base):
     )  # e.g., "check_in", "badge_earned", "bonus"
     event_reference_id = Column(Integer)  # e.g., check_in.id or badge.id
     description = Column(Text)
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    # Index for efficient balance calculations; the id suffix backs keyset pagination
+    __table_args__ = (
+        Index("idx_user_created", "user_id", "created_at"),
+        Index("idx_points_ledger_user_created_id", "user_id", "created_at", "id"),
+    )
+
+
+class UserPointsBalance(Base):
+    """Running points total per user and program, kept in step with the ledger."""
+
+    __tablename__ = "user_points_balance"
+
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    program_id = Column(Integer, primary_key=True, autoincrement=False)  # 0: no program
+    total_points = Column(Integer, nullable=False, default=0)
+    transaction_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class PointsCheckpoint(Base):
+    """Balance per user and program over the ledger entries created before a month starts."""
+
+    __tablename__ = "points_checkpoints"
+
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    program_id = Column(Integer, primary_key=True, autoincrement=False)  # 0: no program
+    checkpoint_at = Column(DateTime, primary_key=True)  # first instant of the month
+    total_points = Column(Integer, nullable=False)
+    transaction_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ArchivedPartition(Base):
+    """Month of a partitioned table the worker detached under its retention setting."""
+
+    __tablename__ = "archived_partitions"
+
+    table_name = Column(String(64), primary_key=True)  # points_ledger or check_ins
+    month = Column(Date, primary_key=True)  # first day of the month
+    detached_at = Column(DateTime, default=datetime.utcnow)
+
 
-    # Index for efficient balance calculations
-    __table_args__ = (Index("idx_user_created", "user_id", "created_at"),)
+class DailyRollup(Base):
+    """Check-ins, active users and points per day, program and habit, kept by the worker.
+
+    program_id 0 / habit_id 0 hold the totals over all programs / all habits of
+    the program, so each level has its own exact distinct user count. Check-ins
+    count on their check_in_date and points on the day they were awarded.
+    """
+
+    __tablename__ = "daily_rollups"
+
+    program_id = Column(Integer, primary_key=True, autoincrement=False)  # 0: all programs
+    habit_id = Column(Integer, primary_key=True, autoincrement=False)  # 0: all habits
+    day = Column(Date, primary_key=True, index=True)
+    check_ins = Column(Integer, nullable=False, default=0)
+    active_users = Column(Integer, nullable=False, default=0)
+    points_awarded = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class RollupWatermark(Base):
+    """Highest id of a source table already folded into daily_rollups."""
+
+    __tablename__ = "rollup_watermarks"
+
+    source = Column(String(64), primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
 
 
 class Badge(Base):
@@ -203,11 +289,15 @@ class Streak(Base):
     current_streak = Column(Integer, default=0)
     longest_streak = Column(Integer, default=0)
     last_check_in_date = Column(Date)
+    completed_runs = Column(json_type, nullable=True)  # [[first_day, last_day], ...] ordinals
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    # Index for fast lookups
-    __table_args__ = (Index("idx_user_habit_program", "user_id", "habit_id", "program_id"),)
+    # Index for fast lookups; one habit streak per user (target of streak upserts)
+    __table_args__ = (
+        Index("idx_user_habit_program", "user_id", "habit_id", "program_id"),
+        Index("idx_streaks_user_habit", "user_id", "habit_id", unique=True),
+    )
 
 
 class RewardConfig(Base):
@@ -223,6 +313,32 @@ class RewardConfig(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+class RewardGrant(Base):
+    """One awarded bonus; the unique key makes rule evaluation idempotent."""
+
+    __tablename__ = "reward_grants"
+
+    id = Column(Integer, primary_key=True, index=True)
+    rule_key = Column(String(100), nullable=False)  # RewardConfig.config_key
+    user_id = Column(Integer, nullable=False)
+    scope_id = Column(Integer, nullable=False)  # habit id for streaks, else program id
+    period = Column(Integer, nullable=False)  # day ordinal the grant is anchored to, or 0
+    program_id = Column(Integer, ForeignKey("programs.id"), nullable=True)
+    points = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index(
+            "idx_reward_grants_rule_user_scope_period",
+            "rule_key",
+            "user_id",
+            "scope_id",
+            "period",
+            unique=True,
+        ),
+    )
+
+
 class ProtocolTemplate(Base):
     """Versioned clinical protocol template."""
 
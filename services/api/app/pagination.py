@@ -0,0 +1,68 @@
+"""Keyset (cursor) pagination helpers for list endpoints.
+
+Lists are ordered on a sort column plus the primary key, and each page starts
+strictly after the last row of the previous one. Deep pages therefore cost one
+index range scan, the same as the first page. Cursors are opaque to clients and
+come back in the `X-Next-Cursor` response header, which is absent on the last
+page.
+"""
+import base64
+import json
+from datetime import date, datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps(
+        [value.isoformat() if isinstance(value, date) else value for value in values]
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: Sequence[Any]) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw_values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(raw_values, list) or len(raw_values) != len(columns):
+            raise ValueError("cursor does not match the ordering")
+        values = []
+        for column, value in zip(columns, raw_values):
+            python_type = column.type.python_type
+            if python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif python_type is date:
+                value = date.fromisoformat(value)
+            values.append(value)
+        return values
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset(query, columns: Sequence[Any], cursor: Optional[str], descending: bool = False):
+    """Order a Query or Select on `columns` and start after `cursor`."""
+    if cursor:
+        position = tuple_(*columns)
+        values = tuple_(*decode_cursor(cursor, columns))
+        query = query.where(position < values if descending else position > values)
+    return query.order_by(*(column.desc() if descending else column for column in columns))
+
+
+def page(
+    rows: Sequence[Any], columns: Sequence[Any], limit: int
+) -> Tuple[List[Any], Optional[str]]:
+    """Split `limit + 1` fetched rows into a page and the cursor for the next one."""
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([getattr(rows[-1], column.key) for column in columns])
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]) -> None:
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
@@ -0,0 +1,325 @@
+"""Points ledger appends and the materialized balances kept beside them.
+
+Every PointsLedger row is written through `append_ledger_entries`, which applies
+it to `user_points_balance` in the same transaction, so balance reads are
+primary-key lookups instead of SUMs over the ledger. Entries without a program
+count towards program_id 0 (NO_PROGRAM).
+
+`balance_as_of_query` answers "what was the balance on a given day" from the
+monthly checkpoints the worker writes to `points_checkpoints` plus the ledger
+entries since, so it reads at most a month of ledger per program.
+
+`reconcile_balances` compares balances with the ledger and can repair them.
+Once the worker has detached old ledger partitions (see `retention_horizon`),
+the ledger side starts from each key's checkpoint at the horizon instead of
+the first entry. It can also be run as `python -m app.points_ledger [--repair]`, which exits
+non-zero when it finds mismatches it did not repair.
+"""
+import argparse
+import logging
+import sys
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import and_, func, literal, or_, select, text, union_all
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, dialect_insert
+from app.leaderboards import record_points
+from app.models import ArchivedPartition, PointsCheckpoint, PointsLedger, UserPointsBalance
+from app.user_cache import invalidate_users
+
+NO_PROGRAM = 0
+
+logger = logging.getLogger(__name__)
+
+
+def append_ledger_entries(db: Session, entries: Iterable[Dict[str, Any]]) -> None:
+    """Insert ledger entries and add them to the balances and leaderboards.
+
+    The caller commits; leaderboards are only updated once it does.
+    """
+    now = datetime.utcnow()
+    rows = [
+        {
+            "user_id": entry["user_id"],
+            "program_id": entry.get("program_id"),
+            "points": entry["points"],
+            "event_type": entry["event_type"],
+            "event_reference_id": entry.get("event_reference_id"),
+            "description": entry.get("description"),
+            "created_at": entry.get("created_at") or now,
+        }
+        for entry in entries
+    ]
+    if not rows:
+        return
+    db.execute(dialect_insert(db, PointsLedger).values(rows))
+    _add_to_balances(db, rows, now)
+    record_points(db, rows)
+    invalidate_users(db, (row["user_id"] for row in rows))
+
+
+def _add_to_balances(db: Session, rows: List[Dict[str, Any]], now: datetime) -> None:
+    totals: Dict[tuple, List[int]] = {}
+    for row in rows:
+        key = (row["user_id"], row["program_id"] or NO_PROGRAM)
+        total = totals.setdefault(key, [0, 0])
+        total[0] += row["points"]
+        total[1] += 1
+
+    balance = UserPointsBalance.__table__
+    # Sorted keys keep lock order stable between concurrent multi-row upserts
+    stmt = dialect_insert(db, UserPointsBalance).values(
+        [
+            {
+                "user_id": user_id,
+                "program_id": program_id,
+                "total_points": points,
+                "transaction_count": count,
+                "updated_at": now,
+            }
+            for (user_id, program_id), (points, count) in sorted(totals.items())
+        ]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "program_id"],
+        set_={
+            "total_points": balance.c.total_points + stmt.excluded.total_points,
+            "transaction_count": balance.c.transaction_count + stmt.excluded.transaction_count,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+    db.execute(stmt)
+
+
+def balance_query(user_id: int, program_id: Optional[int] = None):
+    """Select (total_points, transaction_count) for a user, optionally one program."""
+    query = select(
+        func.coalesce(func.sum(UserPointsBalance.total_points), 0).label("total_points"),
+        func.coalesce(func.sum(UserPointsBalance.transaction_count), 0).label(
+            "transaction_count"
+        ),
+    ).where(UserPointsBalance.user_id == user_id)
+    if program_id is not None:
+        query = query.where(UserPointsBalance.program_id == program_id)
+    return query
+
+
+def balance_as_of_query(user_id: int, as_of: date, program_id: Optional[int] = None):
+    """Select (total_points, transaction_count) over entries created up to the end of `as_of`.
+
+    Each program starts from its latest checkpoint at or before that moment and
+    adds the ledger entries created since; programs without one scan from the start.
+    """
+    before = datetime.combine(as_of + timedelta(days=1), time.min)
+    program_key = func.coalesce(PointsLedger.program_id, NO_PROGRAM)
+
+    latest = select(
+        PointsCheckpoint.program_id,
+        func.max(PointsCheckpoint.checkpoint_at).label("checkpoint_at"),
+    ).where(PointsCheckpoint.user_id == user_id, PointsCheckpoint.checkpoint_at <= before)
+    delta = (
+        select(func.sum(PointsLedger.points), func.count(PointsLedger.id))
+        .where(PointsLedger.user_id == user_id, PointsLedger.created_at < before)
+    )
+    if program_id is not None:
+        latest = latest.where(PointsCheckpoint.program_id == program_id)
+        delta = delta.where(program_key == program_id)
+    latest = latest.group_by(PointsCheckpoint.program_id).subquery()
+
+    checkpoints = (
+        select(
+            PointsCheckpoint.program_id,
+            PointsCheckpoint.checkpoint_at,
+            PointsCheckpoint.total_points,
+            PointsCheckpoint.transaction_count,
+        )
+        .join(
+            latest,
+            and_(
+                PointsCheckpoint.program_id == latest.c.program_id,
+                PointsCheckpoint.checkpoint_at == latest.c.checkpoint_at,
+            ),
+        )
+        .where(PointsCheckpoint.user_id == user_id)
+        .cte("checkpoints")
+    )
+    delta = delta.outerjoin(checkpoints, checkpoints.c.program_id == program_key).where(
+        or_(
+            checkpoints.c.checkpoint_at.is_(None),
+            PointsLedger.created_at >= checkpoints.c.checkpoint_at,
+        )
+    )
+    parts = union_all(
+        select(checkpoints.c.total_points, checkpoints.c.transaction_count), delta
+    ).subquery()
+    return select(
+        func.coalesce(func.sum(parts.c.total_points), 0).label("total_points"),
+        func.coalesce(func.sum(parts.c.transaction_count), 0).label("transaction_count"),
+    )
+
+
+def retention_horizon(db: Session, table: str) -> Optional[date]:
+    """First day after the newest month of `table` the worker detached, if any.
+
+    The worker only detaches ledger months once the checkpoints cover them, so
+    rows before the horizon are summed up in `points_checkpoints`.
+    """
+    month = db.execute(
+        select(func.max(ArchivedPartition.month)).where(ArchivedPartition.table_name == table)
+    ).scalar()
+    if month is None:
+        return None
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def reconcile_balances(
+    db: Session, repair: bool = False, user_ids: Optional[Sequence[int]] = None
+) -> List[Dict[str, Any]]:
+    """Return balances that disagree with the ledger, rewriting them if `repair`.
+
+    `user_ids` limits the check to those users. On PostgreSQL, repairing locks
+    the balance table first, or only the users' balance rows when limited.
+    Appends in flight wait for the lock and apply their delta after the repair,
+    so none is lost; only a user's very first balance row for a program can
+    race with a repair that limits itself to that user.
+
+    Past the retention horizon, a key's ledger total is its latest checkpoint at
+    or before the horizon plus the entries created since.
+    """
+    if repair and db.get_bind().dialect.name == "postgresql":
+        if user_ids is None:
+            db.execute(text("LOCK TABLE user_points_balance IN SHARE ROW EXCLUSIVE MODE"))
+        else:
+            db.execute(
+                select(UserPointsBalance.user_id)
+                .where(UserPointsBalance.user_id.in_(user_ids))
+                .with_for_update()
+            )
+
+    program_key = func.coalesce(PointsLedger.program_id, NO_PROGRAM)
+    entries = select(
+        PointsLedger.user_id,
+        program_key.label("program_id"),
+        PointsLedger.points.label("total_points"),
+        literal(1).label("transaction_count"),
+    )
+    balance = select(UserPointsBalance.__table__)
+    if user_ids is not None:
+        entries = entries.where(PointsLedger.user_id.in_(user_ids))
+        balance = balance.where(UserPointsBalance.user_id.in_(user_ids))
+
+    horizon = retention_horizon(db, PointsLedger.__tablename__)
+    if horizon is not None:
+        since = datetime.combine(horizon, time.min)
+        latest = select(
+            PointsCheckpoint.user_id,
+            PointsCheckpoint.program_id,
+            func.max(PointsCheckpoint.checkpoint_at).label("checkpoint_at"),
+        ).where(PointsCheckpoint.checkpoint_at <= since)
+        if user_ids is not None:
+            latest = latest.where(PointsCheckpoint.user_id.in_(user_ids))
+        latest = latest.group_by(PointsCheckpoint.user_id, PointsCheckpoint.program_id).subquery()
+        checkpoints = select(
+            PointsCheckpoint.user_id,
+            PointsCheckpoint.program_id,
+            PointsCheckpoint.total_points,
+            PointsCheckpoint.transaction_count,
+        ).join(
+            latest,
+            and_(
+                PointsCheckpoint.user_id == latest.c.user_id,
+                PointsCheckpoint.program_id == latest.c.program_id,
+                PointsCheckpoint.checkpoint_at == latest.c.checkpoint_at,
+            ),
+        )
+        entries = union_all(checkpoints, entries.where(PointsLedger.created_at >= since))
+    entries = entries.subquery()
+    ledger = (
+        select(
+            entries.c.user_id,
+            entries.c.program_id,
+            func.sum(entries.c.total_points).label("total_points"),
+            func.sum(entries.c.transaction_count).label("transaction_count"),
+        )
+        .group_by(entries.c.user_id, entries.c.program_id)
+        .subquery()
+    )
+    balance = balance.subquery()
+    query = (
+        select(
+            func.coalesce(ledger.c.user_id, balance.c.user_id).label("user_id"),
+            func.coalesce(ledger.c.program_id, balance.c.program_id).label("program_id"),
+            func.coalesce(ledger.c.total_points, 0).label("ledger_points"),
+            func.coalesce(ledger.c.transaction_count, 0).label("ledger_count"),
+            func.coalesce(balance.c.total_points, 0).label("balance_points"),
+            func.coalesce(balance.c.transaction_count, 0).label("balance_count"),
+        )
+        .select_from(
+            ledger.join(
+                balance,
+                and_(
+                    ledger.c.user_id == balance.c.user_id,
+                    ledger.c.program_id == balance.c.program_id,
+                ),
+                full=True,
+            )
+        )
+        .where(
+            or_(
+                func.coalesce(ledger.c.total_points, 0)
+                != func.coalesce(balance.c.total_points, 0),
+                func.coalesce(ledger.c.transaction_count, 0)
+                != func.coalesce(balance.c.transaction_count, 0),
+            )
+        )
+    )
+    mismatches = [dict(row) for row in db.execute(query).mappings()]
+
+    if repair and mismatches:
+        now = datetime.utcnow()
+        stmt = dialect_insert(db, UserPointsBalance).values(
+            [
+                {
+                    "user_id": row["user_id"],
+                    "program_id": row["program_id"],
+                    "total_points": row["ledger_points"],
+                    "transaction_count": row["ledger_count"],
+                    "updated_at": now,
+                }
+                for row in mismatches
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "program_id"],
+            set_={
+                "total_points": stmt.excluded.total_points,
+                "transaction_count": stmt.excluded.transaction_count,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+        db.execute(stmt)
+        invalidate_users(db, (row["user_id"] for row in mismatches))
+    return mismatches
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Verify user_points_balance against the ledger.")
+    parser.add_argument("--repair", action="store_true", help="rewrite mismatching balances")
+    args = parser.parse_args()
+    db = SessionLocal()
+    try:
+        mismatches = reconcile_balances(db, repair=args.repair)
+        db.commit()
+    finally:
+        db.close()
+    for row in mismatches:
+        logger.warning(
+            f"user {row['user_id']} program {row['program_id']}: "
+            f"balance {row['balance_points']} ({row['balance_count']} entries), "
+            f"ledger {row['ledger_points']} ({row['ledger_count']} entries)"
+        )
+    logger.info(f"{len(mismatches)} mismatching balances" + (" repaired" if args.repair else ""))
+    sys.exit(1 if mismatches and not args.repair else 0)
@@ -6,6 +6,8 @@ from typing import Any, Dict, List, Optional
 
 from sqlalchemy.orm import Session
 
+from app.habit_cache import invalidate_habits
+from app.points_ledger import append_ledger_entries
 from app.models import (
     ArtifactDefinition,
     ArtifactInstance,
@@ -19,6 +21,7 @@ from app.models import (
     ProtocolRun,
     RewardConfig,
 )
+from app.user_cache import invalidate_users
 
 
 MILESTONE_DEFAULT_POINTS = {
@@ -85,6 +88,7 @@ def ensure_program_for_run(db: Session, run: ProtocolRun) -> Program:
     )
     if not enrollment:
         db.add(Enrollment(user_id=run.user_id, program_id=program.id, is_active=True))
+        invalidate_users(db, [run.user_id])
 
     return program
 
@@ -120,6 +124,7 @@ def generate_habits_from_interventions(db: Session, run: ProtocolRun) -> List[in
     )
 
     generated_habits: List[int] = []
+    created_any = False
     for template in templates:
         if template.type != "habit":
             continue
@@ -162,7 +167,10 @@ def generate_habits_from_interventions(db: Session, run: ProtocolRun) -> List[in
             )
         )
         generated_habits.append(habit.id)
+        created_any = True
 
+    if created_any:
+        invalidate_habits(db)
     return generated_habits
 
 
@@ -187,15 +195,18 @@ def award_protocol_milestone(db: Session, run: ProtocolRun, milestone_key: str)
     config_key = f"protocol_milestone_{milestone_key}_points"
     config = db.query(RewardConfig).filter(RewardConfig.config_key == config_key).first()
     points = config.config_value if config else MILESTONE_DEFAULT_POINTS.get(milestone_key, 20)
-    db.add(
-        PointsLedger(
-            user_id=run.user_id,
-            program_id=run.protocol_template.default_program_id,
-            points=points,
-            event_type=event_type,
-            event_reference_id=run.id,
-            description=description,
-        )
+    append_ledger_entries(
+        db,
+        [
+            {
+                "user_id": run.user_id,
+                "program_id": run.protocol_template.default_program_id,
+                "points": points,
+                "event_type": event_type,
+                "event_reference_id": run.id,
+                "description": description,
+            }
+        ],
     )
 
 
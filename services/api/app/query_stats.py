@@ -0,0 +1,80 @@
+"""Per-request SQL statement counts and database time.
+
+Engine-level cursor events add every statement, sync or async, to the stats of
+the request running it, which are tracked in a context variable.
+QueryStatsMiddleware reports them in the X-DB-Query-Count and X-DB-Time-Ms
+response headers, and logs requests that exceed QUERY_COUNT_WARNING. This is
+on outside production (APP_ENV=production) and off in production.
+Statements run while a streaming response is being sent come after the
+headers and are not counted.
+
+Tests use the headers to hold endpoints to a query budget (see the
+`query_budget` fixture), so an N+1 regression fails the suite.
+"""
+import logging
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+
+QUERY_STATS_ENABLED = os.getenv("APP_ENV") != "production"
+QUERY_COUNT_WARNING = int(os.getenv("QUERY_COUNT_WARNING", "20"))
+QUERY_COUNT_HEADER = "X-DB-Query-Count"
+QUERY_TIME_HEADER = "X-DB-Time-Ms"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    seconds: float = 0.0
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        context._query_stats_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _record(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = getattr(context, "_query_stats_started", None)
+    if stats is not None and started is not None:
+        stats.count += 1
+        stats.seconds += time.perf_counter() - started
+
+
+class QueryStatsMiddleware(BaseHTTPMiddleware):
+    """Add the request's statement count and database time as response headers."""
+
+    async def dispatch(self, request: Request, call_next) -> Response:
+        if not QUERY_STATS_ENABLED:
+            return await call_next(request)
+        # The route runs in a copy of this context (task or threadpool), so it
+        # mutates the same QueryStats object
+        stats = QueryStats()
+        token = _current.set(stats)
+        try:
+            response = await call_next(request)
+        finally:
+            _current.reset(token)
+        response.headers[QUERY_COUNT_HEADER] = str(stats.count)
+        response.headers[QUERY_TIME_HEADER] = f"{stats.seconds * 1000:.1f}"
+        if stats.count > QUERY_COUNT_WARNING:
+            logger.warning(
+                f"{request.method} {request.url.path} ran {stats.count} SQL statements "
+                f"({stats.seconds * 1000:.1f} ms)"
+            )
+        return response
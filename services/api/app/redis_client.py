@@ -0,0 +1,51 @@
+"""Shared Redis clients for caches and cross-replica coordination.
+
+Redis is optional: when REDIS_URL is unset (tests, scripts) the getters return
+None and callers fall back to going straight to Postgres.
+"""
+import os
+from functools import lru_cache
+from typing import Optional
+
+import redis
+import redis.asyncio as redis_async
+
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_SOCKET_TIMEOUT_SECONDS = float(os.getenv("REDIS_SOCKET_TIMEOUT_SECONDS", "0.5"))
+
+
+@lru_cache(maxsize=1)
+def get_redis() -> Optional[redis.Redis]:
+    """Synchronous client for sync route handlers and helpers."""
+    if not REDIS_URL:
+        return None
+    return redis.Redis.from_url(
+        REDIS_URL,
+        socket_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+        socket_connect_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+        decode_responses=True,
+    )
+
+
+def new_subscriber_redis() -> Optional[redis.Redis]:
+    """Dedicated client for pub/sub subscriptions and blocking pops (no read timeout)."""
+    if not REDIS_URL:
+        return None
+    return redis.Redis.from_url(
+        REDIS_URL,
+        socket_connect_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+        health_check_interval=30,
+        decode_responses=True,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_async_redis() -> Optional[redis_async.Redis]:
+    """asyncio client for middleware and async route handlers."""
+    if not REDIS_URL:
+        return None
+    return redis_async.Redis.from_url(
+        REDIS_URL,
+        socket_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+        socket_connect_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+    )
@@ -0,0 +1,410 @@
+"""Bonus rules driven by RewardConfig, evaluated incrementally per check-in.
+
+Rules, keyed like `DEFAULT_REWARDS` below:
+- ``streak_<N>_days_bonus``: once per maximal run of at least N consecutive
+  completed days of a habit.
+- ``first_check_in_bonus``: once per user and program. Only a habit's first
+  completed day can be the user's first check-in in the program, so other
+  events skip this rule without a statement. Those that do not skip it still
+  lose it to an earlier run of another habit of the program, so a user with
+  history from before the rule existed earns nothing for starting a new habit.
+- ``perfect_week_bonus``: once per user, program and Monday-to-Sunday week in
+  which every active habit of the program was completed every day.
+
+Each check-in event carries the streak run its day belongs to after it was
+added. Rules therefore only read the grants and streaks of the affected user,
+habit and program, never the check-in history. Every award is a RewardGrant
+with a unique (rule, user, scope, period) key plus a PointsLedger row that
+references it, so re-evaluating an event awards nothing twice.
+
+`backfill_rewards` replays the same rules over the runs stored on existing
+streaks, one chunk at a time. It also catches perfect weeks that two concurrent
+check-ins completed without seeing each other.
+"""
+import argparse
+import logging
+import re
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, call_after_commit, dialect_insert
+from app.habit_cache import get_habit_metas
+from app.models import Habit, RewardConfig, RewardGrant, Streak
+from app.points_ledger import append_ledger_entries
+from app.streak_engine import HabitStreak, run_containing
+
+STREAK_RULE = re.compile(r"^streak_(\d+)_days_bonus$")
+FIRST_CHECK_IN_RULE = "first_check_in_bonus"
+PERFECT_WEEK_RULE = "perfect_week_bonus"
+REWARD_CONFIG_TTL_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+# Default reward configuration
+DEFAULT_REWARDS = [
+    {
+        "config_key": "check_in_points",
+        "config_value": 10,
+        "description": "Pontos por completar um check-in diário"
+    },
+    {
+        "config_key": "streak_3_days_bonus",
+        "config_value": 20,
+        "description": "Bônus por manter 3 dias consecutivos"
+    },
+    {
+        "config_key": "streak_7_days_bonus",
+        "config_value": 50,
+        "description": "Bônus por manter 7 dias consecutivos"
+    },
+    {
+        "config_key": "streak_14_days_bonus",
+        "config_value": 100,
+        "description": "Bônus por manter 14 dias consecutivos"
+    },
+    {
+        "config_key": "streak_30_days_bonus",
+        "config_value": 250,
+        "description": "Bônus por manter 30 dias consecutivos"
+    },
+    {
+        "config_key": "program_completion_bonus",
+        "config_value": 500,
+        "description": "Bônus por completar um programa inteiro"
+    },
+    {
+        "config_key": "first_check_in_bonus",
+        "config_value": 25,
+        "description": "Bônus pelo primeiro check-in em um programa"
+    },
+    {
+        "config_key": "perfect_week_bonus",
+        "config_value": 100,
+        "description": "Bônus por completar todos os hábitos durante 7 dias"
+    }
+]
+
+GrantKey = Tuple[str, int, int, int]  # (rule_key, user_id, scope_id, period)
+
+
+@dataclass(frozen=True)
+class CheckInEvent:
+    """A completed day and the streak run that contains it."""
+
+    user_id: int
+    habit_id: int
+    program_id: int
+    day: int  # date ordinal
+    run: Tuple[int, int]  # [first_day, last_day] ordinals
+    first_day: bool = True  # the habit's streak had no completed day before
+
+
+_reward_values: Optional[Tuple[float, Dict[str, int]]] = None
+
+
+def reward_values(db: Session) -> Dict[str, int]:
+    """Configured bonus points by key, falling back to the defaults when unset."""
+    global _reward_values
+    if _reward_values and time.monotonic() - _reward_values[0] < REWARD_CONFIG_TTL_SECONDS:
+        return _reward_values[1]
+    values = dict(db.query(RewardConfig.config_key, RewardConfig.config_value).all())
+    if not values:
+        values = {default["config_key"]: default["config_value"] for default in DEFAULT_REWARDS}
+    _reward_values = (time.monotonic(), values)
+    return values
+
+
+def invalidate_reward_config(db: Session) -> None:
+    """Re-read the reward configuration once `db` commits its changes."""
+
+    def clear():
+        global _reward_values
+        _reward_values = None
+
+    call_after_commit(db, clear)
+
+
+def week_start(day: int) -> int:
+    """Ordinal of the Monday on or before `day` (ordinal 1 was a Monday)."""
+    return day - (day - 1) % 7
+
+
+def apply_check_in_rewards(db: Session, events: Iterable[CheckInEvent]) -> int:
+    """Award every bonus the events complete; returns how many were granted.
+
+    Issues at most one grant lookup, one streak lookup for first check-ins, one
+    habit and one streak lookup for perfect weeks, one grant insert and one
+    ledger insert. The caller owns the transaction.
+    """
+    events = list(events)
+    if not events:
+        return 0
+    db.flush()  # pending check-in, ledger and streak changes must be visible here
+    values = reward_values(db)
+    grants: Dict[GrantKey, Dict[str, int]] = {}
+
+    _streak_grants(db, events, values, grants)
+
+    _first_check_in_grants(db, events, values, grants)
+    _perfect_week_grants(db, events, values, grants)
+    return _insert_grants(db, grants)
+
+
+def _streak_grants(db: Session, events, values, grants) -> None:
+    rules = []
+    for key, points in values.items():
+        match = STREAK_RULE.match(key)
+        if match and points > 0:
+            rules.append((int(match.group(1)), key, points))
+    if not rules:
+        return
+
+    shortest = min(length for length, _, _ in rules)
+    candidates = [event for event in events if event.run[1] - event.run[0] + 1 >= shortest]
+    if not candidates:
+        return
+
+    # A run already holding a grant for the rule (e.g. before two runs merged)
+    # must not earn it again.
+    existing = defaultdict(list)
+    rows = db.query(
+        RewardGrant.rule_key, RewardGrant.user_id, RewardGrant.scope_id, RewardGrant.period
+    ).filter(
+        RewardGrant.rule_key.in_([key for _, key, _ in rules]),
+        RewardGrant.user_id.in_({event.user_id for event in candidates}),
+        RewardGrant.scope_id.in_({event.habit_id for event in candidates}),
+    )
+    for rule_key, user_id, scope_id, period in rows:
+        existing[(rule_key, user_id, scope_id)].append(period)
+
+    for event in candidates:
+        first_day, last_day = event.run
+        for length, key, points in rules:
+            if last_day - first_day + 1 < length:
+                continue
+            granted = existing[(key, event.user_id, event.habit_id)]
+            if any(first_day <= period <= last_day for period in granted):
+                continue
+            grants.setdefault(
+                (key, event.user_id, event.habit_id, first_day + length - 1),
+                {"program_id": event.program_id, "points": points},
+            )
+
+
+def _first_check_in_grants(db: Session, events, values, grants) -> None:
+    points = values.get(FIRST_CHECK_IN_RULE, 0)
+    candidates = [event for event in events if event.first_day]
+    if points <= 0 or not candidates:
+        return
+
+    # Earliest completed day of each habit the users have in these programs; a
+    # streak row without runs holds history the legacy counters no longer show.
+    earliest = defaultdict(dict)
+    streaks = (
+        db.query(
+            Streak.user_id,
+            Streak.habit_id,
+            Habit.program_id,
+            Streak.current_streak,
+            Streak.longest_streak,
+            Streak.last_check_in_date,
+            Streak.completed_runs,
+        )
+        .join(Habit, Habit.id == Streak.habit_id)
+        .filter(
+            Streak.user_id.in_({event.user_id for event in candidates}),
+            Habit.program_id.in_({event.program_id for event in candidates}),
+        )
+    )
+    for streak in streaks:
+        runs = HabitStreak.from_row(streak).runs
+        earliest[(streak.user_id, streak.program_id)][streak.habit_id] = (
+            runs[0][0] if runs else None
+        )
+
+    for event in candidates:
+        if any(
+            first_day is None or first_day < event.run[0]
+            for habit_id, first_day in earliest[(event.user_id, event.program_id)].items()
+            if habit_id != event.habit_id
+        ):
+            continue
+        grants.setdefault(
+            (FIRST_CHECK_IN_RULE, event.user_id, event.program_id, 0),
+            {"program_id": event.program_id, "points": points},
+        )
+
+
+def _perfect_week_grants(db: Session, events, values, grants) -> None:
+    points = values.get(PERFECT_WEEK_RULE, 0)
+    if points <= 0:
+        return
+
+    weeks = set()
+    for event in events:
+        monday = week_start(event.day)
+        if event.run[0] <= monday and event.run[1] >= monday + 6:
+            weeks.add((event.user_id, event.program_id, monday))
+    if not weeks:
+        return
+
+    habits_by_program = defaultdict(set)
+    for habit_id, program_id in db.query(Habit.id, Habit.program_id).filter(
+        Habit.program_id.in_({program_id for _, program_id, _ in weeks}), Habit.is_active
+    ):
+        habits_by_program[program_id].add(habit_id)
+
+    habit_ids = set().union(*habits_by_program.values())
+    runs = {}
+    if habit_ids:
+        streaks = db.query(
+            Streak.user_id,
+            Streak.habit_id,
+            Streak.current_streak,
+            Streak.longest_streak,
+            Streak.last_check_in_date,
+            Streak.completed_runs,
+        ).filter(
+            Streak.user_id.in_({user_id for user_id, _, _ in weeks}),
+            Streak.habit_id.in_(habit_ids),
+        )
+        for streak in streaks:
+            runs[(streak.user_id, streak.habit_id)] = HabitStreak.from_row(streak).runs
+
+    for user_id, program_id, monday in weeks:
+        program_habits = habits_by_program[program_id]
+        if program_habits and all(
+            _covers(runs.get((user_id, habit_id), []), monday, monday + 6)
+            for habit_id in program_habits
+        ):
+            grants.setdefault(
+                (PERFECT_WEEK_RULE, user_id, program_id, monday),
+                {"program_id": program_id, "points": points},
+            )
+
+
+def _covers(runs, first_day: int, last_day: int) -> bool:
+    run = run_containing(runs, first_day)
+    return run is not None and run[1] >= last_day
+
+
+def _insert_grants(db: Session, grants: Dict[GrantKey, Dict[str, int]]) -> int:
+    if not grants:
+        return 0
+    now = datetime.utcnow()
+    stmt = (
+        dialect_insert(db, RewardGrant)
+        .values(
+            [
+                {
+                    "rule_key": rule_key,
+                    "user_id": user_id,
+                    "scope_id": scope_id,
+                    "period": period,
+                    **grant,
+                    "created_at": now,
+                }
+                for (rule_key, user_id, scope_id, period), grant in grants.items()
+            ]
+        )
+        .on_conflict_do_nothing(index_elements=["rule_key", "user_id", "scope_id", "period"])
+        .returning(
+            RewardGrant.id,
+            RewardGrant.rule_key,
+            RewardGrant.user_id,
+            RewardGrant.program_id,
+            RewardGrant.points,
+        )
+    )
+    inserted = db.execute(stmt).all()
+    append_ledger_entries(
+        db,
+        [
+            {
+                "user_id": grant.user_id,
+                "program_id": grant.program_id,
+                "points": grant.points,
+                "event_type": grant.rule_key,
+                "event_reference_id": grant.id,
+                "description": f"Bônus: {grant.rule_key}",
+                "created_at": now,
+            }
+            for grant in inserted
+        ],
+    )
+    return len(inserted)
+
+
+def _events_for_runs(
+    user_id: int, habit_id: int, program_id: int, runs
+) -> List[CheckInEvent]:
+    """One event per run plus one per full week inside it, for the backfill."""
+    events = []
+    for first_day, last_day in runs:
+        run = (first_day, last_day)
+        events.append(CheckInEvent(user_id, habit_id, program_id, last_day, run))
+        monday = week_start(first_day)
+        if monday < first_day:
+            monday += 7
+        while monday + 6 <= last_day:
+            events.append(CheckInEvent(user_id, habit_id, program_id, monday, run))
+            monday += 7
+    return events
+
+
+def backfill_rewards(db: Session, chunk_size: int = 500) -> int:
+    """Award bonuses implied by existing streaks, committing after each chunk."""
+    total = 0
+    last_id = 0
+    while True:
+        streaks = (
+            db.query(
+                Streak.id,
+                Streak.user_id,
+                Streak.habit_id,
+                Streak.current_streak,
+                Streak.longest_streak,
+                Streak.last_check_in_date,
+                Streak.completed_runs,
+            )
+            .filter(Streak.id > last_id)
+            .order_by(Streak.id)
+            .limit(chunk_size)
+            .all()
+        )
+        if not streaks:
+            return total
+
+        habits = get_habit_metas(db, {streak.habit_id for streak in streaks})
+        events = []
+        for streak in streaks:
+            if streak.habit_id in habits:
+                events.extend(
+                    _events_for_runs(
+                        streak.user_id,
+                        streak.habit_id,
+                        habits[streak.habit_id].program_id,
+                        HabitStreak.from_row(streak).runs,
+                    )
+                )
+        total += apply_check_in_rewards(db, events)
+        db.commit()
+        last_id = streaks[-1].id
+        logger.info(f"Backfilled rewards through streak {last_id} ({total} granted)")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Award bonuses implied by existing streaks.")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args()
+    db = SessionLocal()
+    try:
+        backfill_rewards(db, args.chunk_size)
+    finally:
+        db.close()
@@ -1,27 +1,96 @@
-"""Admin analytics endpoints for system-wide metrics."""
-from typing import Dict, Any
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, cast, Date
-from datetime import datetime, timedelta
-
-from app.database import get_db
+"""Admin analytics endpoints for system-wide metrics.
+
+The overview's check-in counts and the daily trends come from daily_rollups,
+which the worker keeps up to date within about a minute (ROLLUP_SETTLE_SECONDS),
+so their cost does not grow with the number of check-ins or the length of the
+period. Every endpoint is served through the analytics cache (app.analytics_cache).
+"""
+from typing import Any, Awaitable, Callable, Dict, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, and_, select
+from datetime import date, datetime, time, timedelta
+
+from app.analytics_cache import CACHE_HEADER, analytics_cache
+from app.database import DB_SOURCE_HEADER, get_async_read_db, run_concurrently, wants_primary
 from app.auth import require_admin
+from app.cohort_retention import (
+    MAX_WEEKS,
+    RetentionMatrix,
+    cohort_check_ins_query,
+    cohort_enrollments_query,
+)
+from app.metric_rollups import metric_series_query, rollup_series
 from app.models import (
     User,
     Program,
     Enrollment,
     CheckIn,
+    DailyRollup,
+    Habit,
     PointsLedger,
     UserBadge,
     Badge,
+    UserPointsBalance,
 )
+from app.schemas import CohortRetentionResponse, MetricRollupResponse
 
 router = APIRouter(prefix="/api/v1/admin/analytics", tags=["admin", "analytics"])
 
+COHORT_CHECK_IN_PARTITION = 50000
+
+
+def _count(column):
+    return select(func.count(column))
+
+
+def _scalar(query, name: str):
+    return query.scalar_subquery().label(name)
+
+
+async def _fetch_all(session: AsyncSession, query):
+    return (await session.execute(query)).all()
+
+
+async def _cached(
+    request: Request,
+    response: Response,
+    db: AsyncSession,
+    load: Callable[[AsyncSession], Awaitable[Any]],
+):
+    """Serve `load` from the analytics cache, keyed by database, path and query.
+
+    The computation gets its own session on `db`'s engine, because it may be
+    shared with other requests or run after this one has finished. A request
+    that asked for the primary wants data at least as new as its own writes,
+    so it bypasses the cache.
+    """
+
+    async def compute():
+        async with AsyncSession(bind=db.bind, expire_on_commit=False) as session:
+            return await load(session)
+
+    if wants_primary(request):
+        response.headers[CACHE_HEADER] = "BYPASS"
+        return await compute()
+    # Replica and primary entries are kept apart: the replica may be behind
+    source = response.headers.get(DB_SOURCE_HEADER, "primary")
+    params = sorted(request.query_params.multi_items())
+    query = "&".join(f"{name}={value}" for name, value in params)
+    value, served = await analytics_cache.get(f"{source}:{request.url.path}?{query}", compute)
+    response.headers[CACHE_HEADER] = served
+    return value
+
+
+def _rollups(program_id: int = 0, habit_id: int = 0):
+    """Filter for one level of daily_rollups; 0 means all programs / all habits."""
+    return and_(DailyRollup.program_id == program_id, DailyRollup.habit_id == habit_id)
+
 
 @router.get("/overview", dependencies=[Depends(require_admin)])
-def get_analytics_overview(db: Session = Depends(get_db)) -> Dict[str, Any]:
+async def get_analytics_overview(
+    request: Request, response: Response, db: AsyncSession = Depends(get_async_read_db)
+) -> Dict[str, Any]:
     """Get system-wide analytics overview.
 
     Returns key metrics:
@@ -32,91 +101,96 @@ def get_analytics_overview(db: Session = Depends(get_db)) -> Dict[str, Any]:
     - Total points awarded
     - Average engagement rate
     """
-    # Total patients
-    total_patients = db.query(User).filter(User.role == "patient").count()
-
-    # Total and active programs
-    total_programs = db.query(Program).count()
-    active_programs = db.query(Program).filter(Program.is_active).count()
-
-    # Total check-ins
-    total_checkins = db.query(CheckIn).count()
-
-    # Total points awarded
-    total_points = db.query(func.sum(PointsLedger.points)).scalar() or 0
-
-    # Total enrollments
-    total_enrollments = db.query(Enrollment).filter(Enrollment.is_active).count()
-
-    # Total badges awarded
-    total_badges_awarded = db.query(UserBadge).count()
-
-    # Check-ins in last 7 days
-    week_ago = datetime.utcnow() - timedelta(days=7)
-    checkins_last_week = (
-        db.query(CheckIn)
-        .filter(CheckIn.created_at >= week_ago)
-        .count()
-    )
+    return await _cached(request, response, db, _overview)
 
-    # Check-ins in last 30 days
-    month_ago = datetime.utcnow() - timedelta(days=30)
-    checkins_last_month = (
-        db.query(CheckIn)
-        .filter(CheckIn.created_at >= month_ago)
-        .count()
-    )
 
-    # Average engagement (check-ins per active enrollment per week)
-    avg_checkins_per_enrollment = (
-        (checkins_last_week / total_enrollments * 100)
-        if total_enrollments > 0
-        else 0
-    )
+async def _overview(db: AsyncSession) -> Dict[str, Any]:
+    # Windows are on check_in_date, the partition key of check_ins, so the top
+    # users query only scans the partitions of the last month
+    week_ago = datetime.utcnow().date() - timedelta(days=7)
+    month_ago = datetime.utcnow().date() - timedelta(days=30)
 
     # Most active users (top 5 by check-ins in last 30 days)
-    top_users = (
-        db.query(
+    top_users_query = (
+        select(
             CheckIn.user_id,
             User.full_name,
             func.count(CheckIn.id).label("checkin_count")
         )
         .join(User, User.id == CheckIn.user_id)
-        .filter(CheckIn.created_at >= month_ago)
+        .where(CheckIn.check_in_date >= month_ago)
         .group_by(CheckIn.user_id, User.full_name)
         .order_by(func.count(CheckIn.id).desc())
         .limit(5)
-        .all()
     )
 
     # Most popular programs (by enrollment count)
-    top_programs = (
-        db.query(
+    top_programs_query = (
+        select(
             Program.id,
             Program.name,
             func.count(Enrollment.id).label("enrollment_count")
         )
         .join(Enrollment, Enrollment.program_id == Program.id)
-        .filter(Enrollment.is_active)
+        .where(Enrollment.is_active)
         .group_by(Program.id, Program.name)
         .order_by(func.count(Enrollment.id).desc())
         .limit(5)
-        .all()
+    )
+
+    # Check-in totals, all time and for both windows, from the system-wide rollups
+    checkin_totals = (
+        select(
+            func.coalesce(func.sum(DailyRollup.check_ins), 0).label("total_checkins"),
+            func.coalesce(
+                func.sum(DailyRollup.check_ins).filter(DailyRollup.day >= week_ago), 0
+            ).label("checkins_last_week"),
+            func.coalesce(
+                func.sum(DailyRollup.check_ins).filter(DailyRollup.day >= month_ago), 0
+            ).label("checkins_last_month"),
+        )
+        .where(_rollups())
+        .subquery()
+    )
+    # Every count is one scalar subquery of a single statement
+    totals_query = select(
+        checkin_totals,
+        _scalar(_count(User.id).where(User.role == "patient"), "total_patients"),
+        _scalar(_count(Program.id), "total_programs"),
+        _scalar(_count(Program.id).where(Program.is_active), "active_programs"),
+        _scalar(select(func.sum(UserPointsBalance.total_points)), "total_points"),
+        _scalar(_count(Enrollment.id).where(Enrollment.is_active), "total_enrollments"),
+        _scalar(_count(UserBadge.id), "total_badges_awarded"),
+    )
+
+    # The three reads are independent, so they run on their own connections concurrently
+    [totals], top_users, top_programs = await run_concurrently(
+        db,
+        lambda session: _fetch_all(session, totals_query),
+        lambda session: _fetch_all(session, top_users_query),
+        lambda session: _fetch_all(session, top_programs_query),
+    )
+
+    # Average engagement (check-ins per active enrollment per week)
+    avg_checkins_per_enrollment = (
+        (totals.checkins_last_week / totals.total_enrollments * 100)
+        if totals.total_enrollments > 0
+        else 0
     )
 
     return {
         "overview": {
-            "total_patients": total_patients,
-            "total_programs": total_programs,
-            "active_programs": active_programs,
-            "total_checkins": total_checkins,
-            "total_points_awarded": int(total_points),
-            "total_enrollments": total_enrollments,
-            "total_badges_awarded": total_badges_awarded,
+            "total_patients": totals.total_patients,
+            "total_programs": totals.total_programs,
+            "active_programs": totals.active_programs,
+            "total_checkins": totals.total_checkins,
+            "total_points_awarded": int(totals.total_points or 0),
+            "total_enrollments": totals.total_enrollments,
+            "total_badges_awarded": totals.total_badges_awarded,
         },
         "recent_activity": {
-            "checkins_last_7_days": checkins_last_week,
-            "checkins_last_30_days": checkins_last_month,
+            "checkins_last_7_days": totals.checkins_last_week,
+            "checkins_last_30_days": totals.checkins_last_month,
             "avg_engagement_rate": round(avg_checkins_per_enrollment, 1),
         },
         "top_performers": {
@@ -141,135 +215,228 @@ def get_analytics_overview(db: Session = Depends(get_db)) -> Dict[str, Any]:
 
 
 @router.get("/engagement-trends", dependencies=[Depends(require_admin)])
-def get_engagement_trends(days: int = 30, db: Session = Depends(get_db)) -> Dict[str, Any]:
+async def get_engagement_trends(
+    request: Request,
+    response: Response,
+    days: int = 30,
+    program_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+) -> Dict[str, Any]:
     """Get daily engagement trends for the specified time period.
 
     Args:
         days: Number of days to look back (default: 30)
+        program_id: Only count check-ins for this program's habits
 
     Returns:
         Daily check-in counts and unique active users
     """
     if days > 365:
         raise HTTPException(status_code=400, detail="Maximum 365 days allowed")
+    return await _cached(
+        request, response, db, lambda session: _engagement_trends(session, days, program_id)
+    )
 
-    start_date = datetime.utcnow() - timedelta(days=days)
 
-    # Daily check-ins
-    daily_checkins = (
-        db.query(
-            cast(CheckIn.check_in_date, Date).label("date"),
-            func.count(CheckIn.id).label("count")
-        )
-        .filter(CheckIn.created_at >= start_date)
-        .group_by(cast(CheckIn.check_in_date, Date))
-        .order_by(cast(CheckIn.check_in_date, Date))
-        .all()
-    )
+async def _engagement_trends(
+    db: AsyncSession, days: int, program_id: Optional[int]
+) -> Dict[str, Any]:
+    start_date = datetime.utcnow().date() - timedelta(days=days)
 
-    # Daily unique active users
-    daily_users = (
-        db.query(
-            cast(CheckIn.check_in_date, Date).label("date"),
-            func.count(func.distinct(CheckIn.user_id)).label("unique_users")
+    # One rollup row per day, read from the (program_id, habit_id, day) key
+    rows = await _fetch_all(
+        db,
+        select(DailyRollup.day, DailyRollup.check_ins, DailyRollup.active_users)
+        .where(
+            _rollups(program_id or 0),
+            DailyRollup.day >= start_date,
+            DailyRollup.check_ins > 0,
         )
-        .filter(CheckIn.created_at >= start_date)
-        .group_by(cast(CheckIn.check_in_date, Date))
-        .order_by(cast(CheckIn.check_in_date, Date))
-        .all()
+        .order_by(DailyRollup.day),
     )
 
     return {
         "period_days": days,
-        "start_date": start_date.date().isoformat(),
+        "start_date": start_date.isoformat(),
         "end_date": datetime.utcnow().date().isoformat(),
         "daily_checkins": [
-            {"date": str(row.date), "count": row.count}
-            for row in daily_checkins
+            {"date": str(row.day), "count": row.check_ins}
+            for row in rows
         ],
         "daily_active_users": [
-            {"date": str(row.date), "unique_users": row.unique_users}
-            for row in daily_users
+            {"date": str(row.day), "unique_users": row.active_users}
+            for row in rows
         ],
     }
 
 
-@router.get("/program-performance", dependencies=[Depends(require_admin)])
-def get_program_performance(db: Session = Depends(get_db)) -> Dict[str, Any]:
-    """Get detailed performance metrics for all programs."""
-    programs = db.query(Program).filter(Program.is_active).all()
-
-    results = []
-    for program in programs:
-        # Enrollment count
-        enrollment_count = (
-            db.query(Enrollment)
-            .filter(
-                Enrollment.program_id == program.id,
-                Enrollment.is_active
-            )
-            .count()
+def _program_checkins_query(by_habit: bool, start_date: Optional[date], end_date: Optional[date]):
+    """Check-ins per active program, or per habit, counted through the habit's program."""
+    on = [CheckIn.habit_id == Habit.id]
+    if start_date is not None:
+        on.append(CheckIn.check_in_date >= start_date)
+    if end_date is not None:
+        on.append(CheckIn.check_in_date <= end_date)
+    keys = [Habit.program_id]
+    if by_habit:
+        keys += [Habit.id.label("habit_id"), Habit.name.label("habit_name")]
+    return (
+        select(
+            *keys,
+            func.count(CheckIn.id).label("checkin_count"),
+            func.count(func.distinct(CheckIn.user_id)).label("active_users"),
         )
+        .join(Program, and_(Program.id == Habit.program_id, Program.is_active))
+        .outerjoin(CheckIn, and_(*on))
+        .group_by(*keys)
+    )
 
-        # Total check-ins for this program
-        checkin_count = (
-            db.query(CheckIn)
-            .join(Enrollment, and_(
-                Enrollment.user_id == CheckIn.user_id,
-                Enrollment.program_id == program.id
-            ))
-            .count()
-        )
 
-        # Total points awarded
-        points_awarded = (
-            db.query(func.sum(PointsLedger.points))
-            .filter(PointsLedger.program_id == program.id)
-            .scalar() or 0
+def _program_points_query(start_date: Optional[date], end_date: Optional[date]):
+    """Points per program: from the balances, or from the ledger for a date range."""
+    active = select(Program.id).where(Program.is_active)
+    if start_date is None and end_date is None:
+        return (
+            select(UserPointsBalance.program_id, func.sum(UserPointsBalance.total_points))
+            .where(UserPointsBalance.program_id.in_(active))
+            .group_by(UserPointsBalance.program_id)
         )
+    query = select(PointsLedger.program_id, func.sum(PointsLedger.points))
+    if start_date is not None:
+        query = query.where(PointsLedger.created_at >= datetime.combine(start_date, time.min))
+    if end_date is not None:
+        query = query.where(
+            PointsLedger.created_at < datetime.combine(end_date + timedelta(days=1), time.min)
+        )
+    return query.where(PointsLedger.program_id.in_(active)).group_by(PointsLedger.program_id)
+
+
+@router.get("/program-performance", dependencies=[Depends(require_admin)])
+async def get_program_performance(
+    request: Request,
+    response: Response,
+    by_habit: bool = False,
+    start_date: date = None,
+    end_date: date = None,
+    db: AsyncSession = Depends(get_async_read_db),
+) -> Dict[str, Any]:
+    """Get detailed performance metrics for all active programs.
+
+    Three grouped queries cover every program, however many there are.
+    Check-ins count for the program of their habit; `start_date`/`end_date`
+    restrict check-ins by check-in date and points by the day they were
+    awarded. `by_habit` adds each habit's check-ins and distinct users.
+    """
+    if start_date is not None and end_date is not None and start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+    return await _cached(
+        request,
+        response,
+        db,
+        lambda session: _program_performance(session, by_habit, start_date, end_date),
+    )
 
+
+async def _program_performance(
+    db: AsyncSession, by_habit: bool, start_date: Optional[date], end_date: Optional[date]
+) -> Dict[str, Any]:
+    enrollments_query = (
+        select(Program.id, Program.name, func.count(Enrollment.id).label("enrollment_count"))
+        .outerjoin(Enrollment, and_(Enrollment.program_id == Program.id, Enrollment.is_active))
+        .where(Program.is_active)
+        .group_by(Program.id, Program.name)
+    )
+    programs, checkin_rows, points_rows = await run_concurrently(
+        db,
+        lambda session: _fetch_all(session, enrollments_query),
+        lambda session: _fetch_all(
+            session, _program_checkins_query(by_habit, start_date, end_date)
+        ),
+        lambda session: _fetch_all(session, _program_points_query(start_date, end_date)),
+    )
+
+    checkins: Dict[int, int] = {}
+    habits: Dict[int, list] = {}
+    for row in checkin_rows:
+        checkins[row.program_id] = checkins.get(row.program_id, 0) + row.checkin_count
+        if by_habit:
+            habits.setdefault(row.program_id, []).append(
+                {
+                    "habit_id": row.habit_id,
+                    "habit_name": row.habit_name,
+                    "total_checkins": row.checkin_count,
+                    "active_users": row.active_users,
+                }
+            )
+    points = {program_id: total or 0 for program_id, total in points_rows}
+
+    results = []
+    for program in programs:
+        checkin_count = checkins.get(program.id, 0)
+        enrollment_count = program.enrollment_count
         # Average check-ins per enrollment
         avg_checkins = round(checkin_count / enrollment_count, 1) if enrollment_count > 0 else 0
 
-        results.append({
+        result = {
             "program_id": program.id,
             "program_name": program.name,
             "enrollment_count": enrollment_count,
             "total_checkins": checkin_count,
-            "total_points_awarded": int(points_awarded),
+            "total_points_awarded": int(points.get(program.id, 0)),
             "avg_checkins_per_enrollment": avg_checkins,
-        })
+        }
+        if by_habit:
+            result["habits"] = sorted(
+                habits.get(program.id, []), key=lambda habit: habit["total_checkins"], reverse=True
+            )
+        results.append(result)
 
     # Sort by enrollment count
     results.sort(key=lambda x: x["enrollment_count"], reverse=True)
 
-    return {"programs": results}
+    return {
+        "start_date": start_date.isoformat() if start_date else None,
+        "end_date": end_date.isoformat() if end_date else None,
+        "programs": results,
+    }
 
 
 @router.get("/badge-statistics", dependencies=[Depends(require_admin)])
-def get_badge_statistics(db: Session = Depends(get_db)) -> Dict[str, Any]:
+async def get_badge_statistics(
+    request: Request, response: Response, db: AsyncSession = Depends(get_async_read_db)
+) -> Dict[str, Any]:
     """Get statistics about badge awards."""
-    # Total badges defined
-    total_badges = db.query(Badge).count()
-
-    # Badge award counts
-    badge_awards = (
-        db.query(
-            Badge.id,
-            Badge.name,
-            Badge.description,
-            Badge.points_reward,
-            func.count(UserBadge.id).label("award_count")
-        )
-        .outerjoin(UserBadge, UserBadge.badge_id == Badge.id)
-        .group_by(Badge.id, Badge.name, Badge.description, Badge.points_reward)
-        .order_by(func.count(UserBadge.id).desc())
-        .all()
+    return await _cached(request, response, db, _badge_statistics)
+
+
+async def _badge_statistics(db: AsyncSession) -> Dict[str, Any]:
+    counts_query = select(
+        _scalar(_count(Badge.id), "total_badges"),
+        _scalar(_count(UserBadge.id), "total_badges_awarded"),
+    )
+    [counts], badge_awards = await run_concurrently(
+        db,
+        # Badges defined and awarded
+        lambda session: _fetch_all(session, counts_query),
+        # Badge award counts
+        lambda session: _fetch_all(
+            session,
+            select(
+                Badge.id,
+                Badge.name,
+                Badge.description,
+                Badge.points_reward,
+                func.count(UserBadge.id).label("award_count")
+            )
+            .outerjoin(UserBadge, UserBadge.badge_id == Badge.id)
+            .group_by(Badge.id, Badge.name, Badge.description, Badge.points_reward)
+            .order_by(func.count(UserBadge.id).desc()),
+        ),
     )
 
     return {
-        "total_badges_defined": total_badges,
-        "total_badges_awarded": db.query(UserBadge).count(),
+        "total_badges_defined": counts.total_badges,
+        "total_badges_awarded": counts.total_badges_awarded,
         "badge_details": [
             {
                 "badge_id": badge.id,
@@ -281,3 +448,115 @@ def get_badge_statistics(db: Session = Depends(get_db)) -> Dict[str, Any]:
             for badge in badge_awards
         ],
     }
+
+
+@router.get(
+    "/cohort-retention",
+    response_model=CohortRetentionResponse,
+    dependencies=[Depends(require_admin)],
+)
+async def get_cohort_retention(
+    request: Request,
+    response: Response,
+    program_id: int = None,
+    start_date: date = None,
+    end_date: date = None,
+    weeks: int = Query(12, ge=1, le=MAX_WEEKS),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    """Weekly retention of the enrollments that started between start_date and end_date.
+
+    Defaults to the cohorts of the last `weeks` weeks. Each cohort lists how
+    many of its enrollments checked in to their program's habits in each week
+    since starting, up to the current week.
+    """
+    today = datetime.utcnow().date()
+    end_date = end_date or today
+    start_date = start_date or end_date - timedelta(weeks=weeks)
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+    return await _cached(
+        request,
+        response,
+        db,
+        lambda session: _cohort_retention(session, program_id, start_date, end_date, weeks, today),
+    )
+
+
+async def _cohort_retention(
+    db: AsyncSession,
+    program_id: Optional[int],
+    start_date: date,
+    end_date: date,
+    weeks: int,
+    today: date,
+) -> CohortRetentionResponse:
+    enrollments = await _fetch_all(db, cohort_enrollments_query(program_id, start_date, end_date))
+    matrix = RetentionMatrix(enrollments, weeks)
+    if enrollments:
+        until = min(today, end_date + timedelta(weeks=weeks))
+        query = cohort_check_ins_query(program_id, start_date, end_date, until)
+        result = await db.stream(query.execution_options(yield_per=COHORT_CHECK_IN_PARTITION))
+        async for rows in result.partitions():
+            matrix.add(rows)
+
+    return CohortRetentionResponse(
+        program_id=program_id,
+        start_date=start_date,
+        end_date=end_date,
+        weeks=weeks,
+        cohorts=matrix.cohorts(today),
+    )
+
+
+@router.get(
+    "/programs/{program_id}/metrics/{metric_key}",
+    response_model=MetricRollupResponse,
+    dependencies=[Depends(require_admin)],
+)
+async def get_program_metric_rollup(
+    request: Request,
+    response: Response,
+    program_id: int,
+    metric_key: str,
+    granularity: str = Query("day", pattern="^(day|week|month)$"),
+    start_date: date = None,
+    end_date: date = None,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    """Get a numeric metric aggregated across every user enrolled in a program."""
+    return await _cached(
+        request,
+        response,
+        db,
+        lambda session: _program_metric_rollup(
+            session, program_id, metric_key, granularity, start_date, end_date
+        ),
+    )
+
+
+async def _program_metric_rollup(
+    db: AsyncSession,
+    program_id: int,
+    metric_key: str,
+    granularity: str,
+    start_date: Optional[date],
+    end_date: Optional[date],
+) -> MetricRollupResponse:
+    enrolled = select(Enrollment.user_id).where(Enrollment.program_id == program_id)
+    query = metric_series_query(metric_key, start_date, end_date).where(
+        CheckIn.user_id.in_(enrolled)
+    )
+    rows = (await db.execute(query)).all()
+    return MetricRollupResponse(
+        metric_key=metric_key,
+        granularity=granularity,
+        program_id=program_id,
+        points=rollup_series(rows, granularity),
+    )
+
+
+@router.get("/cache-stats", dependencies=[Depends(require_admin)])
+async def get_cache_stats() -> Dict[str, Any]:
+    """Hit, miss and refresh counters of this process's analytics cache."""
+    return analytics_cache.snapshot()
@@ -4,9 +4,10 @@ from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from pydantic import BaseModel
 from typing import List, Optional
-from app.database import get_db
-from app.models import Badge, User
+from app.database import get_db, get_read_db
+from app.models import Badge, User, UserBadge
 from app.auth import require_admin
+from app.user_cache import invalidate_users
 
 router = APIRouter(prefix="/api/v1/admin/badges", tags=["admin", "badges"])
 
@@ -44,7 +45,7 @@ class BadgeResponse(BaseModel):
 
 @router.get("/", response_model=List[BadgeResponse])
 def list_badges(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_admin: User = Depends(require_admin),
 ):
     """List all badges (admin only)."""
@@ -101,6 +102,9 @@ def update_badge(
     update_data = badge_update.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_badge, key, value)
+    # Holders' badge lists embed the badge
+    holders = db.query(UserBadge.user_id).filter(UserBadge.badge_id == badge_id)
+    invalidate_users(db, (user_id for user_id, in holders))
 
     try:
         db.commit()
@@ -126,7 +130,6 @@ def delete_badge(
         raise HTTPException(status_code=404, detail="Badge not found")
 
     # Check if badge has been awarded to any users
-    from app.models import UserBadge
     awarded_count = db.query(UserBadge).filter(UserBadge.badge_id == badge_id).count()
     
     if awarded_count > 0:
@@ -0,0 +1,69 @@
+"""Admin router for maintenance jobs over derived state.
+
+Jobs run in the maintenance runner (`python -m app.maintenance_jobs`), not in
+the API process; these endpoints only queue them and read their progress.
+"""
+import json
+
+import redis
+from fastapi import APIRouter, Depends, HTTPException, Query
+from redis.exceptions import RedisError
+
+from app.auth import require_admin
+from app.maintenance_jobs import enqueue_job, load_job
+from app.redis_client import get_redis
+from app.state_rebuild import REBUILD_CHUNK_SIZE
+
+router = APIRouter(
+    prefix="/api/v1/admin/maintenance",
+    tags=["admin", "maintenance"],
+    dependencies=[Depends(require_admin)],
+)
+
+
+def _client() -> redis.Redis:
+    client = get_redis()
+    if client is None:
+        raise HTTPException(status_code=503, detail="Maintenance jobs need Redis")
+    return client
+
+
+@router.post("/rebuild-state", status_code=202)
+def start_state_rebuild(
+    dry_run: bool = True,
+    workers: int = Query(4, ge=1, le=32),
+    chunk_size: int = Query(REBUILD_CHUNK_SIZE, ge=1, le=10000),
+):
+    """Queue a replay of check-ins and the ledger into streaks and balances.
+
+    Defaults to a dry run that only reports what would change; poll the job for progress.
+    """
+    try:
+        job_id = enqueue_job(_client(), dry_run, workers, chunk_size)
+    except RedisError:
+        raise HTTPException(status_code=503, detail="Maintenance jobs need Redis")
+    return {"job_id": job_id, "status": "queued"}
+
+
+@router.get("/rebuild-state/{job_id}")
+def get_state_rebuild(job_id: str):
+    """Progress of a rebuild job, and the first changes found once it finished."""
+    try:
+        job = load_job(_client(), job_id)
+    except RedisError:
+        raise HTTPException(status_code=503, detail="Maintenance jobs need Redis")
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "job_id": job_id,
+        "status": job["status"],
+        "dry_run": job["dry_run"] == "True",
+        **{
+            name: int(job[name])
+            for name in ("users_total", "users_done", "streaks_changed", "balances_changed")
+            if name in job
+        },
+        "summary": job.get("summary"),
+        "error": job.get("error"),
+        "diffs": json.loads(job["diffs"]) if "diffs" in job else [],
+    }
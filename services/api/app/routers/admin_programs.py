@@ -1,10 +1,11 @@
 """Admin router for program and habit management."""
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
-from app.database import get_db
+from app.database import get_db, get_read_db
+from app.habit_cache import invalidate_habits
 from app.models import Program, Habit, User, Enrollment
 from app.auth import require_admin
 
@@ -63,11 +64,12 @@ class ProgramResponse(BaseModel):
 
 @router.get("/", response_model=List[ProgramResponse])
 def list_programs(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_admin: User = Depends(require_admin),
 ):
     """List all programs with their habits (admin only)."""
-    programs = db.query(Program).order_by(Program.id).all()
+    # Habits for every program in one more query instead of one per program
+    programs = db.query(Program).options(selectinload(Program.habits)).order_by(Program.id).all()
     return programs
 
 
@@ -111,6 +113,7 @@ def create_program(
         )
         db.add(db_habit)
 
+    invalidate_habits(db)
     db.commit()
     db.refresh(db_program)
     return db_program
@@ -151,6 +154,7 @@ def update_program(
                 is_active=habit_data.is_active,
             )
             db.add(db_habit)
+        invalidate_habits(db)
 
     db.commit()
     db.refresh(db_program)
@@ -183,6 +187,7 @@ def delete_program(
 
     # Delete program (habits will cascade delete due to relationship)
     db.delete(db_program)
+    invalidate_habits(db)
     db.commit()
     return None
 
@@ -208,6 +213,7 @@ def add_habit_to_program(
         is_active=habit.is_active,
     )
     db.add(db_habit)
+    invalidate_habits(db)
     db.commit()
     db.refresh(db_habit)
     return db_habit
@@ -231,5 +237,6 @@ def remove_habit_from_program(
         raise HTTPException(status_code=404, detail="Habit not found in this program")
 
     db.delete(habit)
+    invalidate_habits(db)
     db.commit()
     return None
@@ -6,6 +6,7 @@ from typing import List
 from app.database import get_db
 from app.models import RewardConfig, User
 from app.auth import require_admin
+from app.rewards_engine import DEFAULT_REWARDS, invalidate_reward_config
 
 router = APIRouter(prefix="/api/v1/admin/rewards", tags=["admin", "rewards"])
 
@@ -25,51 +26,6 @@ class RewardConfigUpdate(BaseModel):
     configs: List[RewardConfigItem]
 
 
-# Default reward configuration
-DEFAULT_REWARDS = [
-    {
-        "config_key": "check_in_points",
-        "config_value": 10,
-        "description": "Pontos por completar um check-in diário"
-    },
-    {
-        "config_key": "streak_3_days_bonus",
-        "config_value": 20,
-        "description": "Bônus por manter 3 dias consecutivos"
-    },
-    {
-        "config_key": "streak_7_days_bonus",
-        "config_value": 50,
-        "description": "Bônus por manter 7 dias consecutivos"
-    },
-    {
-        "config_key": "streak_14_days_bonus",
-        "config_value": 100,
-        "description": "Bônus por manter 14 dias consecutivos"
-    },
-    {
-        "config_key": "streak_30_days_bonus",
-        "config_value": 250,
-        "description": "Bônus por manter 30 dias consecutivos"
-    },
-    {
-        "config_key": "program_completion_bonus",
-        "config_value": 500,
-        "description": "Bônus por completar um programa inteiro"
-    },
-    {
-        "config_key": "first_check_in_bonus",
-        "config_value": 25,
-        "description": "Bônus pelo primeiro check-in em um programa"
-    },
-    {
-        "config_key": "perfect_week_bonus",
-        "config_value": 100,
-        "description": "Bônus por completar todos os hábitos durante 7 dias"
-    }
-]
-
-
 @router.get("/config", response_model=List[RewardConfigItem])
 def get_reward_config(
     db: Session = Depends(get_db),
@@ -83,6 +39,7 @@ def get_reward_config(
         for default in DEFAULT_REWARDS:
             config = RewardConfig(**default)
             db.add(config)
+        invalidate_reward_config(db)
         db.commit()
         configs = db.query(RewardConfig).all()
     
@@ -119,6 +76,7 @@ def update_reward_config(
             db.add(new_config)
             updated_configs.append(new_config)
     
+    invalidate_reward_config(db)
     db.commit()
     
     # Refresh all to get updated timestamps
@@ -144,6 +102,7 @@ def reset_reward_config(
         db.add(config)
         configs.append(config)
     
+    invalidate_reward_config(db)
     db.commit()
     
     # Refresh to get IDs and timestamps
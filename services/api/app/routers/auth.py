@@ -1,7 +1,7 @@
 """Authentication router for login and user management."""
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models import User
 from app.schemas_auth import UserCreate, UserLogin, UserResponse, Token
 from app.auth import (
@@ -91,7 +91,7 @@ def get_current_user_info(current_user: User = Depends(get_current_user)):
 
 @router.get("/users", response_model=list[UserResponse])
 def list_users(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_admin: User = Depends(require_admin),
 ):
     """List all users (admin only)."""
@@ -4,15 +4,17 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 
-from app.database import get_db
-from app.models import Badge, UserBadge, PointsLedger
+from app.database import get_db, get_read_db
+from app.models import Badge, UserBadge
+from app.points_ledger import append_ledger_entries
 from app.schemas import BadgeCreate, BadgeUpdate, BadgeResponse, UserBadgeCreate, UserBadgeResponse
+from app.user_cache import invalidate_users
 
 router = APIRouter(prefix="/api/v1/badges", tags=["badges"])
 
 
 @router.get("/", response_model=List[BadgeResponse])
-def list_badges(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def list_badges(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     """List all badges."""
     badges = db.query(Badge).offset(skip).limit(limit).all()
     return badges
@@ -47,6 +49,9 @@ def update_badge(badge_id: int, badge_update: BadgeUpdate, db: Session = Depends
     update_data = badge_update.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_badge, key, value)
+    # Holders' badge lists embed the badge
+    holders = db.query(UserBadge.user_id).filter(UserBadge.badge_id == badge_id)
+    invalidate_users(db, (user_id for user_id, in holders))
 
     db.commit()
     db.refresh(db_badge)
@@ -66,18 +71,23 @@ def award_badge(award: UserBadgeCreate, db: Session = Depends(get_db)):
         user_badge = UserBadge(**award.model_dump())
         db.add(user_badge)
         db.flush()
+        invalidate_users(db, [award.user_id])
 
         # Award points if badge has points reward
         if badge.points_reward > 0:
-            points_entry = PointsLedger(
-                user_id=award.user_id,
-                program_id=None,
-                points=badge.points_reward,
-                event_type="badge_earned",
-                event_reference_id=user_badge.id,
-                description=f"Badge earned: {badge.name}",
+            append_ledger_entries(
+                db,
+                [
+                    {
+                        "user_id": award.user_id,
+                        "program_id": None,
+                        "points": badge.points_reward,
+                        "event_type": "badge_earned",
+                        "event_reference_id": user_badge.id,
+                        "description": f"Badge earned: {badge.name}",
+                    }
+                ],
             )
-            db.add(points_entry)
 
         db.commit()
         db.refresh(user_badge)
@@ -1,13 +1,36 @@
 """Check-ins API endpoints."""
+import logging
 from typing import List
 from datetime import date
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi.responses import JSONResponse
+from redis.exceptions import RedisError
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 
-from app.database import get_db
-from app.models import CheckIn, Habit, PointsLedger, Streak
-from app.schemas import CheckInCreate, CheckInResponse
+from app.check_in_engine import (
+    ingest_check_in_batch,
+    record_streak_day,
+    supports_single_statement_writes,
+    write_check_in_single_statement,
+)
+from app.check_in_stream import enqueue_check_in, pending_check_ins, write_behind_enabled
+from app.database import get_db, get_read_db
+from app.habit_cache import get_habit_meta
+from app.models import CheckIn
+from app.pagination import keyset, page, set_next_cursor
+from app.points_ledger import append_ledger_entries
+from app.rewards_engine import CheckInEvent, apply_check_in_rewards
+from app.schemas import (
+    CheckInBatchCreate,
+    CheckInBatchItemResult,
+    CheckInBatchResponse,
+    CheckInCreate,
+    CheckInPending,
+    CheckInResponse,
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/v1/check-ins", tags=["check-ins"])
 
@@ -18,11 +41,16 @@ def list_check_ins(
     habit_id: int = None,
     start_date: date = None,
     end_date: date = None,
+    cursor: str = None,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    response: Response = None,
+    db: Session = Depends(get_read_db),
 ):
-    """List check-ins with optional filtering."""
+    """List check-ins, newest first, with optional filtering.
+
+    Pass the `X-Next-Cursor` header of a page as `cursor` to fetch the next one.
+    """
     query = db.query(CheckIn)
     if user_id is not None:
         query = query.filter(CheckIn.user_id == user_id)
@@ -33,10 +61,19 @@ def list_check_ins(
     if end_date is not None:
         query = query.filter(CheckIn.check_in_date <= end_date)
 
-    check_ins = query.order_by(CheckIn.check_in_date.desc()).offset(skip).limit(limit).all()
+    order = (CheckIn.check_in_date, CheckIn.id)
+    query = keyset(query, order, cursor, descending=True)
+    check_ins, next_cursor = page(query.offset(skip).limit(limit + 1).all(), order, limit)
+    set_next_cursor(response, next_cursor)
     return check_ins
 
 
+@router.get("/pending", response_model=List[CheckInPending])
+def list_pending_check_ins(user_id: int):
+    """List a user's write-behind check-ins that are not stored yet."""
+    return pending_check_ins(user_id)
+
+
 @router.get("/{check_in_id}", response_model=CheckInResponse)
 def get_check_in(check_in_id: int, db: Session = Depends(get_db)):
     """Get a specific check-in by ID."""
@@ -46,11 +83,49 @@ def get_check_in(check_in_id: int, db: Session = Depends(get_db)):
     return check_in
 
 
-@router.post("/", response_model=CheckInResponse, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/",
+    response_model=CheckInResponse,
+    status_code=status.HTTP_201_CREATED,
+    responses={status.HTTP_202_ACCEPTED: {"model": CheckInPending}},
+)
 def create_check_in(check_in: CheckInCreate, db: Session = Depends(get_db)):
-    """Create a new check-in and award points."""
+    """Create a new check-in and award points.
+
+    In write-behind mode the check-in is queued and 202 is returned; the worker
+    stores it shortly after and it shows up in GET /pending until then.
+    """
+    if write_behind_enabled():
+        if get_habit_meta(db, check_in.habit_id) is None:
+            raise HTTPException(status_code=404, detail="Habit not found")
+        try:
+            event = enqueue_check_in(check_in)
+        except RedisError:
+            # Fall back to writing through rather than dropping the check-in
+            logger.warning("Check-in stream unavailable, writing synchronously", exc_info=True)
+        else:
+            return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=event)
+
+    if supports_single_statement_writes(db):
+        try:
+            habit_exists, row = write_check_in_single_statement(db, check_in)
+        except IntegrityError:
+            db.rollback()
+            raise HTTPException(status_code=400, detail="Check-in could not be stored")
+        if not habit_exists:
+            db.rollback()
+            raise HTTPException(status_code=404, detail="Habit not found")
+        if row is None:
+            db.rollback()
+            raise HTTPException(
+                status_code=400,
+                detail="Check-in already exists for this habit on this date",
+            )
+        db.commit()
+        return row
+
     # Verify habit exists
-    habit = db.query(Habit).filter(Habit.id == check_in.habit_id).first()
+    habit = get_habit_meta(db, check_in.habit_id)
     if not habit:
         raise HTTPException(status_code=404, detail="Habit not found")
 
@@ -62,50 +137,37 @@ def create_check_in(check_in: CheckInCreate, db: Session = Depends(get_db)):
         db.flush()  # Get the ID but don't commit yet
 
         # Award points to ledger
-        points_entry = PointsLedger(
-            user_id=check_in.user_id,
-            program_id=habit.program_id,
-            points=habit.points_per_completion,
-            event_type="check_in",
-            event_reference_id=db_check_in.id,
-            description=f"Check-in: {habit.name}",
-        )
-        db.add(points_entry)
-
-        # Update or create streak
-        streak = (
-            db.query(Streak)
-            .filter(
-                Streak.user_id == check_in.user_id,
-                Streak.habit_id == check_in.habit_id,
-            )
-            .first()
+        append_ledger_entries(
+            db,
+            [
+                {
+                    "user_id": check_in.user_id,
+                    "program_id": habit.program_id,
+                    "points": habit.points_per_completion,
+                    "event_type": "check_in",
+                    "event_reference_id": db_check_in.id,
+                    "description": f"Check-in: {habit.name}",
+                }
+            ],
         )
 
-        if streak:
-            # Check if consecutive day
-            if streak.last_check_in_date:
-                days_diff = (check_in.check_in_date - streak.last_check_in_date).days
-                if days_diff == 1:
-                    streak.current_streak += 1
-                    if streak.current_streak > streak.longest_streak:
-                        streak.longest_streak = streak.current_streak
-                elif days_diff > 1:
-                    streak.current_streak = 1
-            else:
-                streak.current_streak = 1
-            streak.last_check_in_date = check_in.check_in_date
-        else:
-            # Create new streak
-            streak = Streak(
-                user_id=check_in.user_id,
-                habit_id=check_in.habit_id,
-                program_id=habit.program_id,
-                current_streak=1,
-                longest_streak=1,
-                last_check_in_date=check_in.check_in_date,
-            )
-            db.add(streak)
+        # Update or create streak, then award any bonus it completes
+        added = record_streak_day(
+            db, check_in.user_id, check_in.habit_id, habit.program_id, check_in.check_in_date
+        )
+        apply_check_in_rewards(
+            db,
+            [
+                CheckInEvent(
+                    check_in.user_id,
+                    check_in.habit_id,
+                    habit.program_id,
+                    check_in.check_in_date.toordinal(),
+                    (added.run_start, added.run_end),
+                    added.first,
+                )
+            ],
+        )
 
         db.commit()
         db.refresh(db_check_in)
@@ -117,3 +179,24 @@ def create_check_in(check_in: CheckInCreate, db: Session = Depends(get_db)):
             status_code=400,
             detail="Check-in already exists for this habit on this date",
         )
+
+
+@router.post("/batch", response_model=CheckInBatchResponse)
+def create_check_ins_batch(batch: CheckInBatchCreate, db: Session = Depends(get_db)):
+    """Create many check-ins in one transaction, flagging duplicates per item."""
+    try:
+        outcomes = ingest_check_in_batch(db, batch.check_ins)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Check-in batch could not be stored")
+
+    results = [
+        CheckInBatchItemResult(index=index, status=item_status, check_in=row)
+        for index, (item_status, row) in enumerate(outcomes)
+    ]
+    return CheckInBatchResponse(
+        created_count=sum(1 for result in results if result.status == "created"),
+        duplicate_count=sum(1 for result in results if result.status == "duplicate"),
+        results=results,
+    )
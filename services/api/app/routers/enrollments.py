@@ -1,12 +1,14 @@
 """Enrollments API endpoints."""
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models import Enrollment, Program
+from app.pagination import keyset, page, set_next_cursor
 from app.schemas import EnrollmentCreate, EnrollmentResponse
+from app.user_cache import invalidate_users
 
 router = APIRouter(prefix="/api/v1/enrollments", tags=["enrollments"])
 
@@ -16,11 +18,13 @@ def list_enrollments(
     user_id: int = None,
     program_id: int = None,
     is_active: bool = None,
+    cursor: str = None,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    response: Response = None,
+    db: Session = Depends(get_read_db),
 ):
-    """List enrollments with optional filtering."""
+    """List enrollments, oldest first, with optional filtering and cursor paging."""
     query = db.query(Enrollment)
     
     if user_id is not None:
@@ -30,7 +34,10 @@ def list_enrollments(
     if is_active is not None:
         query = query.filter(Enrollment.is_active == is_active)
     
-    enrollments = query.offset(skip).limit(limit).all()
+    order = (Enrollment.created_at, Enrollment.id)
+    query = keyset(query, order, cursor)
+    enrollments, next_cursor = page(query.offset(skip).limit(limit + 1).all(), order, limit)
+    set_next_cursor(response, next_cursor)
     return enrollments
 
 
@@ -60,6 +67,7 @@ def create_enrollment(enrollment: EnrollmentCreate, db: Session = Depends(get_db
         else:
             # Reactivate existing enrollment
             existing.is_active = True
+            invalidate_users(db, [existing.user_id])
             db.commit()
             db.refresh(existing)
             return existing
@@ -68,6 +76,7 @@ def create_enrollment(enrollment: EnrollmentCreate, db: Session = Depends(get_db
     try:
         db_enrollment = Enrollment(**enrollment.model_dump())
         db.add(db_enrollment)
+        invalidate_users(db, [db_enrollment.user_id])
         db.commit()
         db.refresh(db_enrollment)
         return db_enrollment
@@ -90,5 +99,6 @@ def cancel_enrollment(enrollment_id: int, db: Session = Depends(get_db)):
         )
     
     enrollment.is_active = False
+    invalidate_users(db, [enrollment.user_id])
     db.commit()
     return None
@@ -0,0 +1,177 @@
+"""Streaming bulk export endpoints for research (admin only).
+
+Rows are read through a server-side cursor (`yield_per`) and written to the
+response one batch at a time as NDJSON or CSV, so memory stays flat regardless
+of export size.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Iterator
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from app.auth import require_admin
+from app.database import get_read_db
+from app.models import (
+    ArtifactDefinition,
+    ArtifactInstance,
+    CheckIn,
+    Habit,
+    PointsLedger,
+    ProtocolRun,
+    ProtocolTemplate,
+)
+
+router = APIRouter(
+    prefix="/api/v1/exports", tags=["exports"], dependencies=[Depends(require_admin)]
+)
+
+EXPORT_BATCH_SIZE = 5000
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+FORMAT_QUERY = Query("ndjson", alias="format", pattern="^(ndjson|csv)$")
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=_json_default)
+    return value
+
+
+def _stream_rows(db: Session, query, export_format: str) -> Iterator[str]:
+    # The request session is closed once the handler returns, so the export runs
+    # on its own session bound to the same engine.
+    with Session(bind=db.get_bind()) as session:
+        result = session.execute(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        columns = list(result.keys())
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            for batch in result.partitions():
+                writer.writerows([_csv_value(value) for value in row] for row in batch)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            for batch in result.partitions():
+                yield "".join(
+                    json.dumps(dict(zip(columns, row)), default=_json_default) + "\n"
+                    for row in batch
+                )
+
+
+def _export(db: Session, query, export_format: str, name: str) -> StreamingResponse:
+    return StreamingResponse(
+        _stream_rows(db, query, export_format),
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{export_format}"'},
+    )
+
+
+def _created_between(column, start_date: date, end_date: date):
+    conditions = []
+    if start_date is not None:
+        conditions.append(column >= datetime.combine(start_date, time.min))
+    if end_date is not None:
+        conditions.append(column < datetime.combine(end_date + timedelta(days=1), time.min))
+    return conditions
+
+
+@router.get("/check-ins")
+def export_check_ins(
+    user_id: int = None,
+    program_id: int = None,
+    start_date: date = None,
+    end_date: date = None,
+    metric_key: str = None,
+    export_format: str = FORMAT_QUERY,
+    db: Session = Depends(get_read_db),
+):
+    """Stream check-ins, filtered by user, program, check-in date range and metric."""
+    query = select(CheckIn.__table__, Habit.program_id).join(Habit, Habit.id == CheckIn.habit_id)
+    if user_id is not None:
+        query = query.where(CheckIn.user_id == user_id)
+    if program_id is not None:
+        query = query.where(Habit.program_id == program_id)
+    if start_date is not None:
+        query = query.where(CheckIn.check_in_date >= start_date)
+    if end_date is not None:
+        query = query.where(CheckIn.check_in_date <= end_date)
+    if metric_key is not None:
+        query = query.where(CheckIn.metric_key == metric_key)
+    return _export(db, query.order_by(CheckIn.id), export_format, "check_ins")
+
+
+@router.get("/points-ledger")
+def export_points_ledger(
+    user_id: int = None,
+    program_id: int = None,
+    start_date: date = None,
+    end_date: date = None,
+    export_format: str = FORMAT_QUERY,
+    db: Session = Depends(get_read_db),
+):
+    """Stream ledger entries, filtered by user, program and creation date range."""
+    query = select(PointsLedger.__table__)
+    if user_id is not None:
+        query = query.where(PointsLedger.user_id == user_id)
+    if program_id is not None:
+        query = query.where(PointsLedger.program_id == program_id)
+    query = query.where(*_created_between(PointsLedger.created_at, start_date, end_date))
+    return _export(db, query.order_by(PointsLedger.id), export_format, "points_ledger")
+
+
+@router.get("/artifacts")
+def export_artifacts(
+    user_id: int = None,
+    program_id: int = None,
+    start_date: date = None,
+    end_date: date = None,
+    artifact_key: str = None,
+    export_format: str = FORMAT_QUERY,
+    db: Session = Depends(get_read_db),
+):
+    """Stream artifact instances with their run's user and artifact key.
+
+    A run belongs to a program through its template's default program or the
+    habits it generated there.
+    """
+    query = (
+        select(ArtifactInstance.__table__, ProtocolRun.user_id, ArtifactDefinition.artifact_key)
+        .join(ProtocolRun, ProtocolRun.id == ArtifactInstance.protocol_run_id)
+        .join(ArtifactDefinition, ArtifactDefinition.id == ArtifactInstance.artifact_definition_id)
+    )
+    if user_id is not None:
+        query = query.where(ProtocolRun.user_id == user_id)
+    if program_id is not None:
+        generated_runs = select(Habit.source_ref_id).where(
+            Habit.program_id == program_id, Habit.source_type == "protocol"
+        )
+        templates = select(ProtocolTemplate.id).where(
+            ProtocolTemplate.default_program_id == program_id
+        )
+        query = query.where(
+            or_(
+                ProtocolRun.id.in_(generated_runs),
+                ProtocolRun.protocol_template_id.in_(templates),
+            )
+        )
+    if artifact_key is not None:
+        query = query.where(ArtifactDefinition.artifact_key == artifact_key)
+    query = query.where(*_created_between(ArtifactInstance.collected_at, start_date, end_date))
+    return _export(db, query.order_by(ArtifactInstance.id), export_format, "artifacts")
@@ -1,10 +1,12 @@
 """Habits API endpoints."""
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.orm import Session
 
-from app.database import get_db
+from app.database import get_db, get_read_db
+from app.habit_cache import invalidate_habits
 from app.models import Habit, Program
+from app.pagination import keyset, page, set_next_cursor
 from app.schemas import HabitCreate, HabitUpdate, HabitResponse
 
 router = APIRouter(prefix="/api/v1/habits", tags=["habits"])
@@ -17,9 +19,11 @@ def list_habits(
     program_id: int = None,
     source_type: str = None,
     is_active: bool = None,
-    db: Session = Depends(get_db),
+    cursor: str = None,
+    response: Response = None,
+    db: Session = Depends(get_read_db),
 ):
-    """List all habits with optional filtering."""
+    """List all habits, oldest first, with optional filtering and cursor paging."""
     query = db.query(Habit)
     if program_id is not None:
         query = query.filter(Habit.program_id == program_id)
@@ -27,7 +31,10 @@ def list_habits(
         query = query.filter(Habit.source_type == source_type)
     if is_active is not None:
         query = query.filter(Habit.is_active == is_active)
-    habits = query.offset(skip).limit(limit).all()
+    order = (Habit.created_at, Habit.id)
+    query = keyset(query, order, cursor)
+    habits, next_cursor = page(query.offset(skip).limit(limit + 1).all(), order, limit)
+    set_next_cursor(response, next_cursor)
     return habits
 
 
@@ -50,6 +57,7 @@ def create_habit(habit: HabitCreate, db: Session = Depends(get_db)):
 
     db_habit = Habit(**habit.model_dump())
     db.add(db_habit)
+    invalidate_habits(db)
     db.commit()
     db.refresh(db_habit)
     return db_habit
@@ -68,6 +76,7 @@ def update_habit(
     for key, value in update_data.items():
         setattr(db_habit, key, value)
 
+    invalidate_habits(db)
     db.commit()
     db.refresh(db_habit)
     return db_habit
@@ -81,5 +90,6 @@ def delete_habit(habit_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Habit not found")
 
     db_habit.is_active = False
+    invalidate_habits(db)
     db.commit()
     return None
@@ -0,0 +1,71 @@
+"""Leaderboard endpoints backed by Redis sorted sets."""
+from datetime import datetime
+from typing import Optional
+
+import redis
+from fastapi import APIRouter, HTTPException, Query
+from redis.exceptions import RedisError
+
+from app.leaderboards import around, leaderboard_key, top, user_rank, week_label
+from app.redis_client import get_redis
+from app.schemas import LeaderboardEntry, LeaderboardResponse
+
+router = APIRouter(prefix="/api/v1/leaderboards", tags=["leaderboards"])
+
+PERIOD_QUERY = Query("all", pattern="^(all|week)$")
+
+
+def _client() -> redis.Redis:
+    client = get_redis()
+    if client is None:
+        raise HTTPException(status_code=503, detail="Leaderboards are unavailable")
+    return client
+
+
+def _key(program_id: Optional[int], period: str) -> str:
+    week = week_label(datetime.utcnow()) if period == "week" else None
+    return leaderboard_key(program_id, week)
+
+
+@router.get("", response_model=LeaderboardResponse)
+def get_leaderboard(
+    program_id: int = None,
+    period: str = PERIOD_QUERY,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100),
+):
+    """Top users by points, globally or in a program, all-time or this week."""
+    try:
+        entries = top(_client(), _key(program_id, period), offset, limit)
+    except RedisError:
+        raise HTTPException(status_code=503, detail="Leaderboards are unavailable")
+    return LeaderboardResponse(program_id=program_id, period=period, entries=entries)
+
+
+@router.get("/users/{user_id}", response_model=LeaderboardEntry)
+def get_user_rank(user_id: int, program_id: int = None, period: str = PERIOD_QUERY):
+    """A user's rank and points on a leaderboard."""
+    try:
+        entry = user_rank(_client(), _key(program_id, period), user_id)
+    except RedisError:
+        raise HTTPException(status_code=503, detail="Leaderboards are unavailable")
+    if entry is None:
+        raise HTTPException(status_code=404, detail="User is not on this leaderboard")
+    return entry
+
+
+@router.get("/users/{user_id}/around", response_model=LeaderboardResponse)
+def get_users_around(
+    user_id: int,
+    program_id: int = None,
+    period: str = PERIOD_QUERY,
+    radius: int = Query(5, ge=0, le=50),
+):
+    """A user's entry with up to `radius` neighbours above and below."""
+    try:
+        entries = around(_client(), _key(program_id, period), user_id, radius)
+    except RedisError:
+        raise HTTPException(status_code=503, detail="Leaderboards are unavailable")
+    if entries is None:
+        raise HTTPException(status_code=404, detail="User is not on this leaderboard")
+    return LeaderboardResponse(program_id=program_id, period=period, entries=entries)
@@ -3,7 +3,7 @@ from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models import Program, Habit
 from app.schemas import ProgramCreate, ProgramUpdate, ProgramResponse, HabitResponse
 
@@ -15,7 +15,7 @@ def list_programs(
     skip: int = 0,
     limit: int = 100,
     is_active: bool = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     """List all programs with optional filtering."""
     query = db.query(Program)
@@ -75,7 +75,7 @@ def delete_program(program_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/{program_id}/habits", response_model=List[HabitResponse])
-def list_program_habits(program_id: int, db: Session = Depends(get_db)):
+def list_program_habits(program_id: int, db: Session = Depends(get_read_db)):
     """List all habits for a specific program."""
     program = db.query(Program).filter(Program.id == program_id).first()
     if not program:
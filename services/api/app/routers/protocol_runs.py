@@ -6,7 +6,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session, joinedload
 
 from app.auth import get_current_user, require_admin
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models import (
     ArtifactDefinition,
     ArtifactInstance,
@@ -173,7 +173,7 @@ def advance_phase(
 @router.get("/{run_id}/timeline")
 def run_timeline(
     run_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     _=Depends(get_current_user),
 ) -> Dict:
     run = (
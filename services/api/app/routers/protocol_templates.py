@@ -5,7 +5,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
 from app.auth import require_admin
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models import ProtocolTemplate
 from app.schemas import ProtocolTemplateCreate, ProtocolTemplateOut, ProtocolTemplateUpdate
 
@@ -13,7 +13,7 @@ router = APIRouter(prefix="/api/v1/admin/protocol-templates", tags=["admin-proto
 
 
 @router.get("/", response_model=List[ProtocolTemplateOut])
-def list_protocol_templates(db: Session = Depends(get_db), _=Depends(require_admin)):
+def list_protocol_templates(db: Session = Depends(get_read_db), _=Depends(require_admin)):
     return db.query(ProtocolTemplate).order_by(ProtocolTemplate.id.desc()).all()
 
 
@@ -1,41 +1,53 @@
 """User dashboard and analytics endpoints."""
-from typing import List
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import func, literal, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
-from app.database import get_db
+from app.database import get_async_db
+from app.metric_rollups import metric_series_query, rollup_series
+from app.points_ledger import balance_as_of_query, balance_query, retention_horizon
 from app.models import (
     PointsLedger,
     Enrollment,
     CheckIn,
     Streak,
     UserBadge,
-    Badge,
+    UserPointsBalance as PointsBalance,
 )
+from app.pagination import keyset, page, set_next_cursor
+from app.user_cache import cached_for_user, user_version
 from app.schemas import (
     UserPointsBalance,
+    UserPointsBalanceAsOf,
     UserDashboard,
     StreakResponse,
     UserBadgeResponse,
     PointsLedgerResponse,
+    MetricRollupResponse,
 )
 
 router = APIRouter(prefix="/api/v1/users", tags=["users"])
 
+# Per-user GETs depend on `user_version`: it sets a weak ETag from the user's
+# version in Redis and answers a matching If-None-Match with 304 before the
+# database session runs any query.
 
-@router.get("/{user_id}/points", response_model=UserPointsBalance)
-def get_user_points(user_id: int, program_id: int = None, db: Session = Depends(get_db)):
-    """Get total points for a user, optionally filtered by program."""
-    query = db.query(
-        func.sum(PointsLedger.points).label("total_points"),
-        func.count(PointsLedger.id).label("transaction_count"),
-    ).filter(PointsLedger.user_id == user_id)
 
-    if program_id is not None:
-        query = query.filter(PointsLedger.program_id == program_id)
+@router.get("/{user_id}/points", response_model=UserPointsBalance)
+async def get_user_points(
+    user_id: int,
+    program_id: int = None,
+    version: Optional[str] = Depends(user_version),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Get total points for a user, optionally filtered by program.
 
-    result = query.first()
+    Reads the materialized balances, not the ledger.
+    """
+    result = (await db.execute(balance_query(user_id, program_id))).one()
 
     return UserPointsBalance(
         user_id=user_id,
@@ -45,89 +57,204 @@ def get_user_points(user_id: int, program_id: int = None, db: Session = Depends(
     )
 
 
+@router.get("/{user_id}/points/as-of", response_model=UserPointsBalanceAsOf)
+async def get_user_points_as_of(
+    user_id: int,
+    as_of: date = Query(..., alias="date"),
+    program_id: int = None,
+    version: Optional[str] = Depends(user_version),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Get a user's balance at the end of a day, from monthly checkpoints plus the ledger since.
+
+    Days inside a detached ledger month are answered with 410: only the
+    checkpoint at the start of the next month survives, so the last day of the
+    newest detached month is the earliest exact balance.
+    """
+    horizon = await db.run_sync(retention_horizon, "points_ledger")
+    if horizon is not None and as_of < horizon - timedelta(days=1):
+        raise HTTPException(
+            status_code=410,
+            detail=f"Ledger archived; the earliest day available is {horizon - timedelta(days=1)}",
+        )
+    result = (await db.execute(balance_as_of_query(user_id, as_of, program_id))).one()
+
+    return UserPointsBalanceAsOf(
+        user_id=user_id,
+        program_id=program_id,
+        as_of=as_of,
+        total_points=result.total_points,
+        transaction_count=result.transaction_count,
+    )
+
+
 @router.get("/{user_id}/points/history", response_model=List[PointsLedgerResponse])
-def get_user_points_history(
+async def get_user_points_history(
     user_id: int,
     program_id: int = None,
+    start_date: date = None,
+    end_date: date = None,
+    cursor: str = None,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    response: Response = None,
+    version: Optional[str] = Depends(user_version),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    """Get points transaction history for a user."""
-    query = db.query(PointsLedger).filter(PointsLedger.user_id == user_id)
+    """Get points transaction history for a user, newest first, with cursor paging.
+
+    A date range limits the scan to the ledger's partitions for those months.
+    """
+    query = select(PointsLedger).where(PointsLedger.user_id == user_id)
 
     if program_id is not None:
-        query = query.filter(PointsLedger.program_id == program_id)
+        query = query.where(PointsLedger.program_id == program_id)
+    if start_date is not None:
+        query = query.where(PointsLedger.created_at >= datetime.combine(start_date, time.min))
+    if end_date is not None:
+        query = query.where(
+            PointsLedger.created_at < datetime.combine(end_date + timedelta(days=1), time.min)
+        )
 
-    transactions = (
-        query.order_by(PointsLedger.created_at.desc()).offset(skip).limit(limit).all()
-    )
+    order = (PointsLedger.created_at, PointsLedger.id)
+    query = keyset(query, order, cursor, descending=True)
+    transactions = await db.scalars(query.offset(skip).limit(limit + 1))
+    transactions, next_cursor = page(transactions.all(), order, limit)
+    set_next_cursor(response, next_cursor)
     return transactions
 
 
 @router.get("/{user_id}/streaks", response_model=List[StreakResponse])
-def get_user_streaks(user_id: int, db: Session = Depends(get_db)):
+async def get_user_streaks(
+    user_id: int,
+    version: Optional[str] = Depends(user_version),
+    db: AsyncSession = Depends(get_async_db),
+):
     """Get all active streaks for a user."""
-    streaks = db.query(Streak).filter(Streak.user_id == user_id).all()
-    return streaks
+    streaks = await db.scalars(select(Streak).where(Streak.user_id == user_id))
+    return streaks.all()
 
 
 @router.get("/{user_id}/badges", response_model=List[UserBadgeResponse])
-def get_user_badges(user_id: int, db: Session = Depends(get_db)):
+async def get_user_badges(
+    user_id: int,
+    version: Optional[str] = Depends(user_version),
+    db: AsyncSession = Depends(get_async_db),
+):
     """Get all badges earned by a user."""
-    user_badges = (
-        db.query(UserBadge)
-        .filter(UserBadge.user_id == user_id)
+    # Badge details are loaded up front; async sessions cannot lazy-load
+    user_badges = await db.scalars(
+        select(UserBadge)
+        .options(selectinload(UserBadge.badge))
+        .where(UserBadge.user_id == user_id)
         .order_by(UserBadge.awarded_at.desc())
-        .all()
+    )
+    return user_badges.all()
+
+
+@router.get("/{user_id}/metrics/{metric_key}", response_model=MetricRollupResponse)
+async def get_user_metric_rollup(
+    user_id: int,
+    metric_key: str,
+    granularity: str = Query("day", pattern="^(day|week|month)$"),
+    start_date: date = None,
+    end_date: date = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Get mean, min, max, p50 and p90 of a numeric metric per day, week or month."""
+    query = metric_series_query(metric_key, start_date, end_date).where(
+        CheckIn.user_id == user_id
+    )
+    rows = (await db.execute(query)).all()
+    return MetricRollupResponse(
+        metric_key=metric_key,
+        granularity=granularity,
+        user_id=user_id,
+        points=rollup_series(rows, granularity),
     )
 
-    # Eager load badge details
-    for ub in user_badges:
-        ub.badge = db.query(Badge).filter(Badge.id == ub.badge_id).first()
 
-    return user_badges
+DASHBOARD_BATCH_LIMIT = 200
 
 
-@router.get("/{user_id}/dashboard", response_model=UserDashboard)
-def get_user_dashboard(user_id: int, db: Session = Depends(get_db)):
-    """Get comprehensive dashboard data for a user."""
-    # Total points
-    points_result = (
-        db.query(func.sum(PointsLedger.points))
-        .filter(PointsLedger.user_id == user_id)
-        .scalar()
-    )
+def _dashboard_counters():
+    """(field, aggregate, user column, filters) for every dashboard counter."""
+    return [
+        # Total points, from the materialized balances
+        ("total_points", func.sum(PointsBalance.total_points), PointsBalance.user_id, ()),
+        ("active_programs", func.count(Enrollment.id), Enrollment.user_id, (Enrollment.is_active,)),
+        ("total_check_ins", func.count(CheckIn.id), CheckIn.user_id, ()),
+        # Current active streaks (streak > 0)
+        ("current_streaks", func.count(Streak.id), Streak.user_id, (Streak.current_streak > 0,)),
+        ("badges_earned", func.count(UserBadge.id), UserBadge.user_id, ()),
+    ]
 
-    # Active programs
-    active_programs = (
-        db.query(func.count(Enrollment.id))
-        .filter(Enrollment.user_id == user_id, Enrollment.is_active)
-        .scalar()
-    )
 
-    # Total check-ins
-    total_check_ins = (
-        db.query(func.count(CheckIn.id)).filter(CheckIn.user_id == user_id).scalar()
+def _dashboard_query(user_id: int):
+    """Every dashboard counter as a scalar subquery of one SELECT."""
+    return select(
+        *(
+            select(func.coalesce(aggregate, 0))
+            .where(user_column == user_id, *filters)
+            .scalar_subquery()
+            .label(field)
+            for field, aggregate, user_column, filters in _dashboard_counters()
+        )
     )
 
-    # Current active streaks (streak > 0)
-    current_streaks = (
-        db.query(func.count(Streak.id))
-        .filter(Streak.user_id == user_id, Streak.current_streak > 0)
-        .scalar()
-    )
 
-    # Badges earned
-    badges_earned = (
-        db.query(func.count(UserBadge.id)).filter(UserBadge.user_id == user_id).scalar()
-    )
+def _dashboards_query(user_ids: List[int]):
+    """(field, user_id, value) rows for users with a non-zero counter, in one statement.
 
-    return UserDashboard(
-        user_id=user_id,
-        total_points=points_result or 0,
-        active_programs=active_programs or 0,
-        total_check_ins=total_check_ins or 0,
-        current_streaks=current_streaks or 0,
-        badges_earned=badges_earned or 0,
+    Each counter is grouped by user over the requested ids, so the cost does
+    not grow with the number of users beyond the index lookups.
+    """
+    return union_all(
+        *(
+            select(
+                literal(field).label("field"),
+                user_column.label("user_id"),
+                aggregate.label("value"),
+            )
+            .where(user_column.in_(user_ids), *filters)
+            .group_by(user_column)
+            for field, aggregate, user_column, filters in _dashboard_counters()
+        )
     )
+
+
+@router.get("/dashboards", response_model=List[UserDashboard])
+async def get_user_dashboards(
+    user_ids: List[int] = Query(...), db: AsyncSession = Depends(get_async_db)
+):
+    """Dashboards of several users (e.g. a clinician's patient panel), in request order."""
+    user_ids = list(dict.fromkeys(user_ids))
+    if len(user_ids) > DASHBOARD_BATCH_LIMIT:
+        raise HTTPException(
+            status_code=400, detail=f"At most {DASHBOARD_BATCH_LIMIT} users per request"
+        )
+    dashboards = {
+        user_id: {"user_id": user_id, **{field: 0 for field, *_ in _dashboard_counters()}}
+        for user_id in user_ids
+    }
+    for field, user_id, value in await db.execute(_dashboards_query(user_ids)):
+        dashboards[user_id][field] = value or 0
+    return [UserDashboard(**dashboard) for dashboard in dashboards.values()]
+
+
+@router.get("/{user_id}/dashboard", response_model=UserDashboard)
+async def get_user_dashboard(
+    user_id: int,
+    version: Optional[str] = Depends(user_version),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Get comprehensive dashboard data for a user.
+
+    One round trip to Postgres, or none when the user's cached dashboard is current.
+    """
+
+    async def load():
+        counters = (await db.execute(_dashboard_query(user_id))).one()
+        return {"user_id": user_id, **counters._asdict()}
+
+    return UserDashboard(**await cached_for_user(user_id, "dashboard", version, load))
@@ -1,7 +1,10 @@
 """Pydantic schemas for request/response validation."""
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from typing import Any, Dict, List, Optional
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
+
+# Clients ahead of UTC may already be on the next day
+CHECK_IN_MAX_DAYS_AHEAD = 1
 
 
 # ============= Program Schemas =============
@@ -96,6 +99,16 @@ class CheckInBase(BaseModel):
 class CheckInCreate(CheckInBase):
     user_id: int
 
+    @field_validator("check_in_date")
+    @classmethod
+    def not_in_the_future(cls, value: date) -> date:
+        # Future months have no partition yet, and rows for them in the default
+        # partition would block its creation
+        latest = datetime.utcnow().date() + timedelta(days=CHECK_IN_MAX_DAYS_AHEAD)
+        if value > latest:
+            raise ValueError(f"check_in_date cannot be after {latest.isoformat()}")
+        return value
+
 
 class CheckInResponse(CheckInBase):
     id: int
@@ -106,6 +119,29 @@ class CheckInResponse(CheckInBase):
         from_attributes = True
 
 
+class CheckInBatchCreate(BaseModel):
+    check_ins: List[CheckInCreate] = Field(..., min_length=1, max_length=500)
+
+
+class CheckInBatchItemResult(BaseModel):
+    index: int
+    status: str  # "created", "duplicate" or "habit_not_found"
+    check_in: Optional[CheckInResponse] = None
+
+
+class CheckInBatchResponse(BaseModel):
+    created_count: int
+    duplicate_count: int
+    results: List[CheckInBatchItemResult]
+
+
+class CheckInPending(BaseModel):
+    """A check-in accepted in write-behind mode but not yet materialized."""
+    event_id: str
+    enqueued_at: datetime
+    check_in: CheckInCreate
+
+
 # ============= Points Ledger Schemas =============
 class PointsLedgerBase(BaseModel):
     points: int
@@ -202,6 +238,10 @@ class UserPointsBalance(BaseModel):
     transaction_count: int
 
 
+class UserPointsBalanceAsOf(UserPointsBalance):
+    as_of: date
+
+
 class UserDashboard(BaseModel):
     user_id: int
     total_points: int
@@ -211,6 +251,51 @@ class UserDashboard(BaseModel):
     badges_earned: int
 
 
+class MetricRollupPoint(BaseModel):
+    period_start: date
+    count: int
+    mean: float
+    min: float
+    max: float
+    p50: float
+    p90: float
+
+
+class MetricRollupResponse(BaseModel):
+    metric_key: str
+    granularity: str  # "day", "week" or "month"
+    user_id: Optional[int] = None
+    program_id: Optional[int] = None
+    points: List[MetricRollupPoint]
+
+
+class CohortRetentionRow(BaseModel):
+    cohort_start: date  # Monday of the week the enrollments started
+    size: int
+    retained: List[int]  # enrollments with a check-in in week 0, 1, ... after starting
+    retention: List[float]
+
+
+class CohortRetentionResponse(BaseModel):
+    program_id: Optional[int] = None
+    start_date: date
+    end_date: date
+    weeks: int
+    cohorts: List[CohortRetentionRow]
+
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    user_id: int
+    points: int
+
+
+class LeaderboardResponse(BaseModel):
+    program_id: Optional[int] = None
+    period: str  # "all" or "week"
+    entries: List[LeaderboardEntry]
+
+
 # ============= Protocol Schemas =============
 class ProtocolTemplateBase(BaseModel):
     code: str
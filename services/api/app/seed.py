@@ -11,6 +11,7 @@ from app.models import (
     PointsLedger,
     Streak,
 )
+from app.points_ledger import reconcile_balances
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -174,6 +175,8 @@ def seed_data():
             )
             db.add(streak)
 
+        # Ledger rows above were added directly; build their balances
+        reconcile_balances(db, repair=True)
         db.commit()
         logger.info("✅ Database seeded successfully!")
         logger.info(f"   - {len([lifestyle_program, nutrition_program])} programs created")
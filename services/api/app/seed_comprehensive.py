@@ -14,6 +14,7 @@ from app.models import (
     Streak,
 )
 from app.auth import get_password_hash
+from app.points_ledger import reconcile_balances
 from app.seed_young_forever import seed_young_forever_core
 
 logging.basicConfig(level=logging.INFO)
@@ -414,6 +415,8 @@ def seed_comprehensive_data():
 
         seed_young_forever_core(db)
 
+        # Ledger rows above were added directly; build their balances
+        reconcile_balances(db, repair=True)
         db.commit()
         logger.info("✅ Comprehensive database seed completed successfully!")
         logger.info(f"   📊 {len(programs)} programs created")
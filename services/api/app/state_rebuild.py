@@ -0,0 +1,272 @@
+"""Rebuild streaks and points balances by replaying check-ins and the ledger.
+
+Meant for after a fix to streak or ledger logic. Users are split into chunks of
+consecutive ids, and each chunk is one transaction:
+- it locks its users' balance and streak rows;
+- it reconciles their balances against the ledger;
+- it streams their check-ins in date order through the streak engine;
+  months of check-ins the worker detached are taken from the streaks' stored
+  runs instead;
+- it writes every streak that changed back with one bulk upsert.
+
+With more than one worker, chunks run in a process pool, and each process has
+its own database connection. The admin endpoint and the worker queue rebuilds
+for the maintenance runner in app.maintenance_jobs, so the pool never runs
+inside an API process.
+
+A dry run writes nothing and reports what would change. A check-in for a habit
+that has no streak row yet, if it commits while its chunk runs, can be missed,
+so run the rebuild when traffic is quiet. Leaderboards are rebuilt afterwards
+when balances changed and Redis is configured.
+
+`python -m app.state_rebuild [--workers 4] [--chunk-size 500] [--dry-run]`
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import select, union
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.database import SessionLocal, dialect_insert
+from app.habit_cache import get_habit_metas
+from app.leaderboards import rebuild_leaderboards
+from app.models import CheckIn, PointsLedger, Streak, UserPointsBalance
+from app.points_ledger import reconcile_balances, retention_horizon
+from app.redis_client import get_redis
+from app.streak_engine import HabitStreak
+from app.user_cache import invalidate_users
+
+REBUILD_CHUNK_SIZE = 500
+STREAK_FIELDS = ("current_streak", "longest_streak", "last_check_in_date", "completed_runs")
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ChunkResult:
+    users: int
+    streaks_changed: int = 0
+    balances_changed: int = 0
+    diffs: List[Dict[str, Any]] = field(default_factory=list)
+
+
+@dataclass
+class RebuildReport:
+    users_total: int
+    dry_run: bool
+    max_diffs: int = 50
+    users_done: int = 0
+    streaks_changed: int = 0
+    balances_changed: int = 0
+    diffs: List[Dict[str, Any]] = field(default_factory=list)
+    started_at: float = field(default_factory=time.monotonic)
+
+    def add(self, result: ChunkResult) -> None:
+        self.users_done += result.users
+        self.streaks_changed += result.streaks_changed
+        self.balances_changed += result.balances_changed
+        self.diffs.extend(result.diffs[: self.max_diffs - len(self.diffs)])
+
+    def summary(self) -> str:
+        elapsed = time.monotonic() - self.started_at
+        percent = 100 * self.users_done / self.users_total if self.users_total else 100
+        return (
+            f"{self.users_done}/{self.users_total} users ({percent:.0f}%) in {elapsed:.0f}s: "
+            f"{self.streaks_changed} streaks and {self.balances_changed} balances "
+            + ("would change" if self.dry_run else "changed")
+        )
+
+
+def _jsonable(value):
+    return value.isoformat() if isinstance(value, date) else value
+
+
+def _diff(before: Dict[str, Any], after: Dict[str, Any], **key) -> Dict[str, Any]:
+    return {
+        **key,
+        **{
+            name: [_jsonable(before.get(name)), _jsonable(value)]
+            for name, value in after.items()
+            if before.get(name) != value
+        },
+    }
+
+
+def rebuild_chunk(db: Session, user_ids: Sequence[int], dry_run: bool = False) -> ChunkResult:
+    """Recompute the users' habit streaks and balances; the caller commits or rolls back."""
+    result = ChunkResult(users=len(user_ids))
+
+    # Balances first: appends lock balance rows before streak rows, so the same
+    # order here cannot deadlock with them.
+    for row in reconcile_balances(db, repair=not dry_run, user_ids=user_ids):
+        result.balances_changed += 1
+        result.diffs.append(
+            _diff(
+                {"total_points": row["balance_points"], "transaction_count": row["balance_count"]},
+                {"total_points": row["ledger_points"], "transaction_count": row["ledger_count"]},
+                kind="balance",
+                user_id=row["user_id"],
+                program_id=row["program_id"],
+            )
+        )
+
+    streaks = db.query(
+        Streak.user_id, Streak.habit_id, *(getattr(Streak, name) for name in STREAK_FIELDS)
+    )
+    streaks = streaks.filter(Streak.user_id.in_(user_ids), Streak.habit_id.isnot(None))
+    if not dry_run and db.get_bind().dialect.name == "postgresql":
+        streaks = streaks.with_for_update()
+    existing = {(row.user_id, row.habit_id): row for row in streaks}
+
+    rebuilt: Dict[tuple, HabitStreak] = {}
+    check_ins = select(CheckIn.user_id, CheckIn.habit_id, CheckIn.check_in_date).where(
+        CheckIn.user_id.in_(user_ids)
+    )
+    horizon = retention_horizon(db, CheckIn.__tablename__)
+    if horizon is not None:
+        # Days before the horizon are only left in the stored runs
+        cutoff = horizon.toordinal()
+        for key, row in existing.items():
+            runs = [
+                [first, min(last, cutoff - 1)]
+                for first, last in HabitStreak.from_row(row).runs
+                if first < cutoff
+            ]
+            longest = max((last - first + 1 for first, last in runs), default=0)
+            rebuilt[key] = HabitStreak(runs, longest)
+        check_ins = check_ins.where(CheckIn.check_in_date >= horizon)
+    check_ins = check_ins.order_by(CheckIn.user_id, CheckIn.check_in_date).execution_options(
+        yield_per=5000
+    )
+    for user_id, habit_id, check_in_date in db.execute(check_ins):
+        rebuilt.setdefault((user_id, habit_id), HabitStreak()).add(check_in_date)
+
+    changed = []
+    for key in sorted(existing.keys() | rebuilt.keys()):
+        after = rebuilt.get(key, HabitStreak()).as_row()
+        row = existing.get(key)
+        before = {name: getattr(row, name) for name in STREAK_FIELDS} if row else {}
+        if before != after:
+            changed.append((key, after))
+            result.diffs.append(
+                _diff(before, after, kind="streak", user_id=key[0], habit_id=key[1])
+            )
+    result.streaks_changed = len(changed)
+
+    if changed and not dry_run:
+        habits = get_habit_metas(db, {habit_id for (_, habit_id), _ in changed})
+        now = datetime.utcnow()
+        stmt = dialect_insert(db, Streak).values(
+            [
+                {
+                    "user_id": user_id,
+                    "habit_id": habit_id,
+                    "program_id": habits[habit_id].program_id if habit_id in habits else None,
+                    **after,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for (user_id, habit_id), after in changed
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "habit_id"],
+            set_={
+                **{name: stmt.excluded[name] for name in STREAK_FIELDS},
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+        db.execute(stmt)
+        invalidate_users(db, (user_id for (user_id, _), _ in changed))
+    return result
+
+
+def _run_chunk(session_factory: Callable[[], Session], user_ids, dry_run: bool) -> ChunkResult:
+    db = session_factory()
+    try:
+        result = rebuild_chunk(db, user_ids, dry_run)
+        if dry_run:
+            db.rollback()
+        else:
+            db.commit()
+        return result
+    finally:
+        db.close()
+
+
+def _run_chunk_in_worker(user_ids, dry_run: bool) -> ChunkResult:
+    # Pool processes are spawned, so SessionLocal binds a fresh engine in each
+    return _run_chunk(SessionLocal, user_ids, dry_run)
+
+
+def rebuild_state(
+    session_factory: sessionmaker = SessionLocal,
+    workers: int = 1,
+    chunk_size: int = REBUILD_CHUNK_SIZE,
+    dry_run: bool = False,
+    max_diffs: int = 50,
+    progress: Optional[Callable[[RebuildReport], None]] = None,
+) -> RebuildReport:
+    """Replay every user with any check-in, streak, ledger entry or balance.
+
+    `progress` is called with the running report after each chunk. With more
+    than one worker the chunks run in a process pool on `SessionLocal`, so
+    `session_factory` only applies to in-process runs.
+    """
+    users = union(
+        select(CheckIn.user_id),
+        select(Streak.user_id),
+        select(PointsLedger.user_id),
+        select(UserPointsBalance.user_id),
+    )
+    with session_factory() as db:
+        user_ids = sorted(db.execute(users).scalars())
+    chunks = [user_ids[start : start + chunk_size] for start in range(0, len(user_ids), chunk_size)]
+    report = RebuildReport(users_total=len(user_ids), dry_run=dry_run, max_diffs=max_diffs)
+
+    def record(result: ChunkResult) -> None:
+        report.add(result)
+        if progress is not None:
+            progress(report)
+
+    if workers <= 1:
+        for chunk in chunks:
+            record(_run_chunk(session_factory, chunk, dry_run))
+    else:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [pool.submit(_run_chunk_in_worker, chunk, dry_run) for chunk in chunks]
+            for future in as_completed(futures):
+                record(future.result())
+
+    client = get_redis()
+    if report.balances_changed and not dry_run and client is not None:
+        with session_factory() as db:
+            rebuild_leaderboards(db, client)
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Rebuild streaks and balances from events.")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=REBUILD_CHUNK_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="report changes without writing")
+    parser.add_argument("--max-diffs", type=int, default=50, help="changes to print")
+    args = parser.parse_args()
+    report = rebuild_state(
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        dry_run=args.dry_run,
+        max_diffs=args.max_diffs,
+        progress=lambda report: logger.info(report.summary()),
+    )
+    for diff in report.diffs:
+        logger.info(json.dumps(diff))
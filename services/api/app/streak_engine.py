@@ -0,0 +1,132 @@
+"""Incremental streak engine over compact runs of completed days.
+
+Each (user, habit) streak keeps the days it was completed as a sorted list of
+disjoint, non-adjacent ``[first_day, last_day]`` runs of date ordinals. Adding a
+day finds its place with a binary search and merges it with at most its two
+neighbouring runs, so back-filled and out-of-order check-ins keep
+``current_streak`` and ``longest_streak`` exact without reading ``check_ins``
+again. A day that starts a new run, or joins two, inserts into or deletes from
+the list, which is linear in the number of runs (not days); days added after
+the last run only append. The row stores the whole list, so each write costs
+O(runs) regardless.
+"""
+from __future__ import annotations
+
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+
+Runs = List[List[int]]
+
+
+@dataclass
+class DayAdded:
+    """Outcome of adding one day to a streak."""
+
+    added: bool
+    run_start: int
+    run_end: int
+    left_length: int = 0  # run that ended the day before, prior to merging
+    right_length: int = 0  # run that started the day after, prior to merging
+    first: bool = False  # the streak had no days before this one
+
+    @property
+    def run_length(self) -> int:
+        return self.run_end - self.run_start + 1
+
+
+def add_day(runs: Runs, day: int) -> DayAdded:
+    """Insert a day ordinal into `runs` in place, merging adjacent runs.
+
+    O(log runs) to find the day's place; a new or removed run in the middle of
+    the list shifts the runs after it.
+    """
+    first = not runs
+    index = bisect_right(runs, day, key=lambda run: run[0])
+    left = runs[index - 1] if index > 0 else None
+    right = runs[index] if index < len(runs) else None
+
+    if left is not None and left[0] <= day <= left[1]:
+        return DayAdded(added=False, run_start=left[0], run_end=left[1])
+
+    joins_left = left is not None and left[1] == day - 1
+    joins_right = right is not None and right[0] == day + 1
+    left_length = left[1] - left[0] + 1 if joins_left else 0
+    right_length = right[1] - right[0] + 1 if joins_right else 0
+
+    if joins_left and joins_right:
+        left[1] = right[1]
+        del runs[index]
+        run = left
+    elif joins_left:
+        left[1] = day
+        run = left
+    elif joins_right:
+        right[0] = day
+        run = right
+    else:
+        run = [day, day]
+        runs.insert(index, run)
+
+    return DayAdded(
+        added=True,
+        run_start=run[0],
+        run_end=run[1],
+        left_length=left_length,
+        right_length=right_length,
+        first=first,
+    )
+
+
+def run_containing(runs: Runs, day: int) -> Optional[List[int]]:
+    """The run that includes `day`, if any."""
+    index = bisect_right(runs, day, key=lambda run: run[0])
+    if index > 0 and runs[index - 1][1] >= day:
+        return runs[index - 1]
+    return None
+
+
+class HabitStreak:
+    """In-memory streak state for one (user, habit) pair."""
+
+    def __init__(self, runs: Optional[Runs] = None, longest: int = 0):
+        self.runs: Runs = [list(run) for run in runs or []]
+        self.longest = longest
+        if self.runs:
+            self.longest = max(self.longest, self.current_streak)
+
+    @classmethod
+    def from_row(cls, streak: Any) -> "HabitStreak":
+        """Load a `Streak` row, seeding runs from legacy counters when missing."""
+        runs = streak.completed_runs
+        if runs is None and streak.last_check_in_date and streak.current_streak:
+            last_day = streak.last_check_in_date.toordinal()
+            runs = [[last_day - streak.current_streak + 1, last_day]]
+        return cls(runs, streak.longest_streak or 0)
+
+    def add(self, check_in_date: date) -> DayAdded:
+        added = add_day(self.runs, check_in_date.toordinal())
+        if added.added:
+            self.longest = max(self.longest, added.run_length)
+        return added
+
+    @property
+    def current_streak(self) -> int:
+        if not self.runs:
+            return 0
+        first_day, last_day = self.runs[-1]
+        return last_day - first_day + 1
+
+    @property
+    def last_check_in_date(self) -> Optional[date]:
+        return date.fromordinal(self.runs[-1][1]) if self.runs else None
+
+    def as_row(self) -> Dict[str, Any]:
+        return {
+            "current_streak": self.current_streak,
+            "longest_streak": self.longest,
+            "last_check_in_date": self.last_check_in_date,
+            "completed_runs": self.runs,
+        }
@@ -0,0 +1,152 @@
+"""Per-user versions in Redis, for conditional GETs and cached responses.
+
+Every write to a user's check-ins, ledger, balances, streaks, badges or
+enrollments calls `invalidate_users`. Once the transaction commits, that
+increments the user's version counter. Reads take the version before touching
+Postgres, so their data is at least that fresh.
+- `user_version` turns the version into a weak ETag and answers a matching
+  `If-None-Match` with 304 before any query runs.
+- `cached_for_user` serves a stored response while its version is still current.
+
+A counter starts at the current time in microseconds when it is created, so
+one that expired and was recreated never reuses a value an old ETag or cache
+entry holds. Redis is optional: without it, or when it errors, there are no
+ETags and reads go straight to Postgres.
+"""
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from fastapi import HTTPException, Request, Response
+from redis.exceptions import RedisError
+from sqlalchemy.orm import Session
+
+from app.database import call_after_commit
+from app.redis_client import get_async_redis, get_redis
+
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "300"))
+USER_VERSION_TTL_SECONDS = 30 * 24 * 3600
+
+logger = logging.getLogger(__name__)
+
+
+def user_version_key(user_id: int) -> str:
+    return f"user_version:{user_id}"
+
+
+def user_cache_key(user_id: int, name: str) -> str:
+    return f"user_cache:{user_id}:{name}"
+
+
+def user_etag(user_id: int, version: str) -> str:
+    return f'W/"{user_id}-{version}"'
+
+
+def _version_seed() -> int:
+    return time.time_ns() // 1000
+
+
+def invalidate_users(db: Session, user_ids: Iterable[int]) -> None:
+    """Bump the users' versions once `db` commits, dropping their cached responses."""
+    user_ids = set(user_ids)
+    if user_ids:
+        call_after_commit(db, lambda: _bump_versions(user_ids))
+
+
+def _bump_versions(user_ids) -> None:
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        for user_id in user_ids:
+            key = user_version_key(user_id)
+            pipe.set(key, _version_seed(), nx=True)
+            pipe.incr(key)
+            pipe.expire(key, USER_VERSION_TTL_SECONDS)
+        pipe.execute()
+    except RedisError:
+        # Stale ETags and cached entries may be served until the next write
+        logger.warning("Could not bump user versions", exc_info=True)
+
+
+def _text(value) -> Optional[str]:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+async def read_user_version(user_id: int) -> Optional[str]:
+    """The user's current version, creating the counter if needed; None without Redis."""
+    client = get_async_redis()
+    if client is None:
+        return None
+    key = user_version_key(user_id)
+    try:
+        version = await client.get(key)
+        if version is None:
+            pipe = client.pipeline(transaction=False)
+            pipe.set(key, _version_seed(), nx=True, ex=USER_VERSION_TTL_SECONDS)
+            pipe.get(key)
+            _, version = await pipe.execute()
+    except RedisError:
+        logger.warning("User versions unavailable; reading from the database", exc_info=True)
+        return None
+    return _text(version)
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison: W/ prefixes are ignored
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip() == "*" or candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
+
+
+async def user_version(user_id: int, request: Request, response: Response) -> Optional[str]:
+    """Dependency for per-user GETs: sets the ETag, or answers 304 if the client has it."""
+    version = await read_user_version(user_id)
+    if version is None:
+        return None
+    etag = user_etag(user_id, version)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, etag):
+        raise HTTPException(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return version
+
+
+async def cached_for_user(
+    user_id: int,
+    name: str,
+    version: Optional[str],
+    load: Callable[[], Awaitable[Dict[str, Any]]],
+) -> Dict[str, Any]:
+    """Return the user's cached `name` response if stored at `version`.
+
+    Otherwise `load()` it and store it under that version.
+    """
+    client = get_async_redis()
+    if client is None or version is None:
+        return await load()
+    cache_key = user_cache_key(user_id, name)
+    try:
+        cached = await client.get(cache_key)
+    except RedisError:
+        logger.warning("User cache unavailable; reading from the database", exc_info=True)
+        return await load()
+    if cached is not None:
+        entry = json.loads(cached)
+        if entry["version"] == version:
+            return entry["data"]
+
+    data = await load()
+    try:
+        await client.set(
+            cache_key, json.dumps({"version": version, "data": data}), ex=USER_CACHE_TTL_SECONDS
+        )
+    except RedisError:
+        logger.warning("Could not cache user response", exc_info=True)
+    return data
@@ -0,0 +1,39 @@
+import pytest
+
+from app.analytics_cache import analytics_cache
+from app.habit_cache import habit_cache
+from app.query_stats import QUERY_COUNT_HEADER
+
+
+@pytest.fixture(autouse=True)
+def empty_habit_cache():
+    # Every test module has its own database, so habit ids get reused across them
+    habit_cache.bump()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def empty_analytics_cache():
+    # Tests change the data between analytics reads
+    analytics_cache.clear()
+    yield
+
+
+@pytest.fixture
+def query_budget():
+    """Assert a response ran at most `budget` SQL statements: `query_budget(response, 2)`.
+
+    Budgets should not depend on how many rows the endpoint returns; a loop of
+    per-row queries (N+1) then fails as soon as a test has more than one row.
+    """
+
+    def check(response, budget: int):
+        count = int(response.headers[QUERY_COUNT_HEADER])
+        request = response.request
+        assert count <= budget, (
+            f"{request.method} {request.url.path} ran {count} SQL statements "
+            f"(budget {budget})"
+        )
+        return response
+
+    return check
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from app.analytics_cache import AnalyticsCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_concurrent_misses_share_one_computation_then_hit():
+    clock = Clock()
+    cache = AnalyticsCache(maxsize=8, ttl_seconds=60, stale_seconds=300, clock=clock)
+    calls = []
+
+    async def load():
+        calls.append(clock.now)
+        await asyncio.sleep(0.01)
+        return {"total": len(calls)}
+
+    async def scenario():
+        first = await asyncio.gather(*(cache.get("overview", load) for _ in range(5)))
+        second = await cache.get("overview", load)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == [({"total": 1}, "MISS")] * 5
+    assert second == ({"total": 1}, "HIT")
+    assert len(calls) == 1
+    assert cache.snapshot() == {
+        "hits": 1,
+        "stale_hits": 0,
+        "misses": 1,
+        "coalesced": 4,
+        "refreshes": 0,
+        "errors": 0,
+        "entries": 1,
+        "hit_ratio": round(1 / 6, 4),
+    }
+
+
+def test_stale_entries_are_served_while_one_refresh_runs():
+    clock = Clock()
+    cache = AnalyticsCache(maxsize=8, ttl_seconds=60, stale_seconds=300, clock=clock)
+    values = iter(["v1", "v2", "v3"])
+
+    async def load():
+        await asyncio.sleep(0)
+        return next(values)
+
+    async def scenario():
+        served = [await cache.get("trends", load)]
+        clock.now += 61
+        served += await asyncio.gather(cache.get("trends", load), cache.get("trends", load))
+        await asyncio.sleep(0.01)  # let the background refresh finish
+        served.append(await cache.get("trends", load))
+        # Past the stale window the request waits for a new value
+        clock.now += 61 + 300
+        served.append(await cache.get("trends", load))
+        return served
+
+    assert asyncio.run(scenario()) == [
+        ("v1", "MISS"),
+        ("v1", "STALE"),
+        ("v1", "STALE"),
+        ("v2", "HIT"),
+        ("v3", "MISS"),
+    ]
+    assert (cache.stats.stale_hits, cache.stats.refreshes) == (2, 1)
+
+
+def test_failures_are_not_cached_and_keep_the_stale_entry():
+    clock = Clock()
+    cache = AnalyticsCache(maxsize=1, ttl_seconds=60, stale_seconds=300, clock=clock)
+
+    async def fail():
+        raise RuntimeError("database down")
+
+    async def ok():
+        return "ok"
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await cache.get("badges", fail)
+        assert await cache.get("badges", ok) == ("ok", "MISS")
+        clock.now += 61
+        assert await cache.get("badges", fail) == ("ok", "STALE")
+        await asyncio.sleep(0)
+        assert await cache.get("badges", ok) == ("ok", "STALE")
+        await asyncio.sleep(0)
+        # maxsize 1: another key evicts this one
+        await cache.get("overview", ok)
+        assert await cache.get("badges", ok) == ("ok", "MISS")
+
+    asyncio.run(scenario())
+    assert cache.stats.errors == 2
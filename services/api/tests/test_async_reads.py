@@ -0,0 +1,541 @@
+import asyncio
+import os
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import database
+from app.auth import require_admin
+from app.database import Base, get_async_db, run_concurrently
+from app.main import app
+from app.models import (
+    ArchivedPartition,
+    Badge,
+    CheckIn,
+    DailyRollup,
+    Enrollment,
+    Habit,
+    PointsCheckpoint,
+    PointsLedger,
+    Program,
+    Streak,
+    User,
+    UserBadge,
+)
+from app import user_cache
+from app.points_ledger import NO_PROGRAM, append_ledger_entries
+
+
+engine = None
+async_engine = None
+TestingSessionLocal = None
+TestingAsyncSessionLocal = None
+
+
+class DummyUser:
+    id = 999
+    role = "admin"
+
+
+class InMemoryRedis:
+    """Just enough of redis.Redis for user versions; `async_client` shares its data."""
+
+    def __init__(self):
+        self.values = {}
+        self.results = []
+        self.async_client = self._AsyncClient(self)
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        results, self.results = self.results, []
+        return results
+
+    def set(self, key, value, nx=False, ex=None):
+        if not (nx and key in self.values):
+            self.values[key] = str(value)
+        self.results.append(True)
+
+    def get(self, key):
+        self.results.append(self.values.get(key))
+
+    def incr(self, key):
+        self.values[key] = str(int(self.values[key]) + 1)
+        self.results.append(int(self.values[key]))
+
+    def expire(self, key, seconds):
+        self.results.append(True)
+
+    class _AsyncClient:
+        def __init__(self, store):
+            self.store = store
+
+        def pipeline(self, transaction=True):
+            return self._AsyncPipeline(self.store)
+
+        async def get(self, key):
+            value = self.store.values.get(key)
+            return value.encode() if value is not None else None
+
+        async def set(self, key, value, nx=False, ex=None):
+            self.store.set(key, value, nx)
+            return self.store.execute()[0]
+
+        class _AsyncPipeline:
+            def __init__(self, store):
+                self.store = store
+                self.set = store.set
+                self.get = store.get
+
+            async def execute(self):
+                return self.store.execute()
+
+
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
+def setup_module(module):
+    global engine, async_engine, TestingSessionLocal, TestingAsyncSessionLocal
+    # A file database so the concurrent reads each get their own connection
+    path = module.__file__.replace(".py", ".sqlite3")
+    engine = create_engine(f"sqlite:///{path}")
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    TestingAsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[require_admin] = lambda: DummyUser()
+
+
+def teardown_module(module):
+    app.dependency_overrides.clear()
+    Base.metadata.drop_all(bind=engine)
+    engine.dispose()
+    os.remove(module.__file__.replace(".py", ".sqlite3"))
+
+
+@contextmanager
+def _statements():
+    """Collect the SQL statements the async engine runs inside the block."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+
+def _seed():
+    db = TestingSessionLocal()
+    db.add(User(id=5, email="p5@example.com", full_name="Paciente 5", hashed_password="x"))
+    program = Program(name="Sono")
+    db.add(program)
+    db.flush()
+    habit = Habit(program_id=program.id, name="Dormir cedo")
+    badge = Badge(name="Iniciante", points_reward=5)
+    db.add_all([habit, badge])
+    db.flush()
+    append_ledger_entries(
+        db,
+        [
+            {"user_id": 5, "program_id": program.id, "points": 10, "event_type": "check_in"},
+            {"user_id": 5, "points": 5, "event_type": "badge_earned"},
+        ],
+    )
+    db.add_all(
+        [
+            Enrollment(user_id=5, program_id=program.id),
+            CheckIn(user_id=5, habit_id=habit.id, check_in_date=date(2026, 3, 1)),
+            Streak(user_id=5, habit_id=habit.id, program_id=program.id, current_streak=1),
+            UserBadge(user_id=5, badge_id=badge.id),
+        ]
+    )
+    db.commit()
+    db.close()
+
+
+def test_dashboard_and_overview_run_on_async_sessions():
+    _seed()
+    client = TestClient(app)
+
+    dashboard = client.get("/api/v1/users/5/dashboard")
+    assert dashboard.status_code == 200
+    assert dashboard.json() == {
+        "user_id": 5,
+        "total_points": 15,
+        "active_programs": 1,
+        "total_check_ins": 1,
+        "current_streaks": 1,
+        "badges_earned": 1,
+    }
+
+    as_of = client.get("/api/v1/users/5/points/as-of", params={"date": date.today().isoformat()})
+    assert as_of.json()["total_points"] == 15
+
+    today = date.today()
+    history = client.get("/api/v1/users/5/points/history", params={"start_date": today.isoformat()})
+    assert len(history.json()) == 2
+    earlier = client.get(
+        "/api/v1/users/5/points/history",
+        params={"end_date": (today - timedelta(days=1)).isoformat()},
+    )
+    assert earlier.json() == []
+
+    badges = client.get("/api/v1/users/5/badges")
+    assert badges.json()[0]["badge"]["name"] == "Iniciante"
+
+    overview = client.get("/api/v1/admin/analytics/overview")
+    assert overview.status_code == 200
+    assert overview.json()["overview"]["total_points_awarded"] == 15
+    # Activity windows count check-ins by the day they were for
+    assert overview.json()["recent_activity"]["checkins_last_30_days"] == 0
+    assert overview.json()["top_performers"]["most_popular_programs"][0]["program_name"] == "Sono"
+
+
+def test_balance_as_of_refuses_days_inside_a_detached_ledger_month():
+    db = TestingSessionLocal()
+    append_ledger_entries(
+        db,
+        [
+            {"user_id": 9, "points": points, "event_type": "check_in", "created_at": created_at}
+            for points, created_at in ((10, datetime(2026, 1, 10)), (4, datetime(2026, 2, 3)))
+        ],
+    )
+    # What the worker leaves when it detaches January: the checkpoint, not the rows
+    db.add(
+        PointsCheckpoint(
+            user_id=9,
+            program_id=NO_PROGRAM,
+            checkpoint_at=datetime(2026, 2, 1),
+            total_points=10,
+            transaction_count=1,
+        )
+    )
+    db.query(PointsLedger).filter(PointsLedger.created_at < datetime(2026, 2, 1)).delete()
+    db.add(ArchivedPartition(table_name="points_ledger", month=date(2026, 1, 1)))
+    db.commit()
+    db.close()
+    client = TestClient(app)
+
+    def as_of(day):
+        return client.get("/api/v1/users/9/points/as-of", params={"date": day.isoformat()})
+
+    inside = as_of(date(2026, 1, 15))
+    assert inside.status_code == 410
+    assert "2026-01-31" in inside.json()["detail"]
+    assert as_of(date(2026, 1, 31)).json()["total_points"] == 10
+    assert as_of(date(2026, 2, 3)).json()["total_points"] == 14
+
+
+def test_dashboard_is_cached_until_one_of_its_writes_commits(monkeypatch):
+    store = InMemoryRedis()
+    monkeypatch.setattr(user_cache, "get_redis", lambda: store)
+    monkeypatch.setattr(user_cache, "get_async_redis", lambda: store.async_client)
+    client = TestClient(app)
+
+    db = TestingSessionLocal()
+    db.add(Enrollment(user_id=6, program_id=db.query(Program.id).scalar()))
+    db.commit()
+    response = client.get("/api/v1/users/6/dashboard")
+    first, etag = response.json(), response.headers["etag"]
+    assert (first["total_points"], first["active_programs"]) == (0, 1)
+    assert etag.startswith('W/"6-')
+
+    # A current ETag is answered before the database is touched
+    with _statements() as statements:
+        for path in ("dashboard", "streaks", "badges", "points"):
+            response = client.get(f"/api/v1/users/6/{path}", headers={"If-None-Match": etag})
+            assert response.status_code == 304
+            assert response.headers["etag"] == etag
+    assert statements == []
+
+    # Rows written without invalidating are not seen while the entry is current
+    db.add(UserBadge(user_id=6, badge_id=db.query(Badge.id).scalar()))
+    db.commit()
+    assert client.get("/api/v1/users/6/dashboard").json() == first
+
+    append_ledger_entries(db, [{"user_id": 6, "points": 7, "event_type": "manual"}])
+    db.rollback()
+    assert client.get("/api/v1/users/6/dashboard").json() == first
+    append_ledger_entries(db, [{"user_id": 6, "points": 7, "event_type": "manual"}])
+    db.commit()
+    response = client.get("/api/v1/users/6/dashboard", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert (response.json()["total_points"], response.json()["badges_earned"]) == (7, 1)
+    db.close()
+
+
+def test_batch_dashboards_cost_one_statement_for_any_panel_size():
+    with _statements() as statements:
+        response = TestClient(app).get(
+            "/api/v1/users/dashboards", params={"user_ids": [404, 5, 404, *range(1000, 1100)]}
+        )
+    assert response.status_code == 200
+    dashboards = response.json()
+    assert len(statements) == 1
+    assert [dashboard["user_id"] for dashboard in dashboards[:2]] == [404, 5]
+    assert len(dashboards) == 102
+    assert dashboards[0] == {
+        "user_id": 404,
+        "total_points": 0,
+        "active_programs": 0,
+        "total_check_ins": 0,
+        "current_streaks": 0,
+        "badges_earned": 0,
+    }
+    assert dashboards[1] == TestClient(app).get("/api/v1/users/5/dashboard").json()
+
+    too_many = {"user_ids": list(range(201))}
+    assert TestClient(app).get("/api/v1/users/dashboards", params=too_many).status_code == 400
+
+
+def test_trends_and_activity_windows_read_the_daily_rollups():
+    db = TestingSessionLocal()
+    program_id = db.query(Program.id).scalar()
+    today = date.today()
+    db.add_all(
+        [
+            DailyRollup(
+                program_id=0,
+                habit_id=0,
+                day=today - timedelta(days=400),
+                check_ins=50,
+                active_users=9,
+                points_awarded=500,
+            ),
+            DailyRollup(
+                program_id=0,
+                habit_id=0,
+                day=today - timedelta(days=20),
+                check_ins=4,
+                active_users=3,
+                points_awarded=40,
+            ),
+            DailyRollup(
+                program_id=0,
+                habit_id=0,
+                day=today - timedelta(days=2),
+                check_ins=3,
+                active_users=2,
+                points_awarded=35,
+            ),
+            DailyRollup(
+                program_id=program_id,
+                habit_id=0,
+                day=today - timedelta(days=2),
+                check_ins=1,
+                active_users=1,
+                points_awarded=10,
+            ),
+            # Only ledger activity that day
+            DailyRollup(
+                program_id=0,
+                habit_id=0,
+                day=today - timedelta(days=1),
+                check_ins=0,
+                active_users=0,
+                points_awarded=5,
+            ),
+        ]
+    )
+    db.commit()
+    db.close()
+    client = TestClient(app)
+
+    with _statements() as statements:
+        trends = client.get("/api/v1/admin/analytics/engagement-trends", params={"days": 365})
+    assert len(statements) == 1
+    assert trends.json()["daily_checkins"] == [
+        {"date": (today - timedelta(days=20)).isoformat(), "count": 4},
+        {"date": (today - timedelta(days=2)).isoformat(), "count": 3},
+    ]
+    assert trends.json()["daily_active_users"][1] == {
+        "date": (today - timedelta(days=2)).isoformat(),
+        "unique_users": 2,
+    }
+    by_program = client.get(
+        "/api/v1/admin/analytics/engagement-trends", params={"program_id": program_id}
+    )
+    assert by_program.json()["daily_active_users"] == [
+        {"date": (today - timedelta(days=2)).isoformat(), "unique_users": 1}
+    ]
+
+    activity = client.get("/api/v1/admin/analytics/overview").json()
+    assert activity["overview"]["total_checkins"] == 57
+    assert activity["recent_activity"]["checkins_last_7_days"] == 3
+    assert activity["recent_activity"]["checkins_last_30_days"] == 7
+
+
+def test_program_performance_counts_check_ins_through_each_habits_program():
+    db = TestingSessionLocal()
+    walking, sleeping = Program(name="Caminhada"), Program(name="Descanso")
+    db.add_all([walking, sleeping, Program(name="Arquivado", is_active=False)])
+    db.flush()
+    steps = Habit(program_id=walking.id, name="Passos")
+    stretch = Habit(program_id=walking.id, name="Alongar")
+    db.add_all([steps, stretch, Habit(program_id=sleeping.id, name="Deitar cedo")])
+    db.flush()
+    # User 7 is enrolled in both programs but only checks in to walking habits
+    db.add_all(
+        [
+            Enrollment(user_id=7, program_id=walking.id),
+            Enrollment(user_id=7, program_id=sleeping.id),
+            Enrollment(user_id=8, program_id=walking.id),
+            CheckIn(user_id=7, habit_id=steps.id, check_in_date=date(2026, 5, 1)),
+            CheckIn(user_id=7, habit_id=steps.id, check_in_date=date(2026, 5, 2)),
+            CheckIn(user_id=8, habit_id=steps.id, check_in_date=date(2026, 5, 2)),
+            CheckIn(user_id=7, habit_id=stretch.id, check_in_date=date(2026, 6, 1)),
+        ]
+    )
+    append_ledger_entries(
+        db, [{"user_id": 7, "program_id": walking.id, "points": 30, "event_type": "check_in"}]
+    )
+    db.commit()
+    client = TestClient(app)
+
+    with _statements() as statements:
+        response = client.get(
+            "/api/v1/admin/analytics/program-performance", params={"by_habit": True}
+        )
+    assert len(statements) == 3
+    programs = {program["program_name"]: program for program in response.json()["programs"]}
+    assert "Arquivado" not in programs
+    walking_stats, sleeping_stats = programs["Caminhada"], programs["Descanso"]
+    assert (walking_stats["enrollment_count"], walking_stats["total_checkins"]) == (2, 4)
+    assert walking_stats["total_points_awarded"] == 30
+    assert walking_stats["avg_checkins_per_enrollment"] == 2.0
+    assert walking_stats["habits"][0] == {
+        "habit_id": steps.id,
+        "habit_name": "Passos",
+        "total_checkins": 3,
+        "active_users": 2,
+    }
+    assert walking_stats["habits"][1]["total_checkins"] == 1
+    assert sleeping_stats["total_checkins"] == 0
+    assert sleeping_stats["habits"][0]["total_checkins"] == 0
+
+    may = client.get(
+        "/api/v1/admin/analytics/program-performance",
+        params={"start_date": "2026-05-01", "end_date": "2026-05-31"},
+    ).json()
+    walking_may = next(p for p in may["programs"] if p["program_id"] == walking.id)
+    assert walking_may["total_checkins"] == 3
+    # Points in a range come from ledger entries created in it
+    assert walking_may["total_points_awarded"] == 0
+    assert "habits" not in walking_may
+    inverted = {"start_date": "2026-06-01", "end_date": "2026-05-01"}
+    assert client.get(
+        "/api/v1/admin/analytics/program-performance", params=inverted
+    ).status_code == 400
+    db.close()
+
+
+def test_cohort_retention_follows_each_enrollment_in_its_own_program():
+    db = TestingSessionLocal()
+    reading, writing = Program(name="Leitura"), Program(name="Escrita")
+    db.add_all([reading, writing])
+    db.flush()
+    pages = Habit(program_id=reading.id, name="Ler 10 páginas")
+    other = Habit(program_id=writing.id, name="Escrever um parágrafo")
+    db.add_all([pages, other])
+    db.flush()
+    monday = date.today() - timedelta(days=date.today().weekday() + 14)
+    db.add_all(
+        [
+            Enrollment(user_id=20, program_id=reading.id, enrolled_at=monday),
+            Enrollment(user_id=21, program_id=reading.id, enrolled_at=monday),
+            CheckIn(user_id=20, habit_id=pages.id, check_in_date=monday),
+            CheckIn(user_id=20, habit_id=pages.id, check_in_date=monday + timedelta(days=1)),
+            CheckIn(user_id=20, habit_id=pages.id, check_in_date=monday + timedelta(days=14)),
+            # Not a habit of the program the enrollment is for
+            CheckIn(user_id=21, habit_id=other.id, check_in_date=monday + timedelta(days=7)),
+        ]
+    )
+    db.commit()
+    program_id = reading.id
+    db.close()
+    client = TestClient(app)
+
+    with _statements() as statements:
+        response = client.get(
+            "/api/v1/admin/analytics/cohort-retention",
+            params={"program_id": program_id, "weeks": 4},
+        )
+    assert len(statements) == 2
+    body = response.json()
+    assert (body["program_id"], body["weeks"]) == (program_id, 4)
+    assert body["cohorts"] == [
+        {
+            "cohort_start": monday.isoformat(),
+            "size": 2,
+            "retained": [1, 0, 1],
+            "retention": [0.5, 0.0, 0.5],
+        }
+    ]
+    later = {"program_id": program_id, "start_date": (monday + timedelta(days=1)).isoformat()}
+    assert client.get("/api/v1/admin/analytics/cohort-retention", params=later).json()[
+        "cohorts"
+    ] == []
+    too_long = {"weeks": 53}
+    assert client.get(
+        "/api/v1/admin/analytics/cohort-retention", params=too_long
+    ).status_code == 422
+
+
+def test_analytics_are_served_from_the_cache():
+    client = TestClient(app)
+    first = client.get("/api/v1/admin/analytics/badge-statistics")
+    assert first.headers["x-cache"] == "MISS"
+
+    db = TestingSessionLocal()
+    db.add(Badge(name="Em cache", points_reward=1))
+    db.commit()
+    db.close()
+    with _statements() as statements:
+        second = client.get("/api/v1/admin/analytics/badge-statistics")
+    assert (second.headers["x-cache"], statements) == ("HIT", [])
+    assert second.json() == first.json()
+    # Other parameters are another entry
+    assert client.get(
+        "/api/v1/admin/analytics/engagement-trends", params={"days": 7}
+    ).headers["x-cache"] == "MISS"
+
+    stats = client.get("/api/v1/admin/analytics/cache-stats").json()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 2)
+
+
+def test_concurrent_reads_share_a_bounded_number_of_sessions(monkeypatch):
+    monkeypatch.setattr(database, "CONCURRENT_READS", 2)
+    running, peak = 0, 0
+
+    async def read(session):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return (await session.execute(select(func.count(Program.id)))).scalar()
+
+    async def requests():
+        async with TestingAsyncSessionLocal() as db:
+            # Three requests fanning out three reads each
+            return await asyncio.gather(
+                *(run_concurrently(db, read, read, read) for _ in range(3))
+            )
+
+    results = asyncio.run(requests())
+    assert peak == 2
+    assert len({count for counts in results for count in counts}) == 1
@@ -0,0 +1,104 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import check_in_stream
+from app.database import Base, get_db
+from app.main import app
+from app.models import CheckIn, Habit, Program
+
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+class InMemoryRedis:
+    """Just enough of redis.Redis for enqueueing and listing pending check-ins."""
+
+    def __init__(self):
+        self.streams = {}
+        self.hashes = {}
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def xadd(self, stream, fields):
+        self.streams.setdefault(stream, []).append(fields)
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    def expire(self, key, seconds):
+        pass
+
+    def execute(self):
+        pass
+
+    def hvals(self, key):
+        return list(self.hashes.get(key, {}).values())
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def setup_module():
+    Base.metadata.create_all(bind=engine)
+    app.dependency_overrides[get_db] = override_get_db
+
+
+def teardown_module():
+    app.dependency_overrides.clear()
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_write_behind_check_in_is_queued_and_listed_as_pending(monkeypatch):
+    store = InMemoryRedis()
+    monkeypatch.setattr(check_in_stream, "CHECK_IN_WRITE_BEHIND", True)
+    monkeypatch.setattr(check_in_stream, "get_redis", lambda: store)
+
+    db = TestingSessionLocal()
+    program = Program(name="Assíncrono")
+    db.add(program)
+    db.flush()
+    habit = Habit(program_id=program.id, name="Caminhar")
+    db.add(habit)
+    db.commit()
+    habit_id = habit.id
+    db.close()
+
+    client = TestClient(app)
+    missing = client.post(
+        "/api/v1/check-ins/",
+        json={"user_id": 11, "habit_id": habit_id + 1, "check_in_date": "2026-03-01"},
+    )
+    assert missing.status_code == 404
+
+    accepted = client.post(
+        "/api/v1/check-ins/",
+        json={"user_id": 11, "habit_id": habit_id, "check_in_date": "2026-03-01"},
+    )
+    assert accepted.status_code == 202
+    event_id = accepted.json()["event_id"]
+
+    # Same shard for every event of a user keeps their check-ins in order
+    shard = 11 % check_in_stream.CHECK_IN_STREAM_SHARDS
+    assert len(store.streams[check_in_stream.stream_key(shard)]) == 1
+
+    pending = client.get("/api/v1/check-ins/pending", params={"user_id": 11})
+    assert pending.status_code == 200
+    assert [event["event_id"] for event in pending.json()] == [event_id]
+    assert pending.json()[0]["check_in"]["habit_id"] == habit_id
+
+    db = TestingSessionLocal()
+    assert db.query(CheckIn).count() == 0
+    db.close()
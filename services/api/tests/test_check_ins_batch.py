@@ -0,0 +1,109 @@
+from datetime import date, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base, get_db
+from app.main import app
+from app.models import CheckIn, Habit, PointsLedger, Program, Streak
+
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def setup_module():
+    Base.metadata.create_all(bind=engine)
+    app.dependency_overrides[get_db] = override_get_db
+
+
+def teardown_module():
+    app.dependency_overrides.clear()
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_batch_check_ins_flags_duplicates_and_updates_streaks():
+    db = TestingSessionLocal()
+    program = Program(name="Batch")
+    db.add(program)
+    db.flush()
+    habit = Habit(program_id=program.id, name="Caminhar", points_per_completion=5)
+    db.add(habit)
+    db.commit()
+    habit_id = habit.id
+    db.close()
+
+    client = TestClient(app)
+    start = date(2026, 3, 1)
+    first = client.post(
+        "/api/v1/check-ins/",
+        json={"user_id": 7, "habit_id": habit_id, "check_in_date": start.isoformat()},
+    )
+    assert first.status_code == 201
+
+    def item(days, habit=habit_id):
+        return {
+            "user_id": 7,
+            "habit_id": habit,
+            "check_in_date": (start + timedelta(days=days)).isoformat(),
+        }
+
+    payload = {"check_ins": [item(0), item(1), item(2), item(2), item(0, habit=9999)]}
+    response = client.post("/api/v1/check-ins/batch", json=payload)
+    assert response.status_code == 200
+    body = response.json()
+    assert [item["status"] for item in body["results"]] == [
+        "duplicate",
+        "created",
+        "created",
+        "duplicate",
+        "habit_not_found",
+    ]
+    assert body["created_count"] == 2
+    assert body["duplicate_count"] == 2
+    assert body["results"][1]["check_in"]["id"] is not None
+
+    db = TestingSessionLocal()
+    assert db.query(CheckIn).count() == 3
+    event_types = [
+        row.event_type
+        for row in db.query(PointsLedger)
+        .filter(PointsLedger.user_id == 7)
+        .order_by(PointsLedger.id)
+    ]
+    assert event_types == [
+        "check_in",
+        "first_check_in_bonus",
+        "check_in",
+        "check_in",
+        "streak_3_days_bonus",
+    ]
+    streak = db.query(Streak).filter(Streak.user_id == 7, Streak.habit_id == habit_id).one()
+    assert streak.current_streak == 3
+    assert streak.longest_streak == 3
+    assert streak.last_check_in_date == start + timedelta(days=2)
+    db.close()
+
+
+def test_check_ins_dated_past_tomorrow_are_rejected():
+    client = TestClient(app)
+    too_late = date.today() + timedelta(days=30)
+    response = client.post(
+        "/api/v1/check-ins/",
+        json={"user_id": 7, "habit_id": 1, "check_in_date": too_late.isoformat()},
+    )
+    assert response.status_code == 422
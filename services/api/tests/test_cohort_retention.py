@@ -0,0 +1,44 @@
+from datetime import date, datetime
+
+from app.cohort_retention import RetentionMatrix
+
+
+def test_weekly_cohorts_count_each_enrollment_once_per_week():
+    # Weeks start on Monday: 2026-03-02, 2026-03-09, 2026-03-16, ...
+    enrollments = [
+        (1, datetime(2026, 3, 4, 15, 0)),
+        (2, datetime(2026, 3, 8, 9, 30)),
+        (5, datetime(2026, 3, 9, 8, 0)),
+    ]
+    matrix = RetentionMatrix(enrollments, weeks=4)
+    matrix.add(
+        [
+            (1, date(2026, 3, 4)),
+            (1, date(2026, 3, 5)),
+            (1, date(2026, 3, 17)),
+            # Before the enrollment started
+            (2, date(2026, 3, 7)),
+            (2, date(2026, 3, 9)),
+        ]
+    )
+    matrix.add([(5, date(2026, 3, 10)), (5, date(2026, 3, 30)), (1, date(2026, 4, 30))])
+    matrix.add([])
+
+    cohorts = matrix.cohorts(today=date(2026, 3, 25))
+
+    assert cohorts == [
+        {
+            "cohort_start": date(2026, 3, 2),
+            "size": 2,
+            "retained": [1, 1, 1, 0],
+            "retention": [0.5, 0.5, 0.5, 0.0],
+        },
+        # Its fourth week has not started yet
+        {
+            "cohort_start": date(2026, 3, 9),
+            "size": 1,
+            "retained": [1, 0, 0],
+            "retention": [1.0, 0.0, 0.0],
+        },
+    ]
+    assert RetentionMatrix([], weeks=4).cohorts(today=date(2026, 3, 25)) == []
@@ -0,0 +1,93 @@
+import csv
+import io
+import json
+from datetime import date
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.auth import require_admin
+from app.database import Base, get_db
+from app.main import app
+from app.models import CheckIn, Habit, PointsLedger, Program
+from app.routers import exports
+
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+class DummyUser:
+    id = 999
+    role = "admin"
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def setup_module():
+    Base.metadata.create_all(bind=engine)
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[require_admin] = lambda: DummyUser()
+
+
+def teardown_module():
+    app.dependency_overrides.clear()
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_check_in_export_streams_filtered_rows_in_batches(monkeypatch):
+    monkeypatch.setattr(exports, "EXPORT_BATCH_SIZE", 2)
+
+    db = TestingSessionLocal()
+    programs = [Program(name="Pesquisa"), Program(name="Outro")]
+    db.add_all(programs)
+    db.flush()
+    habit = Habit(program_id=programs[0].id, name="Pressão arterial")
+    other = Habit(program_id=programs[1].id, name="Passos")
+    db.add_all([habit, other])
+    db.flush()
+    db.add_all(
+        CheckIn(
+            user_id=4,
+            habit_id=habit.id,
+            check_in_date=date(2026, 3, day),
+            metric_key="systolic",
+            value_numeric=120 + day,
+        )
+        for day in range(1, 6)
+    )
+    db.add(CheckIn(user_id=4, habit_id=other.id, check_in_date=date(2026, 3, 1)))
+    db.add(PointsLedger(user_id=4, program_id=programs[0].id, points=10, event_type="check_in"))
+    db.commit()
+    program_id = programs[0].id
+    db.close()
+
+    client = TestClient(app)
+    params = {"user_id": 4, "program_id": program_id, "end_date": "2026-03-04"}
+    ndjson = client.get("/api/v1/exports/check-ins", params=params)
+    assert ndjson.status_code == 200
+    assert ndjson.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in ndjson.text.splitlines()]
+    assert [row["check_in_date"] for row in rows] == [f"2026-03-0{day}" for day in range(1, 5)]
+    assert rows[0]["value_numeric"] == 121
+    assert rows[0]["program_id"] == program_id
+
+    as_csv = client.get("/api/v1/exports/check-ins", params={**params, "format": "csv"})
+    records = list(csv.DictReader(io.StringIO(as_csv.text)))
+    assert len(records) == 4
+    assert records[-1]["metric_key"] == "systolic"
+
+    ledger = client.get("/api/v1/exports/points-ledger", params={"user_id": 4})
+    assert [json.loads(line)["points"] for line in ledger.text.splitlines()] == [10]
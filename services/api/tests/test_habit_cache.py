@@ -0,0 +1,71 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base, get_db
+from app.habit_cache import get_habit_meta, habit_cache
+from app.main import app
+from app.models import Habit, Program
+
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def setup_module():
+    Base.metadata.create_all(bind=engine)
+    app.dependency_overrides[get_db] = override_get_db
+
+
+def teardown_module():
+    app.dependency_overrides.clear()
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_habit_writes_invalidate_cached_metadata_after_commit():
+    db = TestingSessionLocal()
+    program = Program(name="Cache")
+    db.add(program)
+    db.flush()
+    habit = Habit(program_id=program.id, name="Alongar", points_per_completion=10)
+    db.add(habit)
+    db.commit()
+    habit_id = habit.id
+
+    assert get_habit_meta(db, habit_id).points_per_completion == 10
+
+    # Writes that bypass the routers are not seen until the cache is invalidated
+    db.query(Habit).filter(Habit.id == habit_id).update({"points_per_completion": 20})
+    db.commit()
+    assert get_habit_meta(db, habit_id).points_per_completion == 10
+
+    version = habit_cache.version
+    client = TestClient(app)
+    response = client.patch(f"/api/v1/habits/{habit_id}", json={"points_per_completion": 30})
+    assert response.status_code == 200
+    assert habit_cache.version == version + 1
+    assert get_habit_meta(db, habit_id).points_per_completion == 30
+    db.close()
+
+
+def test_load_racing_an_invalidation_is_not_cached():
+    db = TestingSessionLocal()
+    habit = db.query(Habit).first()
+    stale_version = habit_cache.version
+    habit_cache.bump()
+    habit_cache.put(get_habit_meta(db, habit.id)._replace(name="stale"), stale_version)
+    assert get_habit_meta(db, habit.id).name == habit.name
+    db.close()
@@ -0,0 +1,114 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import idempotency
+from app.database import Base, get_db
+from app.main import app
+from app.models import CheckIn, Habit, Program
+
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+class InMemoryRedis:
+    """Just enough of redis.asyncio.Redis for the idempotency middleware."""
+
+    def __init__(self):
+        self.values = {}
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def delete(self, key):
+        self.values.pop(key, None)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def setup_module():
+    Base.metadata.create_all(bind=engine)
+    app.dependency_overrides[get_db] = override_get_db
+
+
+def teardown_module():
+    app.dependency_overrides.clear()
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_retried_check_in_replays_stored_response(monkeypatch):
+    store = InMemoryRedis()
+    monkeypatch.setattr(idempotency, "get_async_redis", lambda: store)
+
+    db = TestingSessionLocal()
+    program = Program(name="Idempotente")
+    db.add(program)
+    db.flush()
+    habit = Habit(program_id=program.id, name="Meditar")
+    db.add(habit)
+    db.commit()
+    habit_id = habit.id
+    db.close()
+
+    client = TestClient(app)
+    payload = {"user_id": 3, "habit_id": habit_id, "check_in_date": "2026-03-01"}
+    headers = {"Idempotency-Key": "sync-42"}
+
+    first = client.post("/api/v1/check-ins/", json=payload, headers=headers)
+    retry = client.post("/api/v1/check-ins/", json=payload, headers=headers)
+    assert first.status_code == 201
+    assert retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+
+    reused = client.post(
+        "/api/v1/check-ins/",
+        json={**payload, "check_in_date": "2026-03-02"},
+        headers=headers,
+    )
+    assert reused.status_code == 422
+
+    db = TestingSessionLocal()
+    assert db.query(CheckIn).count() == 1
+    db.close()
+
+
+def test_a_request_that_raises_releases_its_key(monkeypatch):
+    store = InMemoryRedis()
+    monkeypatch.setattr(idempotency, "get_async_redis", lambda: store)
+
+    def broken_db():
+        raise RuntimeError("database unavailable")
+        yield
+
+    payload = {"user_id": 4, "habit_id": 1, "check_in_date": "2026-03-01"}
+    headers = {"Idempotency-Key": "sync-43"}
+    monkeypatch.setitem(app.dependency_overrides, get_db, broken_db)
+    with pytest.raises(RuntimeError):
+        TestClient(app).post("/api/v1/check-ins/", json=payload, headers=headers)
+    assert store.values == {}
+
+    # The retry runs instead of getting 409 until the lock expires
+    monkeypatch.setitem(app.dependency_overrides, get_db, override_get_db)
+    retry = TestClient(app).post("/api/v1/check-ins/", json=payload, headers=headers)
+    assert retry.status_code == 201
+    assert "Idempotent-Replayed" not in retry.headers
@@ -0,0 +1,159 @@
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import leaderboards
+from app.database import Base, get_db
+from app.main import app
+from app.models import Habit, Program, UserPointsBalance
+from app.points_ledger import append_ledger_entries
+from app.routers import leaderboards as leaderboards_router
+
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+class InMemoryRedis:
+    """Just enough of redis.Redis for sorted-set leaderboards."""
+
+    def __init__(self):
+        self.sets = {}
+        self.results = []
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def __len__(self):
+        return len(self.results)
+
+    def execute(self):
+        results, self.results = self.results, []
+        return results
+
+    def _reply(self, value):
+        self.results.append(value)
+        return value
+
+    def zincrby(self, key, amount, member):
+        scores = self.sets.setdefault(key, {})
+        scores[member] = scores.get(member, 0) + amount
+        return self._reply(scores[member])
+
+    def _ordered(self, key):
+        scores = self.sets.get(key, {})
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def zrevrange(self, key, start, end, withscores=False):
+        return self._ordered(key)[start : end + 1]
+
+    def zrevrank(self, key, member):
+        members = [name for name, _ in self._ordered(key)]
+        return self._reply(members.index(member) if member in members else None)
+
+    def zscore(self, key, member):
+        return self._reply(self.sets.get(key, {}).get(member))
+
+    def expire(self, key, seconds):
+        return self._reply(True)
+
+    def scan_iter(self, match, count=None):
+        return [key for key in self.sets if key.startswith(match.rstrip("*"))]
+
+    def delete(self, key):
+        return self._reply(self.sets.pop(key, None) is not None)
+
+    def rename(self, source, destination):
+        self.sets[destination] = self.sets.pop(source)
+        return self._reply(True)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def setup_module():
+    Base.metadata.create_all(bind=engine)
+    app.dependency_overrides[get_db] = override_get_db
+
+
+def teardown_module():
+    app.dependency_overrides.clear()
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_ledger_appends_feed_the_leaderboards_and_rebuild_restores_them(monkeypatch):
+    store = InMemoryRedis()
+    monkeypatch.setattr(leaderboards, "get_redis", lambda: store)
+    monkeypatch.setattr(leaderboards_router, "get_redis", lambda: store)
+
+    db = TestingSessionLocal()
+    program = Program(name="Ranking")
+    db.add(program)
+    db.flush()
+    habit = Habit(program_id=program.id, name="Alongar", points_per_completion=10)
+    db.add(habit)
+    db.commit()
+    program_id, habit_id = program.id, habit.id
+
+    client = TestClient(app)
+    for user_id, days in ((1, 3), (2, 1), (3, 2)):
+        for day in range(days):
+            check_in = {
+                "user_id": user_id,
+                "habit_id": habit_id,
+                "check_in_date": f"2026-03-0{day + 1}",
+            }
+            response = client.post("/api/v1/check-ins/", json=check_in)
+            assert response.status_code == 201
+    # Rolled back appends never reach the leaderboards
+    append_ledger_entries(db, [{"user_id": 2, "points": 500, "event_type": "manual"}])
+    db.rollback()
+    append_ledger_entries(db, [{"user_id": 2, "points": 1, "event_type": "manual"}])
+    db.commit()
+
+    balances = {
+        user_id: total
+        for user_id, total in db.query(UserPointsBalance.user_id, UserPointsBalance.total_points)
+        .filter(UserPointsBalance.program_id == program_id)
+    }
+    ranking = client.get("/api/v1/leaderboards", params={"program_id": program_id})
+    assert [(entry["user_id"], entry["points"]) for entry in ranking.json()["entries"]] == sorted(
+        balances.items(), key=lambda item: -item[1]
+    )
+    assert [entry["rank"] for entry in ranking.json()["entries"]] == [1, 2, 3]
+
+    overall = client.get("/api/v1/leaderboards/users/2").json()
+    assert overall == {"rank": 3, "user_id": 2, "points": balances[2] + 1}
+    weekly = client.get("/api/v1/leaderboards/users/1", params={"period": "week"})
+    assert weekly.json()["rank"] == 1
+    assert client.get("/api/v1/leaderboards/users/99").status_code == 404
+
+    around = client.get("/api/v1/leaderboards/users/3/around", params={"radius": 1})
+    assert [entry["user_id"] for entry in around.json()["entries"]] == [1, 3, 2]
+    assert [entry["rank"] for entry in around.json()["entries"]] == [1, 2, 3]
+
+    # Drifted and stale boards are replaced from Postgres
+    snapshot = {key: dict(scores) for key, scores in store.sets.items()}
+    store.sets[leaderboards.leaderboard_key(None)]["1"] = 0
+    store.sets[leaderboards.leaderboard_key(12345)] = {"7": 70}
+    store.sets[leaderboards.leaderboard_key(None, "2020-W01")] = {"7": 70}
+    week = leaderboards.week_label(datetime.utcnow())
+    boards = leaderboards.rebuild_leaderboards(db, store, batch_size=2)
+    assert boards == 4
+    assert leaderboards.leaderboard_key(12345) not in store.sets
+    assert store.sets.pop(leaderboards.leaderboard_key(None, "2020-W01")) == {"7": 70}
+    assert store.sets == snapshot
+    assert leaderboards.leaderboard_key(program_id, week) in store.sets
+    db.close()
@@ -0,0 +1,46 @@
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+
+from app.metric_rollups import rollup_series
+
+
+def test_weekly_rollup_matches_numpy_per_period():
+    # Mon 2026-03-02 .. Sun 2026-03-08 is one week; 2026-03-09 starts the next
+    rows = [
+        (date(2026, 3, 8), Decimal("130")),
+        (date(2026, 3, 2), Decimal("120")),
+        (date(2026, 3, 4), Decimal("125.5")),
+        (date(2026, 3, 9), Decimal("110")),
+        (date(2026, 3, 5), Decimal("140")),
+    ]
+
+    weeks = rollup_series(rows, "week")
+
+    assert [week["period_start"] for week in weeks] == [date(2026, 3, 2), date(2026, 3, 9)]
+    first = [120, 125.5, 130, 140]
+    assert weeks[0]["count"] == 4
+    assert weeks[0]["mean"] == np.mean(first)
+    assert (weeks[0]["min"], weeks[0]["max"]) == (120, 140)
+    assert weeks[0]["p50"] == np.percentile(first, 50)
+    assert weeks[0]["p90"] == np.percentile(first, 90)
+    assert weeks[1] == {
+        "period_start": date(2026, 3, 9),
+        "count": 1,
+        "mean": 110,
+        "min": 110,
+        "max": 110,
+        "p50": 110,
+        "p90": 110,
+    }
+
+
+def test_monthly_rollup_groups_by_calendar_month():
+    rows = [(date(2026, 1, 31), 1), (date(2026, 2, 1), 2), (date(2026, 2, 28), 4)]
+    months = rollup_series(rows, "month")
+    assert [(m["period_start"], m["mean"]) for m in months] == [
+        (date(2026, 1, 1), 1),
+        (date(2026, 2, 1), 3),
+    ]
+    assert rollup_series([], "day") == []
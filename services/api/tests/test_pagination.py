@@ -0,0 +1,75 @@
+from datetime import date
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base, get_db
+from app.main import app
+from app.models import CheckIn, Habit, Program
+
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def setup_module():
+    Base.metadata.create_all(bind=engine)
+    app.dependency_overrides[get_db] = override_get_db
+
+
+def teardown_module():
+    app.dependency_overrides.clear()
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_check_ins_page_by_cursor_without_gaps_or_repeats():
+    db = TestingSessionLocal()
+    program = Program(name="Paginação")
+    db.add(program)
+    db.flush()
+    habits = [Habit(program_id=program.id, name=f"Hábito {n}") for n in range(2)]
+    db.add_all(habits)
+    db.flush()
+    # Two check-ins share each date, so the id tie-breaker matters
+    db.add_all(
+        CheckIn(user_id=8, habit_id=habit.id, check_in_date=date(2026, 3, day))
+        for day in range(1, 4)
+        for habit in habits
+    )
+    db.commit()
+    expected = [
+        row.id
+        for row in db.query(CheckIn).order_by(CheckIn.check_in_date.desc(), CheckIn.id.desc())
+    ]
+    db.close()
+
+    client = TestClient(app)
+    seen = []
+    cursor = None
+    for _ in range(3):
+        params = {"user_id": 8, "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/api/v1/check-ins/", params=params)
+        assert response.status_code == 200
+        seen.extend(item["id"] for item in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+    assert seen == expected
+    assert cursor is None
+
+    invalid = client.get("/api/v1/check-ins/", params={"cursor": "not-a-cursor"})
+    assert invalid.status_code == 400
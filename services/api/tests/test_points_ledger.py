@@ -0,0 +1,218 @@
+from datetime import date, datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models import (
+    ArchivedPartition,
+    PointsCheckpoint,
+    PointsLedger,
+    Program,
+    UserPointsBalance,
+)
+from app.points_ledger import (
+    NO_PROGRAM,
+    append_ledger_entries,
+    balance_as_of_query,
+    balance_query,
+    reconcile_balances,
+    retention_horizon,
+)
+
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def setup_module():
+    Base.metadata.create_all(bind=engine)
+
+
+def teardown_module():
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_balances_follow_appends_and_reconcile_repairs_drift():
+    db = TestingSessionLocal()
+    program = Program(name="Saldo")
+    db.add(program)
+    db.commit()
+
+    append_ledger_entries(
+        db,
+        [
+            {"user_id": 1, "program_id": program.id, "points": 10, "event_type": "check_in"},
+            {
+                "user_id": 1,
+                "program_id": program.id,
+                "points": 20,
+                "event_type": "streak_3_days_bonus",
+            },
+            {"user_id": 1, "points": 5, "event_type": "badge_earned"},
+        ],
+    )
+    append_ledger_entries(
+        db, [{"user_id": 1, "program_id": program.id, "points": 10, "event_type": "check_in"}]
+    )
+    db.commit()
+
+    balances = {
+        row.program_id: (row.total_points, row.transaction_count)
+        for row in db.query(UserPointsBalance).filter(UserPointsBalance.user_id == 1)
+    }
+    assert balances == {program.id: (40, 3), NO_PROGRAM: (5, 1)}
+    assert tuple(db.execute(balance_query(1)).one()) == (45, 4)
+    assert tuple(db.execute(balance_query(1, program.id)).one()) == (40, 3)
+    assert tuple(db.execute(balance_query(2)).one()) == (0, 0)
+    assert reconcile_balances(db) == []
+
+    # Rows written behind the balances' back, and a balance with no ledger at all
+    db.add(PointsLedger(user_id=1, points=7, event_type="manual"))
+    db.add(UserPointsBalance(user_id=3, program_id=NO_PROGRAM, total_points=9, transaction_count=1))
+    db.commit()
+
+    mismatches = reconcile_balances(db, repair=True)
+    db.commit()
+    assert sorted((row["user_id"], row["program_id"]) for row in mismatches) == [
+        (1, NO_PROGRAM),
+        (3, NO_PROGRAM),
+    ]
+    assert tuple(db.execute(balance_query(1, NO_PROGRAM)).one()) == (12, 2)
+    assert tuple(db.execute(balance_query(3)).one()) == (0, 0)
+    assert reconcile_balances(db) == []
+    db.close()
+
+
+def test_balance_as_of_adds_the_ledger_since_the_latest_checkpoint():
+    db = TestingSessionLocal()
+    program = Program(name="Histórico")
+    db.add(program)
+    db.commit()
+
+    def entry(user_id, program_id, points, month, day):
+        created_at = datetime(2026, month, day, 12)
+        return {
+            "user_id": user_id,
+            "program_id": program_id,
+            "points": points,
+            "event_type": "check_in",
+            "created_at": created_at,
+        }
+
+    def checkpoint(program_id, month, points, count):
+        return PointsCheckpoint(
+            user_id=7,
+            program_id=program_id,
+            checkpoint_at=datetime(2026, month, 1),
+            total_points=points,
+            transaction_count=count,
+        )
+
+    append_ledger_entries(
+        db,
+        [
+            entry(7, program.id, 10, 1, 10),
+            entry(7, program.id, 20, 2, 5),
+            entry(7, program.id, 40, 3, 20),
+            entry(7, None, 5, 1, 31),
+            entry(8, None, 99, 1, 31),
+        ],
+    )
+    # Checkpoints as the worker writes them: only where the month had activity
+    db.add_all(
+        [
+            checkpoint(program.id, 2, 10, 1),
+            checkpoint(program.id, 3, 30, 2),
+            checkpoint(NO_PROGRAM, 2, 5, 1),
+        ]
+    )
+    db.commit()
+
+    def as_of(day, program_id=None):
+        return tuple(db.execute(balance_as_of_query(7, day, program_id)).one())
+
+    assert as_of(date(2025, 12, 31)) == (0, 0)
+    assert as_of(date(2026, 1, 10)) == (10, 1)
+    assert as_of(date(2026, 1, 31)) == (15, 2)
+    assert as_of(date(2026, 2, 4)) == (15, 2)
+    assert as_of(date(2026, 3, 19)) == (35, 3)
+    assert as_of(date(2026, 3, 20)) == (75, 4)
+    assert as_of(date(2026, 3, 20), program.id) == (70, 3)
+    assert as_of(date(2026, 3, 20), NO_PROGRAM) == (5, 1)
+    db.close()
+
+
+def test_reconcile_starts_from_the_checkpoints_once_ledger_months_are_detached():
+    db = TestingSessionLocal()
+    program = Program(name="Retenção")
+    db.add(program)
+    db.commit()
+
+    def entry(points, month):
+        return {
+            "user_id": 20,
+            "program_id": program.id,
+            "points": points,
+            "event_type": "check_in",
+            "created_at": datetime(2026, month, 10),
+        }
+
+    append_ledger_entries(db, [entry(10, 1), entry(15, 1), entry(20, 2), entry(40, 4)])
+    append_ledger_entries(db, [{**entry(5, 1), "program_id": None}])
+    # What maintain_partitions leaves behind after detaching January and
+    # February: the checkpoints it wrote first, and the archived months
+    db.add_all(
+        [
+            PointsCheckpoint(
+                user_id=20,
+                program_id=program.id,
+                checkpoint_at=datetime(2026, 2, 1),
+                total_points=25,
+                transaction_count=2,
+            ),
+            PointsCheckpoint(
+                user_id=20,
+                program_id=program.id,
+                checkpoint_at=datetime(2026, 3, 1),
+                total_points=45,
+                transaction_count=3,
+            ),
+            PointsCheckpoint(
+                user_id=20,
+                program_id=NO_PROGRAM,
+                checkpoint_at=datetime(2026, 2, 1),
+                total_points=5,
+                transaction_count=1,
+            ),
+            ArchivedPartition(table_name="points_ledger", month=date(2026, 1, 1)),
+            ArchivedPartition(table_name="points_ledger", month=date(2026, 2, 1)),
+        ]
+    )
+    db.query(PointsLedger).filter(
+        PointsLedger.user_id == 20, PointsLedger.created_at < datetime(2026, 3, 1)
+    ).delete()
+    db.commit()
+
+    assert retention_horizon(db, "points_ledger") == date(2026, 3, 1)
+    assert retention_horizon(db, "check_ins") is None
+    assert reconcile_balances(db, repair=True, user_ids=[20]) == []
+    db.commit()
+    assert tuple(db.execute(balance_query(20, program.id)).one()) == (85, 4)
+    assert tuple(db.execute(balance_query(20, NO_PROGRAM)).one()) == (5, 1)
+
+    # Drift after the horizon is still repaired on top of the checkpoint
+    db.add(PointsLedger(user_id=20, program_id=program.id, points=3, event_type="manual"))
+    db.commit()
+    mismatches = reconcile_balances(db, repair=True, user_ids=[20])
+    db.commit()
+    assert [(row["ledger_points"], row["ledger_count"]) for row in mismatches] == [(88, 5)]
+    assert tuple(db.execute(balance_query(20)).one()) == (93, 6)
+    db.query(ArchivedPartition).delete()
+    db.commit()
+    db.close()
@@ -0,0 +1,116 @@
+import os
+from datetime import date
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.auth import require_admin
+from app.database import Base, get_async_db, get_db
+from app.main import app
+from app.models import Badge, CheckIn, Enrollment, Habit, Program, Streak, UserBadge
+from app.points_ledger import append_ledger_entries
+from app.query_stats import QUERY_TIME_HEADER
+
+
+engine = None
+async_engine = None
+TestingSessionLocal = None
+TestingAsyncSessionLocal = None
+
+
+class DummyUser:
+    id = 999
+    role = "admin"
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
+def setup_module(module):
+    global engine, async_engine, TestingSessionLocal, TestingAsyncSessionLocal
+    path = module.__file__.replace(".py", ".sqlite3")
+    engine = create_engine(f"sqlite:///{path}")
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    TestingAsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[require_admin] = lambda: DummyUser()
+
+
+def teardown_module(module):
+    app.dependency_overrides.clear()
+    Base.metadata.drop_all(bind=engine)
+    engine.dispose()
+    os.remove(module.__file__.replace(".py", ".sqlite3"))
+
+
+def _seed(programs: int):
+    """Programs with habits, and user 1 enrolled in each with a check-in, streak and badge."""
+    db = TestingSessionLocal()
+    for index in range(programs):
+        program = Program(name=f"Programa {programs}-{index}")
+        badge = Badge(name=f"Badge {programs}-{index}", points_reward=5)
+        db.add_all([program, badge])
+        db.flush()
+        habits = [Habit(program_id=program.id, name=f"Hábito {n}") for n in range(3)]
+        db.add_all(habits)
+        db.flush()
+        db.add_all(
+            [
+                Enrollment(user_id=1, program_id=program.id),
+                CheckIn(user_id=1, habit_id=habits[0].id, check_in_date=date(2026, 3, 1)),
+                Streak(user_id=1, habit_id=habits[0].id, program_id=program.id, current_streak=1),
+                UserBadge(user_id=1, badge_id=badge.id),
+            ]
+        )
+        append_ledger_entries(
+            db, [{"user_id": 1, "program_id": program.id, "points": 10, "event_type": "check_in"}]
+        )
+    db.commit()
+    db.close()
+
+
+# (path, budget); budgets hold however many rows each endpoint returns
+BUDGETS = [
+    ("/api/v1/programs/", 1),
+    ("/api/v1/admin/programs/", 2),
+    ("/api/v1/users/1/dashboard", 1),
+    ("/api/v1/users/dashboards?user_ids=1&user_ids=2", 1),
+    ("/api/v1/users/1/points", 1),
+    ("/api/v1/users/1/points/history", 1),
+    ("/api/v1/users/1/streaks", 1),
+    ("/api/v1/users/1/badges", 2),
+    ("/api/v1/enrollments/?user_id=1", 1),
+    ("/api/v1/admin/analytics/badge-statistics", 2),
+    ("/api/v1/admin/analytics/overview", 3),
+    ("/api/v1/admin/analytics/engagement-trends?days=365", 1),
+    ("/api/v1/admin/analytics/program-performance", 3),
+    ("/api/v1/admin/analytics/program-performance?by_habit=true&start_date=2026-01-01", 3),
+    ("/api/v1/admin/analytics/cohort-retention?start_date=2026-01-01", 2),
+]
+
+
+@pytest.mark.parametrize("programs", [1, 5])
+def test_read_endpoints_stay_within_their_query_budget(programs, query_budget):
+    _seed(programs)
+    client = TestClient(app)
+    for path, budget in BUDGETS:
+        response = query_budget(client.get(path), budget)
+        assert response.status_code == 200, path
+        assert float(response.headers[QUERY_TIME_HEADER]) >= 0
@@ -0,0 +1,137 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import database
+from app.auth import require_admin
+from app.database import Base, ReplicaMonitor, get_async_db, get_db
+from app.main import app
+from app.models import Badge, Program
+
+
+engines = {}
+sessions = {}
+
+
+class DummyUser:
+    id = 999
+    role = "admin"
+
+
+def _path(module, name):
+    return module.__file__.replace(".py", f"_{name}.sqlite3")
+
+
+def setup_module(module):
+    # Two files: the primary, and a stand-in replica holding different rows
+    for name in ("primary", "replica"):
+        engine = create_engine(f"sqlite:///{_path(module, name)}")
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{_path(module, name)}")
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        engines[name] = (engine, async_engine)
+        sessions[name] = (
+            sessionmaker(autocommit=False, autoflush=False, bind=engine),
+            async_sessionmaker(async_engine, expire_on_commit=False),
+        )
+        db = sessions[name][0]()
+        db.add_all([Program(name=f"Programa {name}"), Badge(name=f"Badge {name}")])
+        db.commit()
+        db.close()
+
+    def override_get_db():
+        db = sessions["primary"][0]()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def override_get_async_db():
+        async with sessions["primary"][1]() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[require_admin] = lambda: DummyUser()
+
+
+def teardown_module(module):
+    app.dependency_overrides.clear()
+    for name, (engine, _) in engines.items():
+        engine.dispose()
+        os.remove(_path(module, name))
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    monkeypatch.setattr(database, "ReadSessionLocal", sessions["replica"][0])
+    monkeypatch.setattr(database, "AsyncReadSessionLocal", sessions["replica"][1])
+    # Check the lag on every request
+    monkeypatch.setattr(database, "replica_monitor", ReplicaMonitor(10, 0))
+
+
+def _program_names(response):
+    return [program["name"] for program in response.json()]
+
+
+def _badge_names(response):
+    return [badge["badge_name"] for badge in response.json()["badge_details"]]
+
+
+def test_reads_go_to_the_replica_unless_overridden(replica):
+    client = TestClient(app)
+
+    response = client.get("/api/v1/programs/")
+    assert _program_names(response) == ["Programa replica"]
+    assert response.headers["x-db-source"] == "replica"
+    stats = client.get("/api/v1/admin/analytics/badge-statistics")
+    assert _badge_names(stats) == ["Badge replica"]
+    # Cached analytics are not served to a request that asked for the primary
+    stats = client.get(
+        "/api/v1/admin/analytics/badge-statistics", headers={"X-Read-Primary": "true"}
+    )
+    assert _badge_names(stats) == ["Badge primary"]
+    assert stats.headers["x-cache"] == "BYPASS"
+
+    # Read-your-writes: a client that just wrote asks for the primary
+    created = client.post("/api/v1/programs/", json={"name": "Nova"})
+    assert created.status_code == 201
+    response = client.get("/api/v1/programs/", headers={"X-Read-Primary": "true"})
+    assert _program_names(response) == ["Programa primary", "Nova"]
+    assert response.headers["x-db-source"] == "primary"
+
+    # Single-item and per-user reads stay on the primary
+    program_id = created.json()["id"]
+    assert client.get(f"/api/v1/programs/{program_id}").status_code == 200
+
+
+def test_a_lagging_or_unreachable_replica_falls_back_to_the_primary(replica, monkeypatch):
+    client = TestClient(app)
+    assert _badge_names(client.get("/api/v1/admin/analytics/badge-statistics")) == [
+        "Badge replica"
+    ]
+    monkeypatch.setattr(database, "_replica_lag", lambda session: 30.0)
+    response = client.get("/api/v1/programs/")
+    assert response.headers["x-db-source"] == "primary"
+    assert "Programa primary" in _program_names(response)
+    # The entry cached from the replica is not the primary's
+    stats = client.get("/api/v1/admin/analytics/badge-statistics")
+    assert (_badge_names(stats), stats.headers["x-cache"]) == (["Badge primary"], "MISS")
+
+    def unreachable():
+        raise ConnectionError("replica down")
+
+    monkeypatch.setattr(database, "_replica_lag", lambda session: 0.0)
+    assert client.get("/api/v1/programs/").headers["x-db-source"] == "replica"
+    monkeypatch.setattr(database, "ReadSessionLocal", unreachable)
+    assert client.get("/api/v1/programs/").headers["x-db-source"] == "primary"
+
+
+def test_without_a_replica_reads_use_the_primary():
+    response = TestClient(app).get("/api/v1/programs/")
+    assert response.headers["x-db-source"] == "primary"
+    assert "Programa primary" in _program_names(response)
@@ -0,0 +1,218 @@
+from datetime import date, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import rewards_engine
+from app.database import Base, get_db
+from app.main import app
+from app.models import Habit, PointsLedger, Program, Streak
+from app.rewards_engine import backfill_rewards
+
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+MONDAY = date(2026, 3, 2)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def setup_module():
+    Base.metadata.create_all(bind=engine)
+    app.dependency_overrides[get_db] = override_get_db
+    rewards_engine._reward_values = None
+
+
+def teardown_module():
+    app.dependency_overrides.clear()
+    Base.metadata.drop_all(bind=engine)
+
+
+def _bonuses(db, user_id):
+    return sorted(
+        row.event_type
+        for row in db.query(PointsLedger).filter(
+            PointsLedger.user_id == user_id, PointsLedger.event_type != "check_in"
+        )
+    )
+
+
+def test_bonuses_are_awarded_once_whatever_the_check_in_order():
+    db = TestingSessionLocal()
+    program = Program(name="Semana perfeita")
+    db.add(program)
+    db.flush()
+    habits = [Habit(program_id=program.id, name=name) for name in ("Dormir", "Beber água")]
+    db.add_all(habits)
+    db.commit()
+    habit_ids = [habit.id for habit in habits]
+    db.close()
+
+    client = TestClient(app)
+    # Habit 1: the whole week, in order. Habit 2: all days but Thursday first.
+    days = [MONDAY + timedelta(days=offset) for offset in range(7)]
+    batch = [
+        {"user_id": 21, "habit_id": habit_ids[0], "check_in_date": day.isoformat()} for day in days
+    ] + [
+        {"user_id": 21, "habit_id": habit_ids[1], "check_in_date": day.isoformat()}
+        for day in days
+        if day.weekday() != 3
+    ]
+    assert client.post("/api/v1/check-ins/batch", json={"check_ins": batch}).status_code == 200
+
+    db = TestingSessionLocal()
+    assert _bonuses(db, 21) == [
+        "first_check_in_bonus",
+        "streak_3_days_bonus",
+        "streak_3_days_bonus",  # habit 2, Fri..Sun (Mon..Wed is its other run)
+        "streak_3_days_bonus",
+        "streak_7_days_bonus",
+    ]
+    db.close()
+
+    # Thursday joins habit 2's runs into one 7-day run and completes the week
+    thursday = client.post(
+        "/api/v1/check-ins/",
+        json={"user_id": 21, "habit_id": habit_ids[1], "check_in_date": days[3].isoformat()},
+    )
+    assert thursday.status_code == 201
+
+    db = TestingSessionLocal()
+    assert _bonuses(db, 21) == [
+        "first_check_in_bonus",
+        "perfect_week_bonus",
+        "streak_3_days_bonus",
+        "streak_3_days_bonus",
+        "streak_3_days_bonus",
+        "streak_7_days_bonus",
+        "streak_7_days_bonus",
+    ]
+
+    # Replaying the rules over the stored streaks awards nothing new
+    assert backfill_rewards(db, chunk_size=1) == 0
+    db.close()
+
+
+def test_backfill_awards_bonuses_for_existing_streaks():
+    db = TestingSessionLocal()
+    program = Program(name="Histórico")
+    db.add(program)
+    db.flush()
+    habit = Habit(program_id=program.id, name="Meditar")
+    db.add(habit)
+    db.flush()
+    first_day = MONDAY.toordinal()
+    db.add(
+        Streak(
+            user_id=22,
+            habit_id=habit.id,
+            program_id=program.id,
+            current_streak=3,
+            longest_streak=8,
+            last_check_in_date=MONDAY + timedelta(days=20),
+            completed_runs=[[first_day, first_day + 7], [first_day + 18, first_day + 20]],
+        )
+    )
+    db.commit()
+
+    # 8-day run: 3 and 7 day streaks plus its full week; 3-day run: one more streak
+    assert backfill_rewards(db, chunk_size=10) == 5
+    assert _bonuses(db, 22) == [
+        "first_check_in_bonus",
+        "perfect_week_bonus",
+        "streak_3_days_bonus",
+        "streak_3_days_bonus",
+        "streak_7_days_bonus",
+    ]
+    assert backfill_rewards(db, chunk_size=10) == 0
+    db.close()
+
+
+def test_only_a_habits_first_day_looks_for_the_first_check_in_bonus():
+    db = TestingSessionLocal()
+    program = Program(name="Primeiro dia")
+    db.add(program)
+    db.flush()
+    habits = [Habit(program_id=program.id, name=name) for name in ("Ler", "Escrever")]
+    db.add_all(habits)
+    db.commit()
+    habit_ids = [habit.id for habit in habits]
+    db.close()
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    client = TestClient(app)
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        for habit_id, day in ((habit_ids[0], MONDAY), (habit_ids[0], MONDAY + timedelta(days=1))):
+            statements.clear()
+            check_in = {"user_id": 23, "habit_id": habit_id, "check_in_date": day.isoformat()}
+            assert client.post("/api/v1/check-ins/", json=check_in).status_code == 201
+            grants = [sql for sql in statements if sql.startswith("INSERT INTO reward_grants")]
+            assert len(grants) == (1 if day == MONDAY else 0)
+
+        # Another habit's first day looks again, and the grant key keeps it to one bonus
+        check_in = {"user_id": 23, "habit_id": habit_ids[1], "check_in_date": MONDAY.isoformat()}
+        response = client.post("/api/v1/check-ins/batch", json={"check_ins": [check_in]})
+        assert response.status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    db = TestingSessionLocal()
+    assert _bonuses(db, 23) == ["first_check_in_bonus"]
+    db.close()
+
+
+def test_users_with_history_get_no_first_check_in_bonus_for_a_new_habit():
+    db = TestingSessionLocal()
+    program = Program(name="Veteranos")
+    db.add(program)
+    db.flush()
+    habits = [Habit(program_id=program.id, name=name) for name in ("Correr", "Alongar")]
+    db.add_all(habits)
+    db.flush()
+    habit_ids = [habit.id for habit in habits]
+    # Check-ins from before the rule existed: a run on the first habit, no grants
+    first_day = (MONDAY - timedelta(days=30)).toordinal()
+    db.add(
+        Streak(
+            user_id=24,
+            habit_id=habit_ids[0],
+            program_id=program.id,
+            current_streak=0,
+            longest_streak=2,
+            last_check_in_date=MONDAY - timedelta(days=29),
+            completed_runs=[[first_day, first_day + 1]],
+        )
+    )
+    db.commit()
+    db.close()
+
+    client = TestClient(app)
+    check_in = {"user_id": 24, "habit_id": habit_ids[1], "check_in_date": MONDAY.isoformat()}
+    assert client.post("/api/v1/check-ins/", json=check_in).status_code == 201
+    # A newcomer starting both habits the same day still earns it once
+    for habit_id in habit_ids:
+        check_in = {"user_id": 25, "habit_id": habit_id, "check_in_date": MONDAY.isoformat()}
+        assert client.post("/api/v1/check-ins/", json=check_in).status_code == 201
+
+    db = TestingSessionLocal()
+    assert _bonuses(db, 24) == []
+    assert _bonuses(db, 25) == ["first_check_in_bonus"]
+    db.close()
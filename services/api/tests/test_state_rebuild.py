@@ -0,0 +1,232 @@
+import time
+from datetime import date
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import maintenance_jobs, state_rebuild
+from app.auth import require_admin
+from app.database import Base, get_db
+from app.main import app
+from app.models import (
+    ArchivedPartition,
+    CheckIn,
+    Habit,
+    PointsLedger,
+    Program,
+    Streak,
+    UserPointsBalance,
+)
+from app.points_ledger import reconcile_balances
+from app.routers import admin_maintenance
+
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+class DummyUser:
+    id = 999
+    role = "admin"
+
+
+class InMemoryRedis:
+    """Just enough of redis.Redis for the job queue and progress hashes."""
+
+    def __init__(self):
+        self.hashes = {}
+        self.lists = {}
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        return []
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(mapping)
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def expire(self, key, seconds):
+        return True
+
+    def rpush(self, key, value):
+        self.lists.setdefault(key, []).append(value)
+
+    def blpop(self, keys, timeout=0):
+        for key in keys:
+            if self.lists.get(key):
+                return key, self.lists[key].pop(0)
+        return None
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def setup_module():
+    Base.metadata.create_all(bind=engine)
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[require_admin] = lambda: DummyUser()
+
+
+def teardown_module():
+    app.dependency_overrides.clear()
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_rebuild_reports_then_repairs_drifted_streaks_and_balances(monkeypatch):
+    store = InMemoryRedis()
+    monkeypatch.setattr(admin_maintenance, "get_redis", lambda: store)
+    monkeypatch.setattr(maintenance_jobs, "REBUILD_HEARTBEAT_SECONDS", 0.01)
+    monkeypatch.setattr(state_rebuild, "get_redis", lambda: None)
+
+    db = TestingSessionLocal()
+    program = Program(name="Reprocessar")
+    db.add(program)
+    db.flush()
+    habit = Habit(program_id=program.id, name="Caminhar", points_per_completion=10)
+    db.add(habit)
+    db.commit()
+    habit_id = habit.id
+
+    client = TestClient(app)
+    for user_id, days in ((1, ("01", "02", "03", "05")), (2, ("01",)), (3, ("02", "03"))):
+        for day in days:
+            check_in = {"user_id": user_id, "habit_id": habit_id, "check_in_date": f"2026-04-{day}"}
+            assert client.post("/api/v1/check-ins/", json=check_in).status_code == 201
+
+    def streaks():
+        return {
+            (row.user_id, row.habit_id): (
+                row.current_streak,
+                row.longest_streak,
+                row.completed_runs,
+            )
+            for row in db.query(Streak)
+        }
+
+    expected = streaks()
+    db.expire_all()
+
+    # Drift: a wrong streak, a streak with no check-ins behind it, a lost ledger append
+    db.query(Streak).filter(Streak.user_id == 1).update({"current_streak": 9, "longest_streak": 9})
+    db.add(Streak(user_id=4, habit_id=habit_id, program_id=program.id, current_streak=2))
+    db.add(PointsLedger(user_id=3, program_id=program.id, points=5, event_type="manual"))
+    db.commit()
+    drifted = streaks()
+
+    response = client.post(
+        "/api/v1/admin/maintenance/rebuild-state", params={"workers": 1, "chunk_size": 2}
+    )
+    assert response.status_code == 202
+    job_url = f"/api/v1/admin/maintenance/rebuild-state/{response.json()['job_id']}"
+    # The API only queues the job; the maintenance runner picks it up
+    assert client.get(job_url).json()["status"] == "queued"
+    assert maintenance_jobs.run_next(store, timeout=0, session_factory=TestingSessionLocal)
+    assert not maintenance_jobs.run_next(store, timeout=0, session_factory=TestingSessionLocal)
+    job = client.get(job_url).json()
+    assert job["status"] == "finished"
+    assert job["dry_run"] is True
+    assert (job["users_total"], job["users_done"]) == (4, 4)
+    assert (job["streaks_changed"], job["balances_changed"]) == (2, 1)
+    streak_diffs = {diff["user_id"]: diff for diff in job["diffs"] if diff["kind"] == "streak"}
+    assert streak_diffs[1]["current_streak"] == [9, 1]
+    assert streak_diffs[1]["longest_streak"] == [9, 3]
+    assert streak_diffs[4]["current_streak"] == [2, 0]
+    [balance_diff] = [diff for diff in job["diffs"] if diff["kind"] == "balance"]
+    assert balance_diff["user_id"] == 3
+    before, after = balance_diff["total_points"]
+    assert after == before + 5
+    db.expire_all()
+    assert streaks() == drifted
+
+    progress = []
+    report = state_rebuild.rebuild_state(
+        TestingSessionLocal,
+        chunk_size=3,
+        progress=lambda report: progress.append(report.users_done),
+    )
+    assert progress == [3, 4]
+    assert (report.streaks_changed, report.balances_changed) == (2, 1)
+    db.expire_all()
+    assert streaks() == {**expected, (4, habit_id): (0, 0, [])}
+    assert reconcile_balances(db) == []
+    assert db.query(UserPointsBalance.total_points).filter(
+        UserPointsBalance.user_id == 3
+    ).scalar() == after
+    assert db.query(Streak.program_id).filter(Streak.user_id == 4).scalar() == program.id
+
+    again = state_rebuild.rebuild_state(TestingSessionLocal, dry_run=True)
+    assert (again.streaks_changed, again.balances_changed, again.diffs) == (0, 0, [])
+    assert client.get("/api/v1/admin/maintenance/rebuild-state/unknown").status_code == 404
+    db.close()
+
+
+def test_a_running_job_without_heartbeats_is_marked_failed(monkeypatch):
+    store = InMemoryRedis()
+    monkeypatch.setattr(admin_maintenance, "get_redis", lambda: store)
+    client = TestClient(app)
+
+    job_id = client.post("/api/v1/admin/maintenance/rebuild-state").json()["job_id"]
+    store.lists.clear()
+    now = time.time()
+    maintenance_jobs.save_job(store, job_id, status="running", heartbeat=now)
+    job_url = f"/api/v1/admin/maintenance/rebuild-state/{job_id}"
+    assert client.get(job_url).json()["status"] == "running"
+
+    # The runner died mid-job and its heartbeat went stale
+    timeout = maintenance_jobs.REBUILD_HEARTBEAT_TIMEOUT_SECONDS
+    monkeypatch.setattr(maintenance_jobs.time, "time", lambda: now + timeout + 1)
+    job = client.get(job_url).json()
+    assert job["status"] == "failed"
+    assert "stopped responding" in job["error"]
+    assert store.hashes[maintenance_jobs.job_key(job_id)]["status"] == "failed"
+
+
+def test_rebuild_keeps_the_days_of_detached_check_in_months():
+    db = TestingSessionLocal()
+    program = Program(name="Arquivo")
+    db.add(program)
+    db.flush()
+    habit = Habit(program_id=program.id, name="Ler", points_per_completion=10)
+    db.add(habit)
+    db.commit()
+
+    client = TestClient(app)
+    for day in ("2026-03-01", "2026-03-30", "2026-03-31", "2026-04-01", "2026-04-02"):
+        check_in = {"user_id": 10, "habit_id": habit.id, "check_in_date": day}
+        assert client.post("/api/v1/check-ins/", json=check_in).status_code == 201
+    streak = db.query(Streak).filter(Streak.user_id == 10).one()
+    expected = (streak.current_streak, streak.longest_streak, streak.completed_runs)
+    assert expected[:2] == (4, 4)
+
+    # March detached by check-in retention, then the streak drifts
+    db.query(CheckIn).filter(
+        CheckIn.user_id == 10, CheckIn.check_in_date < date(2026, 4, 1)
+    ).delete()
+    db.add(ArchivedPartition(table_name="check_ins", month=date(2026, 3, 1)))
+    streak.current_streak = 9
+    db.commit()
+
+    result = state_rebuild.rebuild_chunk(db, [10])
+    db.commit()
+    db.refresh(streak)
+    assert result.streaks_changed == 1
+    assert (streak.current_streak, streak.longest_streak, streak.completed_runs) == expected
+    assert reconcile_balances(db, user_ids=[10]) == []
+    db.query(ArchivedPartition).delete()
+    db.commit()
+    db.close()
@@ -0,0 +1,43 @@
+from datetime import date, timedelta
+
+from app.streak_engine import HabitStreak, add_day
+
+
+def test_add_day_merges_neighbouring_runs():
+    runs = [[10, 12], [14, 15]]
+
+    added = add_day(runs, 13)
+
+    assert runs == [[10, 15]]
+    assert (added.left_length, added.right_length, added.run_length) == (3, 2, 6)
+    assert add_day(runs, 11).added is False
+
+
+def test_backfilled_days_keep_streak_exact():
+    start = date(2026, 3, 1)
+    streak = HabitStreak()
+    for offset in (5, 6, 0, 1, 3, 2, 4, 9):
+        streak.add(start + timedelta(days=offset))
+
+    assert streak.runs == [
+        [start.toordinal(), (start + timedelta(days=6)).toordinal()],
+        [(start + timedelta(days=9)).toordinal()] * 2,
+    ]
+    assert streak.current_streak == 1
+    assert streak.longest == 7
+    assert streak.last_check_in_date == start + timedelta(days=9)
+
+
+def test_legacy_row_without_runs_is_seeded_from_counters():
+    class LegacyStreak:
+        completed_runs = None
+        current_streak = 3
+        longest_streak = 5
+        last_check_in_date = date(2026, 3, 10)
+
+    streak = HabitStreak.from_row(LegacyStreak())
+    streak.add(date(2026, 3, 7))
+
+    assert streak.current_streak == 4
+    assert streak.longest == 5
+    assert streak.last_check_in_date == date(2026, 3, 10)
@@ -69,6 +69,11 @@ export async function getUserDashboard(userId: number) {
   return fetchAPI(`/api/v1/users/${userId}/dashboard/`);
 }
 
+export async function getUserDashboards(userIds: number[]) {
+  const params = userIds.map((id) => `user_ids=${id}`).join('&');
+  return fetchAPI(`/api/v1/users/dashboards?${params}`);
+}
+
 export async function getUserPoints(userId: number, programId?: number) {
   const params = programId ? `?program_id=${programId}` : '';
   return fetchAPI(`/api/v1/users/${userId}/points/${params}`);
@@ -1,11 +1,62 @@
-"""Worker entrypoint with Celery tasks for protocol recomputation."""
+"""Worker entrypoint with Celery tasks for protocol recomputation and ledger upkeep.
+
+`python -m app.main` runs the Celery worker with its beat schedule;
+`python -m app.main check-in-consumer` runs the write-behind check-in consumer
+instead. `python -m app.main points-checkpoints` and `python -m app.main partitions`
+run the monthly points checkpoints and the partition maintenance once.
+`python -m app.main rebuild-state [--apply]` queues a replay of streaks and
+balances for the API's maintenance runner, as a dry run unless `--apply` is given.
+`python -m app.main rollups [--backfill]` folds new check-ins and ledger entries
+into the daily analytics rollups, or recomputes them for every day with data.
+"""
+import json
+import logging
 import os
+import re
+import socket
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import httpx
+import redis
 from celery import Celery
+from celery.schedules import crontab
+from sqlalchemy import create_engine, text
 
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+API_BASE_URL = os.getenv("API_BASE_URL", "http://api:8000")
+DATABASE_URL = os.getenv("DATABASE_URL", "postgresql+psycopg://mevuser:mevpass@db:5432/mevdb")
 
 celery_app = Celery("mev_worker", broker=REDIS_URL, backend=REDIS_URL)
+celery_app.conf.beat_schedule = {
+    "write-points-checkpoints": {
+        "task": "write_points_checkpoints",
+        "schedule": crontab(minute=30, hour=0, day_of_month=1),
+    },
+    "maintain-partitions": {
+        "task": "maintain_partitions",
+        "schedule": crontab(minute=0, hour=1),
+    },
+    "refresh-daily-rollups": {
+        "task": "refresh_daily_rollups",
+        "schedule": 60.0,
+    },
+}
+
+_engine = None
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        _engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+    return _engine
+
+logger = logging.getLogger(__name__)
 
 
 @celery_app.task(name="recompute_protocol_run")
@@ -18,5 +69,665 @@ def recompute_protocol_run(protocol_run_id: int):
     }
 
 
+# ============= Monthly points checkpoints =============
+# Table names match services/api/app/models.py. A checkpoint at the first instant
+# of a month holds a (user, program) balance over the ledger entries created
+# before it. Months are written in order, and only for keys with entries in the
+# month, so a key's latest checkpoint always covers everything before the next
+# month it was active in; GET /users/{id}/points/as-of relies on that.
+
+CHECKPOINT_SQL = text(
+    """
+    WITH activity AS (
+        SELECT user_id, COALESCE(program_id, 0) AS program_id,
+               SUM(points) AS points, COUNT(*) AS entries
+        FROM points_ledger
+        WHERE created_at >= :month_start AND created_at < :checkpoint_at
+        GROUP BY user_id, COALESCE(program_id, 0)
+    ), previous AS (
+        SELECT DISTINCT ON (c.user_id, c.program_id)
+               c.user_id, c.program_id, c.total_points, c.transaction_count
+        FROM points_checkpoints c
+        JOIN activity a ON a.user_id = c.user_id AND a.program_id = c.program_id
+        WHERE c.checkpoint_at <= :month_start
+        ORDER BY c.user_id, c.program_id, c.checkpoint_at DESC
+    )
+    INSERT INTO points_checkpoints
+        (user_id, program_id, checkpoint_at, total_points, transaction_count, created_at)
+    SELECT a.user_id, a.program_id, :checkpoint_at,
+           COALESCE(p.total_points, 0) + a.points,
+           COALESCE(p.transaction_count, 0) + a.entries,
+           now()
+    FROM activity a
+    LEFT JOIN previous p ON p.user_id = a.user_id AND p.program_id = a.program_id
+    ON CONFLICT (user_id, program_id, checkpoint_at) DO NOTHING
+    """
+)
+
+
+def next_month(moment: date) -> datetime:
+    return datetime(moment.year + moment.month // 12, moment.month % 12 + 1, 1)
+
+
+@celery_app.task(name="write_points_checkpoints")
+def write_points_checkpoints():
+    """Write checkpoints for every month that ended since the last one.
+
+    The first run walks the ledger from its first month. Each month commits on
+    its own, so an interrupted run resumes where it stopped.
+    """
+    current_month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    written = {}
+    with get_engine().connect() as conn:
+        last = conn.execute(text("SELECT max(checkpoint_at) FROM points_checkpoints")).scalar()
+        if last is None:
+            first = conn.execute(text("SELECT min(created_at) FROM points_ledger")).scalar()
+            if first is None:
+                return written
+            last = first.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+        month_start, checkpoint_at = last, next_month(last)
+        while checkpoint_at <= current_month:
+            result = conn.execute(
+                CHECKPOINT_SQL, {"month_start": month_start, "checkpoint_at": checkpoint_at}
+            )
+            conn.commit()
+            written[checkpoint_at.date().isoformat()] = result.rowcount
+            logger.info(f"Wrote {result.rowcount} points checkpoints at {checkpoint_at:%Y-%m-%d}")
+            month_start, checkpoint_at = checkpoint_at, next_month(checkpoint_at)
+    return written
+
+
+# ============= Monthly partitions =============
+# points_ledger and check_ins are range-partitioned by month (API migration
+# 20261016_0008) into <table>_yYYYYmMM partitions plus <table>_default.
+# Partitions are created ahead of time so rows rarely land in the default one;
+# those that did are moved into their month's partition as it is created, since
+# PostgreSQL refuses a partition whose range the default already holds rows for.
+# A partition that cannot be created or detached is logged and skipped.
+# Retention is opt-in: partitions entirely older than the retention window are
+# detached, not dropped, and stay behind as plain tables to archive or drop.
+# Each detached month is recorded in archived_partitions in the same transaction.
+# Ledger months are only detached once the points checkpoints cover everything
+# before the cutoff; the API's reconciliation and rebuild then start from those
+# checkpoints, and from the streaks' stored runs for detached check-in months.
+
+PARTITIONED_TABLES = {"points_ledger": "created_at", "check_ins": "check_in_date"}
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_RETENTION_MONTHS = {
+    "points_ledger": int(os.getenv("POINTS_LEDGER_RETENTION_MONTHS", "0")),
+    "check_ins": int(os.getenv("CHECK_INS_RETENTION_MONTHS", "0")),
+}
+PARTITION_NAME = re.compile(r"^(?P<table>\w+)_y(?P<year>\d{4})m(?P<month>\d{2})$")
+
+UNFOLDED_LEDGER_SQL = text(
+    """
+    SELECT EXISTS (
+        SELECT 1 FROM points_ledger
+        WHERE created_at < :cutoff
+          AND created_at >= COALESCE(
+              (SELECT max(checkpoint_at) FROM points_checkpoints), '-infinity'
+          )
+    )
+    """
+)
+ARCHIVE_SQL = text(
+    """
+    INSERT INTO archived_partitions (table_name, month, detached_at)
+    VALUES (:table, :month, now())
+    ON CONFLICT (table_name, month) DO NOTHING
+    """
+)
+
+
+def months_before(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 - count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def create_partition(conn, table: str, month: date) -> str:
+    """Create `table`'s partition for `month` in the caller's transaction.
+
+    Rows already in the default partition for that month are moved into it.
+    """
+    name = f"{table}_y{month:%Y}m{month:%m}"
+    column = PARTITIONED_TABLES[table]
+    bounds = {"start": month, "end": next_month(month).date()}
+    in_range = f"{column} >= :start AND {column} < :end"
+    stray = conn.execute(
+        text(f"SELECT EXISTS (SELECT 1 FROM {table}_default WHERE {in_range})"), bounds
+    ).scalar()
+    if stray:
+        conn.execute(text(f"CREATE TEMP TABLE stray_rows (LIKE {table}) ON COMMIT DROP"))
+        conn.execute(
+            text(
+                f"WITH moved AS (DELETE FROM {table}_default WHERE {in_range} RETURNING *) "
+                "INSERT INTO stray_rows SELECT * FROM moved"
+            ),
+            bounds,
+        )
+    conn.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{bounds['start'].isoformat()}') TO ('{bounds['end'].isoformat()}')"
+        )
+    )
+    if stray:
+        conn.execute(text(f"INSERT INTO {table} SELECT * FROM stray_rows"))
+        logger.warning(f"Moved rows of {name} out of {table}_default")
+    return name
+
+
+@celery_app.task(name="maintain_partitions")
+def maintain_partitions():
+    """Create the coming months' partitions and detach those past retention."""
+    this_month = datetime.utcnow().date().replace(day=1)
+    created, detached, failed = [], [], []
+    with get_engine().connect() as conn:
+        attached = set(
+            conn.execute(
+                text(
+                    "SELECT child.relname FROM pg_inherits "
+                    "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                    "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+                    "WHERE parent.relname IN ('points_ledger', 'check_ins')"
+                )
+            ).scalars()
+        )
+        for table in PARTITIONED_TABLES:
+            month = this_month
+            for _ in range(PARTITION_MONTHS_AHEAD + 1):
+                name = f"{table}_y{month:%Y}m{month:%m}"
+                if name not in attached:
+                    try:
+                        create_partition(conn, table, month)
+                        conn.commit()
+                        created.append(name)
+                    except Exception:
+                        conn.rollback()
+                        logger.exception(f"Could not create partition {name}")
+                        failed.append(name)
+                month = next_month(month).date()
+
+            retention = PARTITION_RETENTION_MONTHS[table]
+            if retention <= 0:
+                continue
+            cutoff = months_before(this_month, retention)
+            expired = []
+            for name in sorted(attached):
+                match = PARTITION_NAME.match(name)
+                if not match or match["table"] != table:
+                    continue
+                month = date(int(match["year"]), int(match["month"]), 1)
+                if month < cutoff:
+                    expired.append((name, month))
+            if expired and table == "points_ledger":
+                # Fold the months into the checkpoints before their rows go away
+                write_points_checkpoints()
+                if conn.execute(UNFOLDED_LEDGER_SQL, {"cutoff": cutoff}).scalar():
+                    conn.rollback()
+                    logger.error(
+                        f"Not detaching {table} partitions: checkpoints do not cover "
+                        f"the ledger before {cutoff}"
+                    )
+                    continue
+            for name, month in expired:
+                try:
+                    conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+                    conn.execute(ARCHIVE_SQL, {"table": table, "month": month})
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    logger.exception(f"Could not detach partition {name}")
+                    failed.append(name)
+                    # Later months wait, so detached months stay the oldest ones
+                    break
+                detached.append(name)
+    for name in created:
+        logger.info(f"Created partition {name}")
+    for name in detached:
+        logger.info(f"Detached partition {name}")
+    return {"created": created, "detached": detached, "failed": failed}
+
+
+# ============= Streak and balance rebuild =============
+# The replay needs the API's streak engine, so the worker queues the job for
+# the API image's maintenance runner (`python -m app.maintenance_jobs`, see
+# services/api/app/maintenance_jobs.py for the shared key names) and follows
+# its progress. Polling gives up after REBUILD_TIMEOUT_SECONDS, or as soon as
+# the runner's heartbeat is older than REBUILD_HEARTBEAT_TIMEOUT_SECONDS. A job
+# no runner picked up within that timeout is marked failed and taken off the
+# queue, so the task does not wait hours for a runner that is not deployed.
+
+REBUILD_QUEUE_KEY = "state_rebuild:queue"
+REBUILD_JOB_TTL_SECONDS = 24 * 3600
+REBUILD_POLL_SECONDS = float(os.getenv("REBUILD_POLL_SECONDS", "10"))
+REBUILD_TIMEOUT_SECONDS = float(os.getenv("REBUILD_TIMEOUT_SECONDS", str(6 * 3600)))
+REBUILD_HEARTBEAT_TIMEOUT_SECONDS = float(os.getenv("REBUILD_HEARTBEAT_TIMEOUT_SECONDS", "120"))
+
+
+def rebuild_job_key(job_id: str) -> str:
+    return f"state_rebuild:{job_id}"
+
+
+@celery_app.task(name="rebuild_state")
+def rebuild_state(dry_run: bool = True, workers: int = 4, chunk_size: int = 500):
+    """Replay check-ins and the ledger into streaks and balances; dry run by default."""
+    client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    job_id = uuid.uuid4().hex
+    key = rebuild_job_key(job_id)
+    pipe = client.pipeline(transaction=True)
+    pipe.hset(
+        key,
+        mapping={
+            "status": "queued",
+            "dry_run": str(dry_run),
+            "workers": str(workers),
+            "chunk_size": str(chunk_size),
+            "users_total": "0",
+            "users_done": "0",
+        },
+    )
+    pipe.expire(key, REBUILD_JOB_TTL_SECONDS)
+    pipe.rpush(REBUILD_QUEUE_KEY, job_id)
+    pipe.execute()
+    queued_at = time.time()
+    logger.info(f"Queued state rebuild {job_id}")
+
+    deadline = time.monotonic() + REBUILD_TIMEOUT_SECONDS
+    while True:
+        time.sleep(REBUILD_POLL_SECONDS)
+        job = client.hgetall(key)
+        if job.get("summary"):
+            logger.info(f"State rebuild {job_id}: {job['summary']}")
+        if job.get("status") not in ("queued", "running"):
+            break
+        heartbeat = float(job.get("heartbeat", queued_at))
+        if time.time() - heartbeat > REBUILD_HEARTBEAT_TIMEOUT_SECONDS:
+            if job["status"] == "running":
+                raise RuntimeError(f"State rebuild {job_id}: runner stopped responding")
+            # Still in the list means no runner popped it; otherwise one just did
+            if client.lrem(REBUILD_QUEUE_KEY, 0, job_id):
+                error = "no maintenance runner picked up the job"
+                client.hset(key, mapping={"status": "failed", "error": error})
+                raise RuntimeError(f"State rebuild {job_id}: {error}")
+        if time.monotonic() > deadline:
+            raise TimeoutError(
+                f"State rebuild {job_id} still {job['status']} "
+                f"after {REBUILD_TIMEOUT_SECONDS:.0f}s"
+            )
+    if job.get("status") != "finished":
+        raise RuntimeError(f"State rebuild {job_id} failed: {job.get('error')}")
+    for diff in json.loads(job.get("diffs", "[]")):
+        logger.info(json.dumps(diff))
+    return job
+
+
+# ============= Daily analytics rollups =============
+# Table names match services/api/app/models.py (DailyRollup, RollupWatermark).
+# daily_rollups holds check-ins, distinct active users and points awarded per
+# day at three levels: (program, habit), (program, habit_id 0) and
+# (program_id 0, habit_id 0) for the whole system, so the admin analytics read
+# a handful of rows per day instead of scanning check_ins.
+# A day is always recomputed whole from the source tables, since distinct user
+# counts cannot be added up. Check-ins count on their check_in_date, points on
+# the day they were created; check-in points are also attributed to the habit.
+# Each minute the task recomputes the days touched by rows past the source's
+# watermark that are at least ROLLUP_SETTLE_SECONDS old, so transactions still
+# open behind a higher id have committed. Rows of partitions detached for
+# retention keep their rollups until those days are recomputed.
+# Refreshes and backfills hold ROLLUP_LOCK_KEY as a session lock from reading
+# the watermarks to writing them, across the backfill's monthly commits; a beat
+# that finds it taken skips its run.
+
+ROLLUP_SETTLE_SECONDS = int(os.getenv("ROLLUP_SETTLE_SECONDS", "60"))
+ROLLUP_BACKFILL_DAYS = 31
+ROLLUP_LOCK_KEY = 2026101709
+ROLLUP_SOURCES = {"check_ins": "check_in_date", "points_ledger": "CAST(created_at AS date)"}
+
+ROLLUP_SQL = text(
+    """
+    WITH check_in_totals AS (
+        SELECT c.check_in_date AS day,
+               CASE WHEN GROUPING(h.program_id) = 1 THEN 0 ELSE h.program_id END AS program_id,
+               CASE WHEN GROUPING(c.habit_id) = 1 THEN 0 ELSE c.habit_id END AS habit_id,
+               COUNT(*) AS check_ins, COUNT(DISTINCT c.user_id) AS active_users
+        FROM check_ins c
+        JOIN habits h ON h.id = c.habit_id
+        WHERE c.check_in_date = ANY(:days)
+        GROUP BY GROUPING SETS (
+            (c.check_in_date, h.program_id, c.habit_id), (c.check_in_date, h.program_id),
+            (c.check_in_date)
+        )
+    ), point_totals AS (
+        SELECT CAST(l.created_at AS date) AS day,
+               CASE WHEN GROUPING(l.program_id) = 1 THEN 0 ELSE l.program_id END AS program_id,
+               CASE WHEN GROUPING(c.habit_id) = 1 THEN 0 ELSE c.habit_id END AS habit_id,
+               SUM(l.points) AS points_awarded
+        FROM points_ledger l
+        LEFT JOIN check_ins c ON l.event_type = 'check_in' AND c.id = l.event_reference_id
+        WHERE l.created_at >= :first_day AND l.created_at < :after_last_day
+          AND CAST(l.created_at AS date) = ANY(:days)
+        GROUP BY GROUPING SETS (
+            (CAST(l.created_at AS date), l.program_id, c.habit_id),
+            (CAST(l.created_at AS date), l.program_id),
+            (CAST(l.created_at AS date))
+        )
+        -- Entries with no program, or not from a check-in, only count at the
+        -- levels above them
+        HAVING (GROUPING(l.program_id) = 1 OR l.program_id IS NOT NULL)
+           AND (GROUPING(c.habit_id) = 1 OR c.habit_id IS NOT NULL)
+    )
+    INSERT INTO daily_rollups
+        (program_id, habit_id, day, check_ins, active_users, points_awarded, updated_at)
+    SELECT COALESCE(c.program_id, p.program_id), COALESCE(c.habit_id, p.habit_id),
+           COALESCE(c.day, p.day), COALESCE(c.check_ins, 0), COALESCE(c.active_users, 0),
+           COALESCE(p.points_awarded, 0), now()
+    FROM check_in_totals c
+    FULL OUTER JOIN point_totals p
+        ON p.day = c.day AND p.program_id = c.program_id AND p.habit_id = c.habit_id
+    """
+)
+
+WATERMARK_SQL = text(
+    """
+    INSERT INTO rollup_watermarks (source, last_id, updated_at)
+    VALUES (:source, :last_id, now())
+    ON CONFLICT (source) DO UPDATE
+    SET last_id = GREATEST(rollup_watermarks.last_id, EXCLUDED.last_id), updated_at = now()
+    """
+)
+
+
+@contextmanager
+def rollup_lock(conn, wait: bool = True):
+    """Hold the rollups' advisory lock on `conn`'s session; yields whether it was taken."""
+    function = "pg_advisory_lock" if wait else "pg_try_advisory_lock"
+    taken = conn.execute(text(f"SELECT {function}(:key)"), {"key": ROLLUP_LOCK_KEY}).scalar()
+    taken = taken is not False
+    conn.commit()
+    try:
+        yield taken
+    finally:
+        conn.rollback()
+        if taken:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ROLLUP_LOCK_KEY})
+            conn.commit()
+
+
+def recompute_rollup_days(conn, days) -> int:
+    """Replace the rollups of `days` within the caller's transaction."""
+    days = sorted(set(days))
+    conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ROLLUP_LOCK_KEY})
+    conn.execute(text("DELETE FROM daily_rollups WHERE day = ANY(:days)"), {"days": days})
+    result = conn.execute(
+        ROLLUP_SQL,
+        {
+            "days": days,
+            "first_day": datetime.combine(days[0], datetime.min.time()),
+            "after_last_day": datetime.combine(days[-1] + timedelta(days=1), datetime.min.time()),
+        },
+    )
+    return result.rowcount
+
+
+@celery_app.task(name="refresh_daily_rollups")
+def refresh_daily_rollups():
+    """Recompute the days touched by settled rows past each source's watermark."""
+    settled_before = datetime.utcnow() - timedelta(seconds=ROLLUP_SETTLE_SECONDS)
+    with get_engine().connect() as conn, rollup_lock(conn, wait=False) as taken:
+        if not taken:
+            logger.info("Rollups are being refreshed elsewhere; skipping")
+            return {"skipped": True}
+        watermarks = dict(
+            conn.execute(text("SELECT source, last_id FROM rollup_watermarks")).all()
+        )
+        if not watermarks:
+            # The first run covers all existing data, a month per transaction
+            return _backfill_rollups(conn)
+
+        days, advanced = set(), {}
+        for source, day_expression in ROLLUP_SOURCES.items():
+            last_id = watermarks.get(source, 0)
+            max_id = conn.execute(
+                text(
+                    f"SELECT max(id) FROM {source} "
+                    "WHERE id > :last_id AND created_at < :settled_before"
+                ),
+                {"last_id": last_id, "settled_before": settled_before},
+            ).scalar()
+            if max_id is None:
+                continue
+            days.update(
+                conn.execute(
+                    text(
+                        f"SELECT DISTINCT {day_expression} FROM {source} "
+                        "WHERE id > :last_id AND id <= :max_id"
+                    ),
+                    {"last_id": last_id, "max_id": max_id},
+                ).scalars()
+            )
+            advanced[source] = max_id
+        rows = recompute_rollup_days(conn, days) if days else 0
+        for source, last_id in advanced.items():
+            conn.execute(WATERMARK_SQL, {"source": source, "last_id": last_id})
+        conn.commit()
+    if days:
+        logger.info(f"Recomputed {rows} rollup rows over {len(days)} days")
+    return {"days": len(days), "rows": rows}
+
+
+def backfill_daily_rollups():
+    """Recompute every day with check-ins or ledger entries, a month per transaction."""
+    with get_engine().connect() as conn, rollup_lock(conn):
+        return _backfill_rollups(conn)
+
+
+def _backfill_rollups(conn):
+    last_ids = {
+        source: conn.execute(text(f"SELECT COALESCE(max(id), 0) FROM {source}")).scalar()
+        for source in ROLLUP_SOURCES
+    }
+    conn.commit()
+    days = sorted(
+        conn.execute(
+            text(
+                " UNION ".join(
+                    f"SELECT DISTINCT {day_expression} FROM {source}"
+                    for source, day_expression in ROLLUP_SOURCES.items()
+                )
+            )
+        ).scalars()
+    )
+    rows = 0
+    for start in range(0, len(days), ROLLUP_BACKFILL_DAYS):
+        chunk = days[start : start + ROLLUP_BACKFILL_DAYS]
+        rows += recompute_rollup_days(conn, chunk)
+        conn.commit()
+        logger.info(f"Rolled up {chunk[0]} to {chunk[-1]}")
+    # Rows past these ids are picked up by the next refresh
+    for source, last_id in last_ids.items():
+        conn.execute(WATERMARK_SQL, {"source": source, "last_id": last_id})
+    conn.commit()
+    logger.info(f"Backfilled {rows} rollup rows over {len(days)} days")
+    return {"days": len(days), "rows": rows}
+
+
+# ============= Write-behind check-in consumer =============
+# Stream and key names match services/api/app/check_in_stream.py. Each shard is
+# owned by exactly one consumer (shard % CONSUMER_COUNT == CONSUMER_INDEX) so a
+# user's check-ins are materialized in the order the API accepted them.
+
+CHECK_IN_STREAM_SHARDS = int(os.getenv("CHECK_IN_STREAM_SHARDS", "8"))
+CHECK_IN_CONSUMER_INDEX = int(os.getenv("CHECK_IN_CONSUMER_INDEX", "0"))
+CHECK_IN_CONSUMER_COUNT = int(os.getenv("CHECK_IN_CONSUMER_COUNT", "1"))
+CHECK_IN_BATCH_SIZE = int(os.getenv("CHECK_IN_BATCH_SIZE", "200"))
+CHECK_IN_MAX_DELIVERIES = int(os.getenv("CHECK_IN_MAX_DELIVERIES", "5"))
+CHECK_IN_RETRY_BACKOFF_SECONDS = float(os.getenv("CHECK_IN_RETRY_BACKOFF_SECONDS", "2"))
+CHECK_IN_GROUP = "check-in-materializer"
+CHECK_IN_DEAD_LETTER_STREAM = "check_ins:dead_letter"
+
+
+class RetryableBatchError(Exception):
+    """The API could not store the batch right now; leave events pending."""
+
+
+def check_in_stream_key(shard: int) -> str:
+    return f"check_ins:stream:{shard}"
+
+
+def check_in_pending_key(user_id: int) -> str:
+    return f"check_ins:pending:{user_id}"
+
+
+def ensure_consumer_groups(client: redis.Redis, streams):
+    for stream in streams:
+        try:
+            client.xgroup_create(stream, CHECK_IN_GROUP, id="0", mkstream=True)
+        except redis.ResponseError as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+
+
+def delivery_counts(client: redis.Redis, entries):
+    """Delivery count per (stream, message id) for entries re-read from the PEL."""
+    pipe = client.pipeline(transaction=False)
+    for stream, message_id, _ in entries:
+        pipe.xpending_range(stream, CHECK_IN_GROUP, min=message_id, max=message_id, count=1)
+    counts = {}
+    for (stream, message_id, _), pending in zip(entries, pipe.execute()):
+        counts[(stream, message_id)] = pending[0]["times_delivered"] if pending else 1
+    return counts
+
+
+def materialize_batch(http: httpx.Client, events):
+    """Store events through the batch endpoint; returns per-event statuses.
+
+    Raises RetryableBatchError for transport errors and 5xx responses. Any other
+    non-2xx response means the batch itself is unacceptable, so every event gets
+    that status and is dead-lettered.
+    """
+    payload = {"check_ins": [event["check_in"] for event in events]}
+    try:
+        response = http.post(f"{API_BASE_URL}/api/v1/check-ins/batch", json=payload)
+    except httpx.HTTPError as exc:
+        raise RetryableBatchError(str(exc)) from exc
+    if response.status_code >= 500:
+        raise RetryableBatchError(f"API answered {response.status_code}")
+    if response.status_code >= 400:
+        return [f"rejected_{response.status_code}"] * len(events)
+    return [result["status"] for result in response.json()["results"]]
+
+
+def settle(client: redis.Redis, entries, statuses):
+    """Ack stored events and dead-letter the rest, dropping them from pending."""
+    pipe = client.pipeline(transaction=True)
+    for (stream, message_id, event), item_status in zip(entries, statuses):
+        if item_status not in ("created", "duplicate"):
+            pipe.xadd(
+                CHECK_IN_DEAD_LETTER_STREAM,
+                {
+                    "event": json.dumps(event),
+                    "reason": item_status,
+                    "source_stream": stream,
+                    "source_id": message_id,
+                },
+            )
+        pipe.xack(stream, CHECK_IN_GROUP, message_id)
+        pipe.xdel(stream, message_id)
+        pipe.hdel(check_in_pending_key(event["check_in"]["user_id"]), event["event_id"])
+    pipe.execute()
+
+
+def consume_batch(
+    client: redis.Redis,
+    http: httpx.Client,
+    consumer: str,
+    streams,
+    replaying: bool,
+    block_ms: int = 5000,
+) -> bool:
+    """Read one batch and materialize it; returns whether the next read replays pending entries.
+
+    Replaying re-reads the entries already delivered to `consumer`. Entries
+    delivered more than CHECK_IN_MAX_DELIVERIES times are dead-lettered
+    unsent. A batch the API could not store stays pending and is replayed
+    after CHECK_IN_RETRY_BACKOFF_SECONDS.
+    """
+    response = client.xreadgroup(
+        CHECK_IN_GROUP,
+        consumer,
+        {stream: "0" if replaying else ">" for stream in streams},
+        count=CHECK_IN_BATCH_SIZE,
+        block=None if replaying else block_ms,
+    )
+    entries = [
+        (stream, message_id, json.loads(fields["event"]))
+        for stream, messages in response or []
+        for message_id, fields in messages
+        if fields  # entries deleted while pending come back empty
+    ]
+    if not entries:
+        return False
+
+    if replaying:
+        counts = delivery_counts(client, entries)
+        exhausted = [
+            entry for entry in entries if counts[(entry[0], entry[1])] > CHECK_IN_MAX_DELIVERIES
+        ]
+        if exhausted:
+            settle(client, exhausted, ["max_deliveries_exceeded"] * len(exhausted))
+            entries = [entry for entry in entries if entry not in exhausted]
+            if not entries:
+                return True
+
+    try:
+        statuses = materialize_batch(http, [event for _, _, event in entries])
+    except RetryableBatchError:
+        logger.warning("Check-in batch failed, retrying", exc_info=True)
+        time.sleep(CHECK_IN_RETRY_BACKOFF_SECONDS)
+        return True
+
+    settle(client, entries, statuses)
+    return replaying
+
+
+def consume_check_ins(block_ms: int = 5000):
+    """Materialize write-behind check-ins from this consumer's shards forever."""
+    client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    consumer = f"{socket.gethostname()}-{CHECK_IN_CONSUMER_INDEX}"
+    streams = [
+        check_in_stream_key(shard)
+        for shard in range(CHECK_IN_STREAM_SHARDS)
+        if shard % CHECK_IN_CONSUMER_COUNT == CHECK_IN_CONSUMER_INDEX
+    ]
+    ensure_consumer_groups(client, streams)
+
+    # Start by re-reading anything delivered to us before a crash or restart
+    replaying = True
+    with httpx.Client(timeout=30) as http:
+        while True:
+            replaying = consume_batch(client, http, consumer, streams, replaying, block_ms)
+
+
 if __name__ == "__main__":
-    celery_app.worker_main(["worker", "--loglevel=info"])
+    if sys.argv[1:] == ["check-in-consumer"]:
+        logging.basicConfig(level=logging.INFO)
+        consume_check_ins()
+    elif sys.argv[1:] == ["points-checkpoints"]:
+        logging.basicConfig(level=logging.INFO)
+        write_points_checkpoints()
+    elif sys.argv[1:] == ["partitions"]:
+        logging.basicConfig(level=logging.INFO)
+        maintain_partitions()
+    elif sys.argv[1:2] == ["rebuild-state"] and sys.argv[2:] in ([], ["--apply"]):
+        logging.basicConfig(level=logging.INFO)
+        rebuild_state(dry_run=sys.argv[2:] != ["--apply"])
+    elif sys.argv[1:] == ["rollups"]:
+        logging.basicConfig(level=logging.INFO)
+        refresh_daily_rollups()
+    elif sys.argv[1:] == ["rollups", "--backfill"]:
+        logging.basicConfig(level=logging.INFO)
+        backfill_daily_rollups()
+    else:
+        celery_app.worker_main(["worker", "--beat", "--loglevel=info"])
@@ -0,0 +1,217 @@
+import json
+from datetime import date
+from uuid import uuid4
+
+import httpx
+import pytest
+import redis
+
+from app import main
+
+STREAMS = [main.check_in_stream_key(0), main.check_in_stream_key(1)]
+CONSUMER = "test-consumer"
+
+
+class FakeRedis:
+    """Just enough of redis.Redis for consumer groups, streams and pending hashes."""
+
+    def __init__(self):
+        self.streams = {}
+        self.groups = {}
+        self.hashes = {}
+        self.sequence = 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def xgroup_create(self, stream, group, id="$", mkstream=False):
+        if (stream, group) in self.groups:
+            raise redis.ResponseError("BUSYGROUP Consumer Group name already exists")
+        self.streams.setdefault(stream, {})
+        self.groups[(stream, group)] = {"delivered": set(), "pending": {}}
+
+    def xadd(self, stream, fields):
+        self.sequence += 1
+        message_id = f"{self.sequence}-0"
+        self.streams.setdefault(stream, {})[message_id] = dict(fields)
+        return message_id
+
+    def xreadgroup(self, group, consumer, streams, count=None, block=None):
+        response = []
+        for stream, last_id in streams.items():
+            state = self.groups[(stream, group)]
+            if last_id == ">":
+                ids = [i for i in self.streams[stream] if i not in state["delivered"]][:count]
+                for message_id in ids:
+                    state["delivered"].add(message_id)
+                    state["pending"][message_id] = {"consumer": consumer, "times_delivered": 1}
+            else:
+                # Re-reading the pending list counts as another delivery
+                ids = [
+                    i for i, entry in state["pending"].items() if entry["consumer"] == consumer
+                ][:count]
+                for message_id in ids:
+                    state["pending"][message_id]["times_delivered"] += 1
+            messages = [(i, self.streams[stream].get(i, {})) for i in ids]
+            if messages:
+                response.append([stream, messages])
+        return response
+
+    def xpending_range(self, stream, group, min, max, count):
+        entry = self.groups[(stream, group)]["pending"].get(min)
+        return [{"message_id": min, **entry}] if entry else []
+
+    def xack(self, stream, group, message_id):
+        return int(self.groups[(stream, group)]["pending"].pop(message_id, None) is not None)
+
+    def xdel(self, stream, message_id):
+        return int(self.streams[stream].pop(message_id, None) is not None)
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    def hdel(self, key, field):
+        return int(self.hashes.get(key, {}).pop(field, None) is not None)
+
+    def pending(self, stream):
+        return self.groups[(stream, main.CHECK_IN_GROUP)]["pending"]
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((getattr(self.client, name), args, kwargs))
+
+        return queue
+
+    def execute(self):
+        return [method(*args, **kwargs) for method, args, kwargs in self.calls]
+
+
+class FakeAPI:
+    """Answers POST /check-ins/batch with the queued responses, recording each batch."""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.batches = []
+
+    def __call__(self, request):
+        assert request.url.path == "/api/v1/check-ins/batch"
+        check_ins = json.loads(request.content)["check_ins"]
+        self.batches.append(check_ins)
+        answer = self.answers.pop(0) if len(self.answers) > 1 else self.answers[0]
+        if isinstance(answer, Exception):
+            raise answer
+        if isinstance(answer, int):
+            return httpx.Response(answer)
+        return httpx.Response(
+            200, json={"results": [{"index": i, "status": s} for i, s in enumerate(answer)]}
+        )
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, "CHECK_IN_RETRY_BACKOFF_SECONDS", 0)
+    client = FakeRedis()
+    main.ensure_consumer_groups(client, STREAMS)
+    main.ensure_consumer_groups(client, STREAMS)  # a restart finds the groups there
+    return client
+
+
+def enqueue(client, user_id, day):
+    """Append an event the way services/api/app/check_in_stream.py does."""
+    event = {
+        "event_id": uuid4().hex,
+        "enqueued_at": "2026-10-17T12:00:00",
+        "check_in": {"user_id": user_id, "habit_id": 1, "check_in_date": day.isoformat()},
+    }
+    client.xadd(STREAMS[user_id % 2], {"event": json.dumps(event)})
+    client.hset(main.check_in_pending_key(user_id), event["event_id"], json.dumps(event))
+    return event
+
+
+def step(client, api, replaying):
+    with httpx.Client(transport=httpx.MockTransport(api)) as http:
+        return main.consume_batch(client, http, CONSUMER, STREAMS, replaying)
+
+
+def dead_letters(client):
+    return list(client.streams.get(main.CHECK_IN_DEAD_LETTER_STREAM, {}).values())
+
+
+def test_a_batch_is_acked_once_the_api_stored_it(client):
+    events = [enqueue(client, 2, date(2026, 10, 1)), enqueue(client, 1, date(2026, 10, 1))]
+    stored = FakeAPI(["created", "duplicate"])
+
+    def api(request):
+        # Nothing is acked or dropped before the API answers
+        assert sum(len(client.pending(stream)) for stream in STREAMS) == 2
+        assert all(client.hashes[main.check_in_pending_key(user)] for user in (1, 2))
+        return stored(request)
+
+    # Startup replays this consumer's pending entries first: there are none yet
+    assert step(client, api, replaying=True) is False
+    assert step(client, api, replaying=False) is False
+    assert stored.batches == [[event["check_in"] for event in events]]
+    assert all(not client.pending(stream) and not client.streams[stream] for stream in STREAMS)
+    assert all(not client.hashes[main.check_in_pending_key(user)] for user in (1, 2))
+    assert dead_letters(client) == []
+
+
+def test_a_batch_the_api_could_not_store_stays_pending_and_is_retried(client):
+    event = enqueue(client, 1, date(2026, 10, 1))
+    api = FakeAPI(httpx.ConnectError("refused"), 503, ["created"])
+
+    assert step(client, api, replaying=False) is True
+    assert step(client, api, replaying=True) is True
+    assert client.pending(STREAMS[1])["1-0"]["times_delivered"] == 2
+    assert event["event_id"] in client.hashes[main.check_in_pending_key(1)]
+
+    # The replay stores it, and the next replay finds nothing left
+    assert step(client, api, replaying=True) is True
+    assert len(api.batches) == 3
+    assert not client.pending(STREAMS[1]) and not client.streams[STREAMS[1]]
+    assert not client.hashes[main.check_in_pending_key(1)]
+    assert step(client, api, replaying=True) is False
+    assert dead_letters(client) == []
+
+
+def test_events_past_the_max_deliveries_are_dead_lettered(client, monkeypatch):
+    monkeypatch.setattr(main, "CHECK_IN_MAX_DELIVERIES", 2)
+    event = enqueue(client, 1, date(2026, 10, 1))
+    api = FakeAPI(503)
+
+    assert step(client, api, replaying=False) is True
+    assert step(client, api, replaying=True) is True
+    # Third delivery: dead-lettered without another POST
+    assert step(client, api, replaying=True) is True
+    assert len(api.batches) == 2
+    [dead] = dead_letters(client)
+    assert dead["reason"] == "max_deliveries_exceeded"
+    assert (dead["source_stream"], dead["source_id"]) == (STREAMS[1], "1-0")
+    assert json.loads(dead["event"]) == event
+    assert not client.pending(STREAMS[1]) and not client.streams[STREAMS[1]]
+    assert not client.hashes[main.check_in_pending_key(1)]
+    assert step(client, api, replaying=True) is False
+
+
+def test_rejected_events_go_to_the_dead_letter_stream(client):
+    enqueue(client, 1, date(2026, 10, 1))
+    enqueue(client, 3, date(2026, 10, 1))
+    step(client, FakeAPI(["created", "habit_not_found"]), replaying=False)
+    assert [dead["reason"] for dead in dead_letters(client)] == ["habit_not_found"]
+
+    # A 4xx for the whole batch dead-letters every event in it
+    enqueue(client, 2, date(2026, 10, 1))
+    enqueue(client, 4, date(2026, 10, 1))
+    step(client, FakeAPI(422), replaying=False)
+    assert [dead["reason"] for dead in dead_letters(client)] == [
+        "habit_not_found",
+        "rejected_422",
+        "rejected_422",
+    ]
+    assert all(not client.pending(stream) for stream in STREAMS)
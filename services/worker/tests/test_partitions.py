@@ -0,0 +1,116 @@
+import os
+import uuid
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from app import main
+
+# Partition DDL is PostgreSQL only; point this at a scratch database
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+SCHEMA = f"partitions_{uuid.uuid4().hex[:8]}"
+
+pytestmark = pytest.mark.skipif(
+    not TEST_DATABASE_URL, reason="needs PostgreSQL in TEST_DATABASE_URL"
+)
+
+engine = (
+    create_engine(TEST_DATABASE_URL, connect_args={"options": f"-csearch_path={SCHEMA}"})
+    if TEST_DATABASE_URL
+    else None
+)
+
+# As migration 20261016_0008 leaves them, before any monthly partition exists
+TABLES = """
+CREATE TABLE check_ins (
+    id serial,
+    user_id integer NOT NULL,
+    habit_id integer NOT NULL,
+    check_in_date date NOT NULL,
+    created_at timestamp NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, check_in_date)
+) PARTITION BY RANGE (check_in_date);
+CREATE TABLE check_ins_default PARTITION OF check_ins DEFAULT;
+CREATE TABLE points_ledger (
+    id serial,
+    user_id integer NOT NULL,
+    points integer NOT NULL,
+    created_at timestamp NOT NULL,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+CREATE TABLE points_ledger_default PARTITION OF points_ledger DEFAULT;
+CREATE FUNCTION refuse_user_666() RETURNS trigger AS $$
+BEGIN
+    IF NEW.user_id = 666 THEN
+        RAISE EXCEPTION 'refused';
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+
+def setup_module():
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        conn.execute(text(TABLES))
+
+
+def teardown_module():
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+    engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def partition_engine(monkeypatch):
+    monkeypatch.setattr(main, "_engine", engine)
+    yield
+
+
+def rows(table):
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT user_id FROM {table} ORDER BY user_id")).scalars().all()
+
+
+def test_rows_in_the_default_partition_move_and_a_failing_month_does_not_block_the_rest():
+    this_month = datetime.utcnow().date().replace(day=1)
+    months = [this_month]
+    for _ in range(main.PARTITION_MONTHS_AHEAD):
+        months.append(main.next_month(months[-1]).date())
+    names = [f"check_ins_y{month:%Y}m{month:%m}" for month in months]
+
+    with engine.begin() as conn:
+        # Check-ins dated into months that had no partition yet
+        for user_id, month in ((1, months[2]), (666, months[1])):
+            conn.execute(
+                text("INSERT INTO check_ins (user_id, habit_id, check_in_date) VALUES (:u, 1, :d)"),
+                {"u": user_id, "d": month.replace(day=15)},
+            )
+        # Moving user 666's row back fails, so its month cannot be created yet
+        conn.execute(
+            text(
+                "CREATE TRIGGER refuse BEFORE INSERT ON check_ins "
+                "FOR EACH ROW EXECUTE FUNCTION refuse_user_666()"
+            )
+        )
+    assert rows("check_ins_default") == [1, 666]
+
+    result = main.maintain_partitions()
+    assert result["failed"] == [names[1]]
+    assert [name for name in result["created"] if name.startswith("check_ins")] == [
+        names[0],
+        names[2],
+        names[3],
+    ]
+    assert len([name for name in result["created"] if name.startswith("points_ledger")]) == 4
+    assert rows(names[2]) == [1]
+    assert rows("check_ins_default") == [666]
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP TRIGGER refuse ON check_ins"))
+    assert main.maintain_partitions() == {"created": [names[1]], "detached": [], "failed": []}
+    assert rows(names[1]) == [666]
+    assert rows("check_ins_default") == []
+    assert rows("check_ins") == [1, 666]
@@ -0,0 +1,51 @@
+import pytest
+
+from app import main
+
+
+class FakeRedis:
+    """Just enough of redis.Redis for queueing and following a rebuild job."""
+
+    def __init__(self):
+        self.hashes = {}
+        self.lists = {}
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        return []
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(mapping)
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def expire(self, key, seconds):
+        return True
+
+    def rpush(self, key, value):
+        self.lists.setdefault(key, []).append(value)
+
+    def lrem(self, key, count, value):
+        values = self.lists.get(key, [])
+        self.lists[key] = [item for item in values if item != value]
+        return len(values) - len(self.lists[key])
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = FakeRedis()
+    monkeypatch.setattr(main.redis.Redis, "from_url", lambda *args, **kwargs: client)
+    monkeypatch.setattr(main, "REBUILD_POLL_SECONDS", 0)
+    monkeypatch.setattr(main, "REBUILD_HEARTBEAT_TIMEOUT_SECONDS", 0)
+    return client
+
+
+def test_a_job_no_runner_picks_up_fails_and_leaves_the_queue(client):
+    with pytest.raises(RuntimeError, match="no maintenance runner picked up the job"):
+        main.rebuild_state()
+    assert client.lists[main.REBUILD_QUEUE_KEY] == []
+    [job] = client.hashes.values()
+    assert job["status"] == "failed"
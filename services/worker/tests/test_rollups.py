@@ -0,0 +1,177 @@
+import os
+import uuid
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from app import main
+
+# The rollup SQL is PostgreSQL only; point this at a scratch database, since
+# advisory locks are per database
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+SCHEMA = f"rollups_{uuid.uuid4().hex[:8]}"
+
+pytestmark = pytest.mark.skipif(
+    not TEST_DATABASE_URL, reason="needs PostgreSQL in TEST_DATABASE_URL"
+)
+
+engine = (
+    create_engine(TEST_DATABASE_URL, connect_args={"options": f"-csearch_path={SCHEMA}"})
+    if TEST_DATABASE_URL
+    else None
+)
+
+# Only the columns the rollup SQL reads; names match services/api/app/models.py
+TABLES = """
+CREATE TABLE habits (id integer PRIMARY KEY, program_id integer);
+CREATE TABLE check_ins (
+    id serial PRIMARY KEY,
+    user_id integer NOT NULL,
+    habit_id integer NOT NULL,
+    check_in_date date NOT NULL,
+    created_at timestamp NOT NULL
+);
+CREATE TABLE points_ledger (
+    id serial PRIMARY KEY,
+    user_id integer NOT NULL,
+    program_id integer,
+    points integer NOT NULL,
+    event_type varchar(50) NOT NULL,
+    event_reference_id integer,
+    created_at timestamp NOT NULL
+);
+CREATE TABLE daily_rollups (
+    program_id integer,
+    habit_id integer,
+    day date,
+    check_ins integer NOT NULL,
+    active_users integer NOT NULL,
+    points_awarded integer NOT NULL,
+    updated_at timestamp,
+    PRIMARY KEY (program_id, habit_id, day)
+);
+CREATE TABLE rollup_watermarks (
+    source varchar(64) PRIMARY KEY,
+    last_id integer NOT NULL,
+    updated_at timestamp
+);
+"""
+
+
+def setup_module():
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        conn.execute(text(TABLES))
+        conn.execute(text("INSERT INTO habits VALUES (1, 10), (2, 10)"))
+
+
+def teardown_module():
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+    engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def rollup_engine(monkeypatch):
+    monkeypatch.setattr(main, "_engine", engine)
+    yield
+
+
+def check_in(conn, user_id, habit_id, day, created_at, points=10):
+    check_in_id = conn.execute(
+        text(
+            "INSERT INTO check_ins (user_id, habit_id, check_in_date, created_at) "
+            "VALUES (:user_id, :habit_id, :day, :created_at) RETURNING id"
+        ),
+        {"user_id": user_id, "habit_id": habit_id, "day": day, "created_at": created_at},
+    ).scalar()
+    if points:
+        ledger(conn, user_id, points, created_at, event_type="check_in", reference=check_in_id)
+    return check_in_id
+
+
+def ledger(conn, user_id, points, created_at, event_type="bonus", reference=None, program_id=10):
+    return conn.execute(
+        text(
+            "INSERT INTO points_ledger "
+            "(user_id, program_id, points, event_type, event_reference_id, created_at) "
+            "VALUES (:user_id, :program_id, :points, :event_type, :reference, :created_at) "
+            "RETURNING id"
+        ),
+        {
+            "user_id": user_id,
+            "program_id": program_id,
+            "points": points,
+            "event_type": event_type,
+            "reference": reference,
+            "created_at": created_at,
+        },
+    ).scalar()
+
+
+def rollups():
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                "SELECT program_id, habit_id, day, check_ins, active_users, points_awarded "
+                "FROM daily_rollups"
+            )
+        )
+        return {(row[0], row[1], row[2]): tuple(row[3:]) for row in rows}
+
+
+def watermarks():
+    with engine.connect() as conn:
+        return dict(conn.execute(text("SELECT source, last_id FROM rollup_watermarks")).all())
+
+
+def test_refresh_backfills_then_follows_the_watermarks():
+    first, second, bonus_day = date(2026, 3, 1), date(2026, 3, 2), date(2026, 3, 5)
+    with engine.begin() as conn:
+        check_in(conn, 1, 1, first, datetime(2026, 3, 1, 8))
+        check_in(conn, 2, 1, first, datetime(2026, 3, 1, 9))
+        check_in(conn, 1, 2, second, datetime(2026, 3, 2, 8))
+        # A ledger-only day: no check-ins, points without a program included
+        ledger(conn, 3, 50, datetime(2026, 3, 5, 12))
+        last_ledger_id = ledger(conn, 3, 5, datetime(2026, 3, 5, 13), program_id=None)
+
+    # First run: no watermarks yet, so every day with data is backfilled
+    assert main.refresh_daily_rollups() == {"days": 3, "rows": 8}
+    assert rollups()[(10, 1, first)] == (2, 2, 20)
+    assert rollups()[(0, 0, first)] == (2, 2, 20)
+    assert rollups()[(10, 2, second)] == (1, 1, 10)
+    assert rollups()[(10, 0, bonus_day)] == (0, 0, 50)
+    assert rollups()[(0, 0, bonus_day)] == (0, 0, 55)
+    assert (10, 1, bonus_day) not in rollups()
+    assert watermarks() == {"check_ins": 3, "points_ledger": last_ledger_id}
+
+    # Nothing new: the watermarks stay and no day is touched
+    assert main.refresh_daily_rollups() == {"days": 0, "rows": 0}
+
+    settled = datetime.utcnow() - timedelta(seconds=main.ROLLUP_SETTLE_SECONDS + 60)
+    with engine.begin() as conn:
+        # A check-in back-dated to an already rolled up day
+        late_id = check_in(conn, 3, 1, first, settled)
+        # Rows this young may sit behind transactions still open, so they wait
+        check_in(conn, 4, 2, second, datetime.utcnow(), points=0)
+
+    assert main.refresh_daily_rollups() == {"days": 2, "rows": 6}
+    assert rollups()[(10, 1, first)] == (3, 3, 20)
+    assert rollups()[(0, 0, first)] == (3, 3, 20)
+    # Its points count on the day they were awarded
+    assert rollups()[(10, 1, settled.date())] == (0, 0, 10)
+    assert rollups()[(10, 2, second)] == (1, 1, 10)
+    assert watermarks() == {"check_ins": late_id, "points_ledger": last_ledger_id + 1}
+
+
+def test_refresh_skips_while_another_run_holds_the_lock():
+    with engine.connect() as other:
+        other.execute(text("SELECT pg_advisory_lock(:key)"), {"key": main.ROLLUP_LOCK_KEY})
+        other.commit()
+        try:
+            assert main.refresh_daily_rollups() == {"skipped": True}
+        finally:
+            other.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": main.ROLLUP_LOCK_KEY})
+            other.commit()
+    assert "skipped" not in main.refresh_daily_rollups()